@@ -0,0 +1,114 @@
+# Resolve street addresses (from the package file, address corrections or typed in) to rows of the distance table
+# Addresses are canonicalized before they are looked up: case, whitespace and periods/commas are ignored, and directions and street words are
+# abbreviated ("South" -> "s", "Street" -> "st"), so "410 South State Street" and "410 S State St" are the same key in one dictionary.
+# Anything still missing falls back to a trigram index for near misses (typos, a dropped "St"), as long as the house number matches exactly.
+# Resolved addresses are memoized, and an address that can't be resolved raises AddressNotFound instead of quietly becoming 0.0 miles.
+
+# Words replaced by their usual abbreviation before lookup
+ABBREVIATIONS = {
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "street": "st", "avenue": "ave", "av": "ave", "boulevard": "blvd", "road": "rd", "drive": "dr", "lane": "ln",
+    "court": "ct", "circle": "cir", "place": "pl", "parkway": "pkwy", "highway": "hwy", "station": "sta", "suite": "ste",
+}
+
+MIN_SIMILARITY = 0.6 # Trigram similarity (0-1) a near miss needs to be accepted
+
+class AddressNotFound(KeyError):
+    # An address that matches no row of the distance table, raised instead of treating its distances as 0.0
+    # A KeyError so existing "except KeyError" lookups still catch it, with the plain message instead of KeyError's quoted repr
+    def __str__(self):
+        return self.args[0]
+
+def canonical_address(address):
+    # Lower case, no periods/commas, single spaces and abbreviated directions and street words
+    words = address.lower().replace(".", " ").replace(",", " ").split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+def trigrams(text):
+    # Set of 3-character pieces of text, padded so the first and last letters count too
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def house_number(canonical):
+    # First word when it is a number ("410 s state st" -> "410"), None otherwise
+    first = canonical.split(" ", 1)[0]
+    return first if first.isdigit() else None
+
+class AddressIndex:
+    def __init__(self, addresses, min_similarity = MIN_SIMILARITY):
+        '''
+        Initialize an AddressIndex with these parameters:
+        addresses: street addresses in distance table order (index = row of the distance table), see DistanceTable.addresses
+        min_similarity: lowest trigram similarity accepted for a near miss
+        '''
+        self.addresses = list(addresses)
+        self.min_similarity = min_similarity
+        self.canonical = {} # canonical address -> index
+        self.trigram_index = {} # trigram -> indexes of the addresses containing it
+        self.trigram_counts = []
+        self.house_numbers = []
+        for index, address in enumerate(self.addresses):
+            key = canonical_address(address)
+            self.canonical.setdefault(key, index)
+            grams = trigrams(key)
+            for gram in grams:
+                self.trigram_index.setdefault(gram, []).append(index)
+            self.trigram_counts.append(len(grams))
+            self.house_numbers.append(house_number(key))
+        self.resolved = {} # address exactly as asked for -> index, so repeated lookups are one dictionary hit
+
+    def resolve(self, address):
+        # Index of the address in the distance table, raises AddressNotFound when there is no exact or close enough match
+        index = self.resolved.get(address)
+        if index is not None:
+            return index
+        key = canonical_address(address)
+        index = self.canonical.get(key)
+        if index is None:
+            index = self._closest(address, key)
+        self.resolved[address] = index
+        return index
+
+    def _closest(self, address, key):
+        # Near-miss lookup: the address with the same house number sharing the most trigrams (Jaccard similarity)
+        grams = trigrams(key)
+        shared = {}
+        for gram in grams:
+            for index in self.trigram_index.get(gram, ()):
+                shared[index] = shared.get(index, 0) + 1
+        scored = sorted(((count / (len(grams) + self.trigram_counts[index] - count), index) for index, count in shared.items()), reverse = True)
+        number = house_number(key)
+        if number is not None:
+            scored = [(similarity, index) for similarity, index in scored if self.house_numbers[index] == number]
+        if not scored:
+            raise AddressNotFound(f"Address not found: '{address}'")
+        similarity, index = scored[0]
+        if similarity < self.min_similarity:
+            raise AddressNotFound(f"Address not found: '{address}' (closest is '{self.addresses[index]}')")
+        if len(scored) > 1 and scored[1][0] == similarity:
+            raise AddressNotFound(f"Address is ambiguous: '{address}' matches '{self.addresses[index]}' and '{self.addresses[scored[1][1]]}'")
+        return index
+
+    def resolve_packages(self, packages):
+        '''
+        Resolve every package's address once and remember it on the package (package.address_index).
+        Raises AddressNotFound listing every package that couldn't be resolved, so a bad manifest fails at load time instead of mid-route.
+        '''
+        missing = []
+        for package in packages:
+            try:
+                package.address_index = self.resolve(package.address)
+            except AddressNotFound as error:
+                missing.append(f"package {package.package_id}: {error}")
+        if missing:
+            raise AddressNotFound(f"{len(missing)} package address(es) not found, " + "; ".join(missing))
+
+def package_address_index(package, distance_table, address_of = None):
+    '''
+    Distance table index of a package's delivery address.
+    The index resolved at load time (package.address_index) is used unless address_of (e.g. SimulationState.address_of) gives a corrected address.
+    '''
+    address = address_of(package) if address_of else package.address
+    if package.address_index is not None and address == package.address:
+        return package.address_index
+    return distance_table.index_of(address)
@@ -0,0 +1,216 @@
+# Benchmarks for the loading, lookup, routing and status query hot paths
+# Generates synthetic WGUPS-shaped days (same CSV formats as the real files) at several sizes, times each phase and reports ops/sec and peak memory as JSON.
+# Phases are named after what they time. Loading and the hash table/store are timed on their own, everything from get_distance on runs
+# through main.py itself (get_distance, load_trucks, deliver_packages, package_status, status_records) on an AppContext built from the
+# synthetic files, with the bench's fleet in place of the three WGUPS trucks.
+#
+# Usage: python bench.py --sizes 100,500,1000 --packages-per-address 2 --trucks 6 --output bench.json
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import loader
+import main as wgups
+import snapshot
+from hash_table import HashTable
+from distances import shortest_path_closure
+from constraints import HUB_ADDRESS
+from dispatcher import dispatch, MAX_MOVES
+from simulator import EventSimulator, TRIP_MOVES
+from package import parse_deadline
+from timeline import Timeline
+from journal import JournalWriter, replay
+
+DEADLINES = ["9:00 AM", "10:30 AM", "12:00 PM"]
+
+def generate_day(directory, address_count, package_count, truck_count, seed = 0):
+    '''
+    Write a synthetic day into directory and return the three file paths (package file, address file, distance file).
+    Addresses are random points in a 20 x 20 mile square, so the distances form a metric (rounded to 0.1 mile like the real table).
+    About 20% of packages get a timed deadline, and a few get each kind of special note.
+    '''
+    rng = random.Random(seed)
+    points = [(10.0, 10.0)] + [(rng.uniform(0, 20), rng.uniform(0, 20)) for _ in range(address_count - 1)]
+    addresses = [HUB_ADDRESS] + [f"{index * 10} W {index % 97 * 100} S" for index in range(1, address_count)]
+
+    address_file = os.path.join(directory, "addresses.csv")
+    with open(address_file, 'w', encoding = 'utf-8') as out_file:
+        for index, address in enumerate(addresses):
+            out_file.write(f"{index},Location {index},{address}\n")
+
+    # Lower-triangular rows with the empty cells past the diagonal, same as wgups_distance_table.csv
+    distance_file = os.path.join(directory, "distances.csv")
+    with open(distance_file, 'w', encoding = 'utf-8') as out_file:
+        for i, (x1, y1) in enumerate(points):
+            cells = [f"{math.hypot(x1 - x2, y1 - y2):.1f}" for x2, y2 in points[:i]] + ["0.0"] + [""] * (address_count - i - 1)
+            out_file.write(",".join(cells) + "\n")
+
+    package_file = os.path.join(directory, "packages.csv")
+    grouped = set()
+    with open(package_file, 'w', encoding = 'utf-8') as out_file:
+        out_file.write('"Package\nID",Address,City ,State,Zip,"Delivery\nDeadline","Weight\nKILO",page 1 of 1PageSpecial Notes, , , , \n')
+        for package_id in range(1, package_count + 1):
+            address = addresses[rng.randrange(1, address_count)]
+            deadline = rng.choice(DEADLINES) if rng.random() < 0.2 else "EOD"
+            roll = rng.random()
+            notes = ""
+            if roll < 0.03 and truck_count > 1:
+                notes = f"Can only be on truck {rng.randint(1, truck_count)}"
+            elif roll < 0.06:
+                notes = "Delayed on flight---will not arrive to depot until 9:05 am"
+                deadline = "EOD"
+            elif roll < 0.08 and package_id > 2 and package_id not in grouped:
+                partners = [other for other in (package_id - 1, package_id - 2) if other not in grouped]
+                if partners:
+                    grouped.update(partners + [package_id])
+                    notes = '"Must be delivered with ' + ", ".join(str(other) for other in partners) + '"'
+            out_file.write(f"{package_id},{address},Salt Lake City,UT,{84100 + package_id % 30},{deadline},{rng.randint(1, 90)},{notes},,,,\n")
+    return package_file, address_file, distance_file
+
+def measure(function):
+    # Run function once for timing, then again under tracemalloc for peak memory. function returns the number of operations it did.
+    start = time.perf_counter()
+    operations = function()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds": round(seconds, 6),
+        "ops": operations,
+        "ops_per_sec": round(operations / seconds, 1) if seconds > 0 else None,
+        "peak_bytes": peak_bytes,
+    }
+
+def run_size(address_count, package_count, truck_count, query_count, seed = 0, closure_limit = 400, route_moves = MAX_MOVES, trip_moves = TRIP_MOVES):
+    # Benchmark every phase on one synthetic day, returns a dict of results. The shortest-path closure is only timed up to closure_limit addresses.
+    rng = random.Random(seed)
+    results = {"addresses": address_count, "packages": package_count, "trucks": truck_count, "phases": {}}
+    phases = results["phases"]
+    with tempfile.TemporaryDirectory() as directory:
+        package_file, address_file, distance_file = generate_day(directory, address_count, package_count, truck_count, seed)
+        cache_dir = os.path.join(directory, "cache")
+
+        # The load phases use the raw table, the closure is timed on its own below
+        phases["load_csv"] = measure(lambda: len(list(loader.iter_packages(package_file)))
+                                     + loader.load_distance_table(address_file, distance_file, closure = False).size)
+        snapshot.load_day(package_file, address_file, distance_file, cache_dir, closure = False) # Write the snapshot
+        phases["load_snapshot"] = measure(lambda: len(snapshot.load_day(package_file, address_file, distance_file, cache_dir, closure = False)[0]))
+        packages, distance_table = snapshot.load_day(package_file, address_file, distance_file, cache_dir, closure = False)
+        if address_count <= closure_limit:
+            phases["shortest_paths"] = measure(lambda: len(shortest_path_closure(distance_table.matrix, distance_table.size)[0]))
+
+        def hash_add():
+            table = HashTable()
+            for package in packages:
+                table.add(package.package_id, package)
+            return len(packages)
+        package_table = HashTable()
+        for package in packages:
+            package_table.add(package.package_id, package)
+        lookup_ids = [rng.randint(1, package_count) for _ in range(query_count)]
+        phases["hash_add"] = measure(hash_add)
+        phases["hash_get"] = measure(lambda: sum(1 for package_id in lookup_ids if package_table.get(package_id) is not None))
+
+        # The same packages in the columnar store, and a bulk deadline scan over it
+        package_store = loader.load_package_store(package_file)
+        phases["store_load"] = measure(lambda: len(loader.load_package_store(package_file)))
+        phases["store_due_before"] = measure(lambda: len(package_store.due_before(parse_deadline("10:30 AM"))))
+
+        # main.py's own day on the synthetic files: the bench's trucks with one driver each, room for the whole day on them, no address corrections
+        fleet = [wgups.Truck(truck_id, None, []) for truck_id in range(1, truck_count + 1)]
+        context = wgups.AppContext((package_file, address_file, distance_file), fleet = fleet, capacity = math.ceil(package_count / truck_count * 1.5),
+                                  driver_count = truck_count, address_corrections = {}).load()
+
+        pairs = [(rng.choice(distance_table.addresses), rng.choice(distance_table.addresses)) for _ in range(query_count)]
+        phases["get_distance"] = measure(lambda: len([wgups.get_distance(first, second, context) for first, second in pairs]))
+
+        def load_trucks():
+            wgups.load_trucks(context.day_packages, context)
+            return package_count
+        phases["load_trucks"] = measure(load_trucks)
+
+        # The loaded trucks again through dispatcher.dispatch, the parallel planner (one worker here so the timing is comparable)
+        trucks = [wgups.Truck(truck.truck_id, context.truck_departures[truck.truck_id], list(context.truck_loads[truck.truck_id])) for truck in fleet]
+        def route():
+            plans = dispatch(trucks, context.package_hash, context.distance_table, HUB_ADDRESS, max_moves = route_moves, max_workers = 1)
+            return sum(len(plan.stops) for plan in plans)
+        phases["dispatch_routes"] = measure(route)
+
+        # The whole day through main.deliver_packages, recorded the way get_day_timeline does it
+        timeline = Timeline()
+        def deliver():
+            timeline.__init__()
+            wgups.record_day(timeline, context)
+            return len(timeline.events)
+        phases["deliver_packages"] = measure(deliver)
+
+        # Whole day on the event-driven engine, one driver per truck and trucks reloading at the hub
+        simulator = EventSimulator(packages, context.package_constraints, distance_table, HUB_ADDRESS, truck_count = truck_count, driver_count = truck_count,
+                                   max_moves = trip_moves, address_corrections = {})
+        phases["event_simulation"] = measure(lambda: simulator.run().events_processed)
+
+        base = datetime.strptime("08:00:00", "%H:%M:%S")
+        queries = [(context.package_hash.get(rng.randint(1, package_count)), base + timedelta(minutes = rng.randrange(0, 600))) for _ in range(query_count)]
+        def package_status():
+            for package, check_time in queries:
+                wgups.package_status(package, check_time, timeline, context)
+            return len(queries)
+        phases["package_status"] = measure(package_status)
+
+        # The query command's bulk path: every package at ten times through the day
+        check_times = [base + timedelta(minutes = 60 * hour) for hour in range(10)]
+        package_ids = list(range(1, package_count + 1))
+        phases["status_records"] = measure(lambda: sum(1 for record in wgups.status_records(check_times, package_ids, timeline, context)))
+
+        # The same day written to a delivery journal event by event (batched fsyncs) and replayed from it
+        journal_file = os.path.join(directory, "day.journal")
+        def journal_append():
+            if os.path.exists(journal_file):
+                os.remove(journal_file)
+            with JournalWriter(journal_file, checkpoint_every = 0) as writer:
+                for package_id, (truck_id, departure_time) in timeline.departures.items():
+                    writer.assign(package_id, truck_id, departure_time)
+                for event in timeline.events:
+                    writer.record(event)
+                return writer.count
+        phases["journal_append"] = measure(journal_append)
+        phases["journal_replay"] = measure(lambda: replay(journal_file, use_checkpoint = False).records)
+        results["total_miles"] = round(timeline.total_miles_at(wgups.time_of(24 * 60)), 1)
+    return results
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark WGUPS loading, lookup, routing and status queries on synthetic days")
+    parser.add_argument("--sizes", default = "50,200,1000", help = "comma-separated address counts")
+    parser.add_argument("--packages-per-address", type = float, default = 2.0)
+    parser.add_argument("--trucks", type = int, default = 3)
+    parser.add_argument("--trip-moves", type = int, default = TRIP_MOVES, help = "improving moves per trip route in event_simulation")
+    parser.add_argument("--route-moves", type = int, default = MAX_MOVES, help = "improving moves per truck route in dispatch_routes")
+    parser.add_argument("--queries", type = int, default = 10000, help = "lookups per lookup/query phase")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--closure-limit", type = int, default = 400, help = "only time the shortest-path closure up to this many addresses")
+    parser.add_argument("--output", help = "write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {"python": sys.version.split()[0], "runs": []}
+    for size in (int(size) for size in args.sizes.split(",")):
+        package_count = max(1, int(size * args.packages_per_address))
+        report["runs"].append(run_size(size, package_count, args.trucks, args.queries, args.seed, args.closure_limit, args.route_moves, args.trip_moves))
+
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf-8') as out_file:
+            out_file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
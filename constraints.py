@@ -0,0 +1,202 @@
+# Delivery constraints parsed from the package file's special notes, and automatic truck loading that respects them
+#
+# Supported notes (case-insensitive):
+# "Can only be on truck 2" -> truck restriction
+# "Delayed on flight---will not arrive to depot until 9:05 am" -> not ready until 9:05
+# "Must be delivered with 15, 19" -> same truck as packages 15 and 19
+# "Wrong address listed" (optionally "... until 10:20 am") -> can't leave the hub until the address is corrected
+
+import re
+from package import EOD_MINUTES, parse_deadline
+from addresses import package_address_index
+
+TRUCK_CAPACITY = 16 # WGUPS trucks hold 16 packages
+
+# Hub address as written in wgups_address_file.csv, where every truck loads and returns
+HUB_ADDRESS = "4001 South 700 East"
+
+# Address corrections that WGUPS receives during the day: package ID -> (time of correction in minutes since midnight, address, city, state, zip)
+ADDRESS_CORRECTIONS = {
+    9: (parse_deadline("10:20 AM"), "410 S State St", "Salt Lake City", "UT", "84111"),
+}
+
+TRUCK_PATTERN = re.compile(r"only be on truck\s*(\d+)", re.IGNORECASE)
+DELAYED_PATTERN = re.compile(r"until\s+(\d{1,2}:\d{2}\s*(?:[ap]\.?m\.?)?)", re.IGNORECASE)
+WITH_PATTERN = re.compile(r"delivered with\s+([\d,\s]+(?:and\s+\d+)?)", re.IGNORECASE)
+WRONG_ADDRESS_PATTERN = re.compile(r"wrong address", re.IGNORECASE)
+
+class PackageConstraints:
+    def __init__(self, package_id):
+        '''
+        Constraints for one package:
+        truck_id: the only truck the package may go on (None = any truck)
+        ready_minutes: earliest time the package can leave the hub (minutes since midnight, None = at start of day)
+        deliver_with: package IDs that must be on the same truck
+        wrong_address: True if the listed address is wrong
+        address_fix_minutes: time the address is corrected (None = unknown)
+        '''
+        self.package_id = package_id
+        self.truck_id = None
+        self.ready_minutes = None
+        self.deliver_with = set()
+        self.wrong_address = False
+        self.address_fix_minutes = None
+
+    def available_minutes(self):
+        # Earliest time the package can be loaded: after it arrives and after its address is fixed
+        times = [minutes for minutes in (self.ready_minutes, self.address_fix_minutes) if minutes is not None]
+        if self.wrong_address and self.address_fix_minutes is None:
+            return None # Can't be delivered until someone supplies the address
+        return max(times) if times else 0
+
+def day_constraints(packages, address_corrections = ADDRESS_CORRECTIONS):
+    # package_id -> PackageConstraints from the special notes, with the known address corrections applied (a wrong address is fixed at the correction time)
+    constraints = {}
+    for package in packages:
+        package_constraints = parse_special_notes(package)
+        if package.package_id in address_corrections:
+            package_constraints.wrong_address = True
+            package_constraints.address_fix_minutes = address_corrections[package.package_id][0]
+        constraints[package.package_id] = package_constraints
+    return constraints
+
+def _parse_time(text):
+    text = text.replace(".", "").strip()
+    return parse_deadline(text)
+
+def parse_special_notes(package):
+    # Build the PackageConstraints for a package from its special_notes text
+    constraints = PackageConstraints(package.package_id)
+    notes = package.special_notes or ""
+
+    match = TRUCK_PATTERN.search(notes)
+    if match:
+        constraints.truck_id = int(match.group(1))
+
+    match = WITH_PATTERN.search(notes)
+    if match:
+        constraints.deliver_with = {int(number) for number in re.findall(r"\d+", match.group(1))}
+
+    if WRONG_ADDRESS_PATTERN.search(notes):
+        constraints.wrong_address = True
+        match = DELAYED_PATTERN.search(notes)
+        if match:
+            constraints.address_fix_minutes = _parse_time(match.group(1))
+    else:
+        match = DELAYED_PATTERN.search(notes)
+        if match:
+            constraints.ready_minutes = _parse_time(match.group(1))
+    return constraints
+
+class UnionFind:
+    # Disjoint sets over package IDs, used to merge "must be delivered with" chains into one group
+    def __init__(self):
+        self.parent = {}
+        self.rank = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.find(parent)
+            self.parent[item] = parent # Path compression
+        return parent
+
+    def union(self, first, second):
+        root1, root2 = self.find(first), self.find(second)
+        if root1 == root2:
+            return
+        rank1, rank2 = self.rank.get(root1, 0), self.rank.get(root2, 0)
+        if rank1 < rank2:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        if rank1 == rank2:
+            self.rank[root1] = rank1 + 1
+
+class LoadGroup:
+    # Packages that must travel together, with their combined constraints
+    def __init__(self, package_ids):
+        self.package_ids = package_ids
+        self.truck_id = None
+        self.available_minutes = 0
+        self.deadline_minutes = EOD_MINUTES
+        self.address_indexes = []
+
+def build_groups(packages, constraints):
+    '''
+    Merge packages into LoadGroups with union-find over their deliver_with lists.
+    A group's truck restriction is shared by all members (conflicting restrictions raise ValueError), it becomes available when its last member does and its deadline is its earliest member's.
+    '''
+    union_find = UnionFind()
+    for package in packages:
+        union_find.find(package.package_id)
+        for other_id in constraints[package.package_id].deliver_with:
+            union_find.union(package.package_id, other_id)
+
+    members = {}
+    for package in packages:
+        members.setdefault(union_find.find(package.package_id), []).append(package)
+
+    groups = []
+    for group_packages in members.values():
+        group = LoadGroup(sorted(package.package_id for package in group_packages))
+        for package in group_packages:
+            package_constraints = constraints[package.package_id]
+            if package_constraints.truck_id is not None:
+                if group.truck_id is not None and group.truck_id != package_constraints.truck_id:
+                    raise ValueError(f"Packages {group.package_ids} must share a truck but are restricted to trucks {group.truck_id} and {package_constraints.truck_id}")
+                group.truck_id = package_constraints.truck_id
+            available = package_constraints.available_minutes()
+            if available is None:
+                raise ValueError(f"Package {package.package_id} has a wrong address and no correction time")
+            group.available_minutes = max(group.available_minutes, available)
+            group.deadline_minutes = min(group.deadline_minutes, package.deadline_minutes)
+        groups.append(group)
+    return groups
+
+def assign_trucks(packages, constraints, trucks, distance_table, hub_address, capacity = TRUCK_CAPACITY):
+    '''
+    Assign every package to a truck.
+    packages: Package objects for the day
+    constraints: package_id -> PackageConstraints (see parse_special_notes)
+    trucks: list of (truck_id, departure minutes)
+    Returns truck_id -> list of package IDs.
+
+    Groups with a timed deadline are loaded first, on the earliest-departing truck that may carry them, is leaving after they are ready and has room.
+    EOD groups then go to the allowed truck whose already-loaded stops are closest to them, so each truck covers one part of town.
+    Raises ValueError if a group fits on no truck.
+    '''
+    groups = build_groups(packages, constraints)
+    packages_by_id = {package.package_id: package for package in packages}
+    hub_index = distance_table.index_of(hub_address)
+    for group in groups:
+        group.address_indexes = sorted({package_address_index(packages_by_id[package_id], distance_table) for package_id in group.package_ids})
+
+    loads = {truck_id: [] for truck_id, departure in trucks}
+    stops = {truck_id: {hub_index} for truck_id, departure in trucks} # Addresses already on each truck
+    departures = dict(trucks)
+
+    def allowed(group, truck_id):
+        return ((group.truck_id is None or group.truck_id == truck_id)
+                and departures[truck_id] >= group.available_minutes
+                and len(loads[truck_id]) + len(group.package_ids) <= capacity)
+
+    def closeness(group, truck_id):
+        # Distance from the group's nearest address to the nearest address already on the truck
+        return min(min(distance_table.distances_from(address_index, stops[truck_id])) for address_index in group.address_indexes)
+
+    # Most constrained groups first: timed deadlines by deadline, then restricted/large/late-ready groups
+    groups.sort(key = lambda group: (group.deadline_minutes, group.truck_id is None, -len(group.package_ids), -group.available_minutes, group.package_ids[0]))
+    for group in groups:
+        candidates = [truck_id for truck_id, departure in trucks if allowed(group, truck_id)]
+        if not candidates:
+            raise ValueError(f"No truck can carry packages {group.package_ids} (truck {group.truck_id}, ready at {group.available_minutes} min, capacity {capacity})")
+        if group.deadline_minutes < EOD_MINUTES:
+            truck_id = min(candidates, key = lambda truck_id: (departures[truck_id], closeness(group, truck_id)))
+        else:
+            truck_id = min(candidates, key = lambda truck_id: (closeness(group, truck_id), len(loads[truck_id])))
+        loads[truck_id].extend(group.package_ids)
+        stops[truck_id].update(group.address_indexes)
+
+    for truck_id in loads:
+        loads[truck_id].sort()
+    return loads
@@ -0,0 +1,111 @@
+# Create class DeadlineIndex to answer "what's due next" questions without re-sorting the whole manifest
+# Items (package IDs, or stops in the router) are bucketed by deadline (minutes since midnight). Deadlines take few distinct values (9:00, 10:30, EOD...),
+# so the sorted list of bucket keys stays tiny and the earliest open deadline is found by skipping empty buckets at the front.
+# Each truck also gets a heap of (deadline, item) with lazy deletion for its own earliest deadline.
+
+import heapq
+from bisect import bisect_left, bisect_right, insort
+
+class DeadlineIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Remove every item
+        self.buckets = {} # deadline -> set of items still open
+        self.deadlines = [] # sorted bucket keys
+        self.first = 0 # position in self.deadlines of the first bucket that may be non-empty
+        self.item_deadline = {} # item -> deadline
+        self.item_truck = {} # item -> truck_id
+        self.truck_items = {} # truck_id -> set of open items
+        self.truck_heaps = {} # truck_id -> heap of (deadline, item), stale entries skipped on read
+
+    def __len__(self):
+        return len(self.item_deadline)
+
+    def __contains__(self, item):
+        return item in self.item_deadline
+
+    def add(self, item, deadline_minutes, truck_id = None):
+        # Add an open item (a re-add moves it to its new deadline/truck)
+        if item in self.item_deadline:
+            self.remove(item)
+        bucket = self.buckets.get(deadline_minutes)
+        if bucket is None:
+            bucket = self.buckets[deadline_minutes] = set()
+            insort(self.deadlines, deadline_minutes)
+        position = bisect_left(self.deadlines, deadline_minutes)
+        if position < self.first:
+            self.first = position
+        bucket.add(item)
+        self.item_deadline[item] = deadline_minutes
+        if truck_id is not None:
+            self.assign(item, truck_id)
+
+    def assign(self, item, truck_id):
+        # Put an open item on a truck
+        previous = self.item_truck.get(item)
+        if previous is not None:
+            self.truck_items[previous].discard(item)
+        self.item_truck[item] = truck_id
+        self.truck_items.setdefault(truck_id, set()).add(item)
+        heapq.heappush(self.truck_heaps.setdefault(truck_id, []), (self.item_deadline[item], item))
+
+    def remove(self, item):
+        # Close an item (delivered or cancelled), returns False if it wasn't open
+        deadline = self.item_deadline.pop(item, None)
+        if deadline is None:
+            return False
+        self.buckets[deadline].discard(item)
+        truck_id = self.item_truck.pop(item, None)
+        if truck_id is not None:
+            self.truck_items[truck_id].discard(item)
+        return True
+
+    def _first_open_position(self):
+        # Skip empty buckets at the front, they stay skipped until something earlier is added
+        while self.first < len(self.deadlines) and not self.buckets[self.deadlines[self.first]]:
+            self.first += 1
+        return self.first
+
+    def next_deadline(self):
+        # Earliest deadline that still has open items, None if everything is closed
+        position = self._first_open_position()
+        return self.deadlines[position] if position < len(self.deadlines) else None
+
+    def next_due(self):
+        # Open items sharing the earliest deadline (a set, don't modify it)
+        deadline = self.next_deadline()
+        return self.buckets[deadline] if deadline is not None else set()
+
+    def due_before(self, minutes, inclusive = False):
+        # Open items with a deadline before `minutes` (at or before if inclusive), earliest deadline first
+        end = bisect_right(self.deadlines, minutes) if inclusive else bisect_left(self.deadlines, minutes)
+        due = []
+        for position in range(self._first_open_position(), end):
+            due.extend(sorted(self.buckets[self.deadlines[position]]))
+        return due
+
+    def truck_next_due(self, truck_id):
+        # (deadline, item) for the earliest open item on a truck, None if the truck has nothing open
+        heap = self.truck_heaps.get(truck_id)
+        while heap:
+            deadline, item = heap[0]
+            if self.item_deadline.get(item) == deadline and self.item_truck.get(item) == truck_id:
+                return deadline, item
+            heapq.heappop(heap) # Delivered, moved or re-deadlined since it was pushed
+        return None
+
+    def earliest_slack(self, truck_id, now_minutes, arrivals = None):
+        '''
+        Minutes of slack for the tightest open item on a truck.
+        Without arrivals this is the truck's earliest deadline minus now_minutes.
+        With arrivals (item -> planned arrival minutes) it is the smallest deadline minus arrival over the truck's open items.
+        Returns None if the truck has nothing open.
+        '''
+        if arrivals is None:
+            next_due = self.truck_next_due(truck_id)
+            return next_due[0] - now_minutes if next_due else None
+        item_deadline = self.item_deadline
+        slacks = [item_deadline[item] - arrivals.get(item, now_minutes) for item in self.truck_items.get(truck_id, ())]
+        return min(slacks) if slacks else None
@@ -0,0 +1,113 @@
+# Plan and time the routes of a whole fleet in parallel
+# Each truck's route is independent once its packages are loaded, so trucks are spread over a ProcessPoolExecutor.
+# The distance matrix is copied once into shared memory, workers attach to it by name instead of receiving a pickled copy per task.
+# Each route's local search is capped by a number of improving moves (MAX_MOVES), not by seconds, so the merged plans are the same
+# whatever the worker count or machine load.
+# Only bench.py uses this, for large synthetic fleets. main.py plans the three WGUPS trucks in-process (a few milliseconds per truck),
+# where starting a process pool would cost more than it saves.
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from distances import DistanceTable
+from routing import Stop, build_stops, plan_stops, drive_route, minutes_of, TRUCK_SPEED_MPH, MAX_MOVES
+
+class TruckPlan:
+    def __init__(self, truck_id, stops, arrivals, miles, total_miles, finish_minutes):
+        '''
+        Result of planning one truck:
+        truck_id: truck the plan belongs to
+        stops: Stops in delivery order
+        arrivals: arrival time at each stop (minutes since midnight)
+        miles: truck's cumulative miles at each stop
+        total_miles: miles for the whole trip including the drive back to the hub
+        finish_minutes: time the truck is back at the hub
+        '''
+        self.truck_id = truck_id
+        self.stops = stops
+        self.arrivals = arrivals
+        self.miles = miles
+        self.total_miles = total_miles
+        self.finish_minutes = finish_minutes
+
+class SharedDistanceMatrix:
+    # Copy of a DistanceTable's matrix and nearest-neighbor lists in a named shared memory block, use as a context manager so the block is always unlinked
+    # Layout: size*size doubles, then size*neighbor_count ints
+    def __init__(self, distance_table):
+        self.size = distance_table.size
+        self.addresses = distance_table.addresses
+        self.neighbor_count = distance_table.neighbor_count
+        neighbors = memoryview(distance_table.build_neighbors()).cast('B')
+        matrix_bytes = 8 * self.size * self.size
+        self.memory = shared_memory.SharedMemory(create = True, size = max(matrix_bytes + len(neighbors), 1))
+        self.memory.buf[:matrix_bytes] = memoryview(distance_table.matrix).cast('B')
+        self.memory.buf[matrix_bytes:matrix_bytes + len(neighbors)] = neighbors
+
+    def attach_args(self):
+        # Arguments for shared_table() in a worker process
+        return self.memory.name, self.size, self.addresses, self.neighbor_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+# Worker process state, set once per worker by _attach_worker
+_worker_memory = None
+_worker_table = None
+
+def shared_table(memory_name, size, addresses, neighbor_count):
+    # Attach to a SharedDistanceMatrix block and wrap it in a read-only DistanceTable, returns (memory, table). Keep the memory open while the table is used.
+    memory = shared_memory.SharedMemory(name = memory_name)
+    matrix_bytes = 8 * size * size
+    matrix = memory.buf[:matrix_bytes].cast('d')
+    neighbors = memory.buf[matrix_bytes:matrix_bytes + 4 * size * neighbor_count].cast('i')
+    return memory, DistanceTable(addresses, matrix = matrix, neighbors = neighbors, neighbor_count = neighbor_count)
+
+def _attach_worker(memory_name, size, addresses, neighbor_count):
+    # Pool initializer: attach to the shared matrix and neighbor lists
+    global _worker_memory, _worker_table
+    _worker_memory, _worker_table = shared_table(memory_name, size, addresses, neighbor_count)
+
+def _plan_truck(task, distance_table = None):
+    # Plan and time one truck. task = (truck_id, [(address_index, package_ids, deadline_minutes)], start_index, start_minutes, end_index, speed_mph, time_budget, max_moves)
+    truck_id, stop_records, start_index, start_minutes, end_index, speed_mph, time_budget, max_moves = task
+    table = distance_table or _worker_table
+    stops = [Stop(address_index, list(package_ids), deadline) for address_index, package_ids, deadline in stop_records]
+    ordered = plan_stops(stops, table, start_index, start_minutes, end_index, speed_mph, time_budget, max_moves)
+    arrivals, miles, total_miles, finish_minutes = drive_route(ordered, table, start_index, start_minutes, end_index, speed_mph)
+    return TruckPlan(truck_id, ordered, arrivals, miles, total_miles, finish_minutes)
+
+def dispatch(trucks, package_table, distance_table, hub_address, speed_mph = TRUCK_SPEED_MPH, max_moves = MAX_MOVES, max_workers = None, time_budget = None):
+    '''
+    Plan every truck's route concurrently.
+    trucks: Truck objects (truck_id, start_time, packages, current_location)
+    package_table: anything with get(package_id) -> Package, e.g. the package HashTable
+    hub_address: where every truck finishes
+    max_moves: improving moves per route (see routing.RouteOptimizer), the deterministic budget
+    max_workers: worker processes (None = one per CPU). With one truck or max_workers=1 everything runs in this process.
+    time_budget: optional seconds per route on top of max_moves, the plans then depend on machine speed and load
+    Returns a TruckPlan per truck, in the same order as trucks, so the merged result doesn't depend on which worker finishes first.
+    '''
+    end_index = distance_table.index_of(hub_address)
+    tasks = []
+    for truck in trucks:
+        packages = [package_table.get(package_id) for package_id in truck.packages]
+        stops = build_stops([package for package in packages if package is not None], distance_table)
+        stop_records = [(stop.address_index, tuple(stop.package_ids), stop.deadline_minutes) for stop in stops]
+        tasks.append((truck.truck_id, stop_records, distance_table.index_of(truck.current_location),
+                      minutes_of(truck.start_time), end_index, speed_mph, time_budget, max_moves))
+
+    if len(tasks) <= 1 or max_workers == 1:
+        return [_plan_truck(task, distance_table) for task in tasks]
+
+    with SharedDistanceMatrix(distance_table) as shared:
+        with ProcessPoolExecutor(max_workers = max_workers, initializer = _attach_worker,
+                                 initargs = shared.attach_args()) as executor:
+            return list(executor.map(_plan_truck, tasks))
@@ -0,0 +1,175 @@
+# Create class DistanceTable to look up distances between delivery addresses (wgups_address_file.csv + wgups_distance_table.csv)
+
+import heapq
+from array import array
+from addresses import AddressIndex
+
+NEIGHBOR_COUNT = 10 # Candidate neighbors kept per address
+
+def normalize_address(address):
+    # Collapse repeated/outer whitespace so "410 S  State St " and "410 S State St" resolve to the same address
+    return " ".join(address.split())
+
+def symmetric_matrix(distance_rows, size):
+    '''
+    Expand lower-triangular distance rows into a dense symmetric size x size matrix, stored as one flat array of doubles (row i, column j is at i * size + j).
+    Row i only needs its first i + 1 values, anything past the diagonal is ignored, so full square tables work too.
+    Missing cells are 0.0.
+    '''
+    matrix = array('d', bytes(8 * size * size)) # Zero-filled size x size matrix
+    for i in range(min(size, len(distance_rows))):
+        row = distance_rows[i]
+        count = min(i + 1, len(row))
+        matrix[i * size:i * size + count] = row[:count] if isinstance(row, array) else array('d', row[:count])
+    # Mirror the lower triangle: the upper part of row i is column i below the diagonal, read as one strided slice
+    for i in range(size - 1):
+        matrix[i * size + i + 1:(i + 1) * size] = matrix[(i + 1) * size + i::size]
+    return matrix
+
+def shortest_path_closure(matrix, size):
+    '''
+    Shortest drive between every pair of addresses, returns (distances, predecessors) as flat arrays laid out like the matrix.
+    The raw table doesn't satisfy the triangle inequality (some pairs are shorter going through another address), after the closure
+    distances[i * size + j] is the shortest drive from i to j, possibly through other addresses, and predecessors[i * size + j] is the address just before j on that drive.
+    Runs Dijkstra from every address. Each address's distances are sorted once, and a settled address only offers its nearest unsettled
+    address to the heap (Spira's algorithm), so most of the size x size pairs are never pushed.
+    '''
+    view = memoryview(matrix)
+    order = [array('i', sorted(range(size), key = view[i * size:(i + 1) * size].__getitem__)) for i in range(size)]
+    distances = array('d', matrix)
+    predecessors = array('i', bytes(4 * size * size))
+    for source in range(size):
+        base = source * size
+        settled = bytearray(size)
+        position = [0] * size # How far each settled address's sorted order has been offered
+        reached = array('d', bytes(8 * size)) # Shortest distance from source to each settled address
+        settled[source] = 1
+        predecessors[base + source] = source
+        count = 1
+        heap = []
+
+        def offer(address, start):
+            # Push address's nearest unsettled address (from sorted position start on) onto the heap
+            candidates = order[address]
+            while start < size and settled[candidates[start]]:
+                start += 1
+            position[address] = start
+            if start < size:
+                heapq.heappush(heap, (reached[address] + matrix[address * size + candidates[start]], candidates[start], address))
+
+        offer(source, 0)
+        while count < size and heap:
+            distance, address, via = heapq.heappop(heap)
+            if not settled[address]:
+                settled[address] = 1
+                count += 1
+                reached[address] = distance
+                distances[base + address] = distance
+                predecessors[base + address] = via
+                offer(address, 0)
+            offer(via, position[via] + 1)
+        # Drive straight there when going through another address is only as short (ties and rounding),
+        # and copy the distances to earlier sources from their own runs so rounding never makes the matrix asymmetric
+        for address in range(size):
+            if matrix[base + address] <= distances[base + address] + 1e-9:
+                distances[base + address] = matrix[base + address]
+                predecessors[base + address] = source
+            elif address < source:
+                distances[base + address] = distances[address * size + source]
+    return distances, predecessors
+
+def nearest_neighbors(matrix, size, count):
+    '''
+    Candidate lists: for every address, the `count` other addresses closest to it, nearest first (ties by address index).
+    Returned as one flat array of ints, address i's list is at i * count .. (i + 1) * count.
+    heapq.nsmallest keeps only `count` entries per row instead of sorting the whole row, and it keeps equal distances in index order.
+    '''
+    neighbors = array('i')
+    view = memoryview(matrix)
+    for i in range(size):
+        nearest = heapq.nsmallest(count + 1, range(size), key = view[i * size:(i + 1) * size].__getitem__)
+        neighbors.extend([j for j in nearest if j != i][:count])
+    return neighbors
+
+class DistanceTable:
+    def __init__(self, addresses, distance_rows = None, matrix = None, neighbors = None, neighbor_count = NEIGHBOR_COUNT, predecessors = None):
+        '''
+        Initialize a DistanceTable with these parameters:
+        addresses: list of street addresses, in the same order as the rows of the distance table
+        distance_rows: lower-triangular rows of distances from wgups_distance_table.csv (missing cells are 0.0)
+        matrix: an already expanded flat symmetric matrix (see symmetric_matrix), used instead of distance_rows when given
+        neighbors: already built candidate lists (see nearest_neighbors), built on first use when not given
+        neighbor_count: candidates per address
+        predecessors: path predecessors from shortest_path_closure when matrix is a closure, used by path()
+
+        The address index is built once here so every lookup is O(1) instead of a list.index() scan, and spelling differences still resolve (see addresses.py).
+        '''
+        self.addresses = [normalize_address(address) for address in addresses]
+        self.address_index = AddressIndex(self.addresses)
+        self.size = len(self.addresses)
+        if matrix is None:
+            matrix = symmetric_matrix(distance_rows or [], self.size)
+        if len(matrix) != self.size * self.size:
+            raise ValueError(f"Distance matrix has {len(matrix)} cells, expected {self.size} x {self.size}")
+        self.matrix = matrix
+        self.neighbor_count = min(neighbor_count, max(self.size - 1, 0))
+        if neighbors is not None and len(neighbors) != self.size * self.neighbor_count:
+            raise ValueError(f"Neighbor lists have {len(neighbors)} entries, expected {self.size} x {self.neighbor_count}")
+        self.neighbors = neighbors
+        if predecessors is not None and len(predecessors) != self.size * self.size:
+            raise ValueError(f"Predecessors have {len(predecessors)} entries, expected {self.size} x {self.size}")
+        self.predecessors = predecessors
+
+    def index_of(self, address):
+        # Get the row/column index of an address, raises AddressNotFound (a KeyError) if it doesn't match any address in the address file
+        return self.address_index.resolve(address)
+
+    def distance(self, index1, index2):
+        # O(1) distance between two address indexes
+        return self.matrix[index1 * self.size + index2]
+
+    def distance_between(self, address1, address2):
+        # O(1) distance between two street addresses
+        return self.matrix[self.index_of(address1) * self.size + self.index_of(address2)]
+
+    def row(self, index):
+        # Zero-copy view of all distances from one address index
+        start = index * self.size
+        return memoryview(self.matrix)[start:start + self.size]
+
+    def path(self, index1, index2):
+        # Address indexes driven through from index1 to index2 (both included), just the two ends when there are no predecessors
+        if self.predecessors is None or index1 == index2:
+            return [index1, index2] if index1 != index2 else [index1]
+        base = index1 * self.size
+        path = [index2]
+        while path[-1] != index1:
+            path.append(self.predecessors[base + path[-1]])
+        path.reverse()
+        return path
+
+    def subtable(self, indexes):
+        # New DistanceTable over only the given address indexes, in that order (row/column k of the new table is indexes[k]), e.g. one zone of a large day
+        indexes = list(indexes)
+        matrix = array('d')
+        for index in indexes:
+            row = self.row(index)
+            matrix.extend([row[other] for other in indexes])
+        return DistanceTable([self.addresses[index] for index in indexes], matrix = matrix, neighbor_count = self.neighbor_count)
+
+    def build_neighbors(self):
+        # Build the candidate lists if they haven't been loaded or built yet, returns the flat array
+        if self.neighbors is None:
+            self.neighbors = nearest_neighbors(self.matrix, self.size, self.neighbor_count)
+        return self.neighbors
+
+    def neighbors_of(self, index):
+        # The neighbor_count addresses nearest to an address index, nearest first
+        neighbors = self.neighbors if self.neighbors is not None else self.build_neighbors()
+        start = index * self.neighbor_count
+        return neighbors[start:start + self.neighbor_count]
+
+    def distances_from(self, origin_index, destination_indexes):
+        # Distances from one stop to many stops in a single call (assign_trucks scores a group against every stop already on a truck with it)
+        row = self.row(origin_index)
+        return [row[index] for index in destination_indexes]
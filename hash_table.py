@@ -1,75 +1,134 @@
 # Create class HashTable to store the package data
+# Open addressing: keys and values live in two parallel flat lists instead of a list of [key, value] buckets, so there is no per-entry list allocation.
+
+_EMPTY = object() # Marks a slot that has never been used (ends a probe sequence)
+_DELETED = object() # Tombstone for a deleted slot (probe sequences continue past it)
+
+def _is_prime(number):
+    if number < 2:
+        return False
+    if number % 2 == 0:
+        return number == 2
+    divisor = 3
+    while divisor * divisor <= number:
+        if number % divisor == 0:
+            return False
+        divisor += 2
+    return True
+
+def _next_prime(number):
+    # Smallest prime number >= number
+    while not _is_prime(number):
+        number += 1
+    return number
+
 class HashTable:
     def __init__(self, size = 41): # Prime number size of buckets helps spread out key-value pairs and reduce collisons.
-        self.size = size
+        self.size = _next_prime(size)
         self.count = 0 # Count the number of key-value pairs in table
-        self.map = [None] * self.size # Initialize HashTable with empty buckets 
+        self.used = 0 # Count of occupied slots including tombstones, drives resizing
+        self.keys = [_EMPTY] * self.size
+        self.values = [None] * self.size
 
     def _get_hash(self, key):
-            # Create a simple hash function to configure teh array index for a given package_id key
-            hash = 0
-            # Loop through the characters in a variable key
-            for char in str(key):
-                 hash += ord(char) # ord is the ASCII numerical value of a char in Python
-            return hash % self.size # Modulus to get an index calue within the table size
-    
+        # Integer keys (package IDs) are mixed with Knuth's multiplicative hash so nearby IDs don't pile up in neighbouring slots.
+        # Every other key (strings, bytes, tuples) uses Python's built-in hash, which is computed in C and cached on str objects.
+        if type(key) is int:
+            return ((key * 2654435761) & 0xFFFFFFFF) % self.size
+        return hash(key) % self.size
+
+    def _find_slot(self, key):
+        # Linear probing: returns the slot holding key, or the slot where key should be inserted (first tombstone seen, else the empty slot)
+        keys = self.keys
+        size = self.size
+        index = self._get_hash(key)
+        first_deleted = -1
+        while True:
+            slot_key = keys[index]
+            if slot_key is _EMPTY:
+                return (first_deleted if first_deleted >= 0 else index), False
+            if slot_key is _DELETED:
+                if first_deleted < 0:
+                    first_deleted = index
+            elif slot_key == key:
+                return index, True
+            index += 1
+            if index == size:
+                index = 0
+
     def add(self, key, value):
-        ''' 
+        '''
         Insertion function to add the key-value par to the HashTable.
         The add function takes the package_id as the key and stores the delivery address, deadline, city, state, zip code, package weight, delivery status, and delivery time.
         '''
-        if self.count / self.size >= 0.7: 
-              self._resize() # To improve scalability and reduce collisions as the dataset grows, the hash table will automaticaly double in size and rehash elements once it is 70% full (load factor exceeds 0.7)
-        key_hash = self._get_hash(key)
-        key_value = [key, value] # Store key and package data as a pair
-    
-        if self.map[key_hash] is None:
-            self.map[key_hash] = [key_value] # Create a new bucket for this key_hash value
-        else:
-            for pair in self.map[key_hash]:
-                 if pair[0] == key: # Update package data if already exists
-                      pair[1] = value 
-                      return True
-            self.map[key_hash].append(key_value) # Append new key-value pair to bucket
+        if (self.used + 1) / self.size >= 0.7:
+              self._resize() # To improve scalability and reduce collisions as the dataset grows, the hash table grows to the next prime after double its size once it is 70% full (load factor exceeds 0.7)
+        index, found = self._find_slot(key)
+        if found:
+            self.values[index] = value # Update package data if already exists
+            return True
 
+        if self.keys[index] is _EMPTY:
+            self.used += 1 # Reusing a tombstone doesn't use up a new slot
+        self.keys[index] = key
+        self.values[index] = value
         self.count += 1
         return True
 
     # Lookup function that takes the package ID as input and returns the delivery address, deadline, city, and zip code, plus package weight and delivery status inlcuding delivery time
     def get(self, key):
          # Get the package data for a given package_id
-        key_hash = self._get_hash(key)
-        if self.map[key_hash] is not None:
-            for pair in self.map[key_hash]:
-                if pair[0] == key:
-                    return pair[1] # Return the package data
-        return None
+        index, found = self._find_slot(key)
+        return self.values[index] if found else None
+
+    def delete(self, key):
+        # Remove a key-value pair, returns True if the key was in the table
+        index, found = self._find_slot(key)
+        if not found:
+            return False
+        self.keys[index] = _DELETED # Leave a tombstone so later keys in the same probe sequence are still found
+        self.values[index] = None
+        self.count -= 1
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self._find_slot(key)[1]
+
+    def items(self):
+        # All (key, value) pairs in slot order
+        for key, value in zip(self.keys, self.values):
+            if key is not _EMPTY and key is not _DELETED:
+                yield key, value
 
     def _resize(self):
-         # Double the table size to the next prime number and rehash all the entries to allow for scalability/self-adjustment. 
+         # Grow the table to the next prime number after double its size and rehash everything in one pass (no recursive add() calls, tombstones are dropped).
 
-        former_map = self.map
-        self.size = self.size * 2 + 1 # Gets the next odd number
-        self.map = [None] * self.size
-        self.count = 0
-        for bucket in former_map:
-            if bucket is not None:
-                for pair in bucket:
-                    self.add(pair[0], pair[1]) # Re-add all key-value pairs to re-sized table
+        former_keys = self.keys
+        former_values = self.values
+        if (self.count + 1) / self.size >= 0.35:
+            self.size = _next_prime(self.size * 2 + 1) # Mostly live entries, so grow
+        # Otherwise the table is mostly tombstones, so rebuild at the same size to clear them
+        self.keys = [_EMPTY] * self.size
+        self.values = [None] * self.size
+        self.used = self.count
+        for key, value in zip(former_keys, former_values):
+            if key is not _EMPTY and key is not _DELETED:
+                index, found = self._find_slot(key)
+                self.keys[index] = key
+                self.values[index] = value # Re-add all key-value pairs to re-sized table
 
     def print(self):
          # Get all key-value pairs
-        all_packages = []
-        for bucket in self.map:
-            if bucket is not None:
-                for pair in bucket:
-                    all_packages.append(pair)
+        all_packages = [list(pair) for pair in self.items()]
 
         # Sort by package ID (key) so they print in numerical order
-        all_packages.sort() 
+        all_packages.sort(key = lambda pair: pair[0])
 
          # Print the entire HashTable to debug
-        ''' 
+        '''
         print('---WGUPS PACKAGE HASH TABLE---')
         for pair in all_packages:
             key = pair[0]
@@ -77,4 +136,4 @@ class HashTable:
             print(f"Package ID: {key}")
             print(f"Address: {package.address}, City: {package.city}, State: {package.state}, Zip Code: {package.zip_code}")
             print(f"Delivery Deadline: {package.delivery_deadline}, Weight (in kilo): {package.weight_kilo}, Special Notes: {package.special_notes}\n")
-        '''
\ No newline at end of file
+        '''
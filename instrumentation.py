@@ -0,0 +1,193 @@
+# Optional counters and timers for the load, lookup, routing and query hot paths
+# Turned on with the WGUPS_PROFILE environment variable or main.py's --profile flag, e.g.
+#   WGUPS_PROFILE=stats.json python main.py query --times 09:00,12:00
+#   python main.py --profile day.prof
+# When it is off nothing is wrapped or patched, the program runs exactly the same code as without this module.
+# When it is on, enable() swaps in wrapped versions of the hot functions that count calls and time them, and the results are written at exit:
+#   *.prof / *.pstats   cProfile output for the whole run (open with python -m pstats), plus the counters as JSON next to it
+#   any other file      counters and timers as JSON
+#   1 or -              counters and timers as JSON on stderr
+
+import atexit
+import cProfile
+import functools
+import inspect
+import json
+import os
+import sys
+import time
+import distances
+import hash_table
+import loader
+import routing
+import snapshot
+
+ENV_VARIABLE = "WGUPS_PROFILE"
+
+counters = {} # name -> count
+timers = {} # name -> list of durations in seconds
+_patched = [] # (owner, attribute, original) to undo in disable()
+_profiler = None
+
+def profile_target(argv):
+    # Where to write the results: --profile TARGET (removed from argv) or the WGUPS_PROFILE environment variable, None when profiling is off
+    if "--profile" in argv:
+        position = argv.index("--profile")
+        target = argv[position + 1] if position + 1 < len(argv) else "-"
+        del argv[position:position + 2]
+        return target
+    return os.environ.get(ENV_VARIABLE) or None
+
+def count(name, amount = 1):
+    counters[name] = counters.get(name, 0) + amount
+
+def _wrap(owner, attribute, wrapper_factory):
+    # Replace owner.attribute with wrapper_factory(original), remembered so disable() can put it back
+    original = getattr(owner, attribute)
+    setattr(owner, attribute, functools.wraps(original)(wrapper_factory(original)))
+    _patched.append((owner, attribute, original))
+
+def _counted(name):
+    def factory(original):
+        def wrapper(*args, **kwargs):
+            counters[name] = counters.get(name, 0) + 1
+            return original(*args, **kwargs)
+        return wrapper
+    return factory
+
+def _timed(name, sized = None):
+    # Time every call, sized(result) (if given) adds how many items the call handled to the counter of the same name
+    def factory(original):
+        durations = timers.setdefault(name, [])
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = original(*args, **kwargs)
+            durations.append(time.perf_counter() - start)
+            if sized is not None:
+                count(name + ".items", sized(result))
+            return result
+        return wrapper
+    return factory
+
+def _timed_generator(name):
+    # Time a generator from first to last item and count the items it yields
+    def factory(original):
+        durations = timers.setdefault(name, [])
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            items = 0
+            for item in original(*args, **kwargs):
+                items += 1
+                yield item
+            durations.append(time.perf_counter() - start)
+            count(name + ".items", items)
+        return wrapper
+    return factory
+
+def _counting_find_slot(self, key):
+    # HashTable._find_slot with probe and collision counts (a collision is every slot looked at after the first)
+    keys = self.keys
+    size = self.size
+    index = self._get_hash(key)
+    first_deleted = -1
+    probes = 0
+    while True:
+        probes += 1
+        slot_key = keys[index]
+        if slot_key is hash_table._EMPTY:
+            result = (first_deleted if first_deleted >= 0 else index), False
+            break
+        if slot_key is hash_table._DELETED:
+            if first_deleted < 0:
+                first_deleted = index
+        elif slot_key == key:
+            result = index, True
+            break
+        index += 1
+        if index == size:
+            index = 0
+    counters["hash_table.lookups"] = counters.get("hash_table.lookups", 0) + 1
+    counters["hash_table.probes"] = counters.get("hash_table.probes", 0) + probes
+    if probes > 1:
+        counters["hash_table.collisions"] = counters.get("hash_table.collisions", 0) + probes - 1
+    return result
+
+def enable(target = "-", extra_timers = ()):
+    '''
+    Start collecting. target says where the results go at exit (see the top of this file).
+    extra_timers: (module or class, function name, timer name) for application functions to time as well, e.g. main's query functions.
+    Generator functions (e.g. main.status_records) are timed from first to last item, not just the call that creates the generator.
+    '''
+    global _profiler
+    if _patched:
+        return # Already on
+    _wrap(distances.DistanceTable, "distance", _counted("distance.lookups"))
+    _wrap(distances.DistanceTable, "distance_between", _counted("distance.address_lookups"))
+    _wrap(distances.DistanceTable, "row", _counted("distance.row_lookups"))
+    _patched.append((hash_table.HashTable, "_find_slot", hash_table.HashTable._find_slot))
+    hash_table.HashTable._find_slot = _counting_find_slot
+    _wrap(loader, "iter_packages", _timed_generator("load.parse_packages"))
+    _wrap(loader, "load_distance_table", _timed("load.distance_table"))
+    _wrap(snapshot, "load_day", _timed("load.day"))
+    _wrap(routing, "plan_stops", _timed("route.plan", sized = len))
+    for owner, attribute, name in extra_timers:
+        timed = _timed_generator if inspect.isgeneratorfunction(getattr(owner, attribute)) else _timed
+        _wrap(owner, attribute, timed(name))
+
+    if target.endswith((".prof", ".pstats")):
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(write_results, target)
+
+def disable():
+    # Put every original function back (the collected numbers are kept)
+    global _profiler
+    while _patched:
+        owner, attribute, original = _patched.pop()
+        setattr(owner, attribute, original)
+    if _profiler is not None:
+        _profiler.disable()
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def summary():
+    # Counters, timer statistics (milliseconds) and derived rates as a dictionary
+    timer_summary = {}
+    for name, durations in timers.items():
+        if not durations:
+            continue
+        ordered = sorted(durations)
+        timer_summary[name] = {
+            "calls": len(ordered),
+            "total_ms": round(sum(ordered) * 1000, 3),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 4),
+            "p90_ms": round(percentile(ordered, 0.90) * 1000, 4),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 4),
+            "max_ms": round(ordered[-1] * 1000, 4),
+        }
+    rates = {}
+    route_seconds = sum(timers.get("route.plan", []))
+    if route_seconds > 0:
+        rates["route.stops_per_sec"] = round(counters.get("route.plan.items", 0) / route_seconds, 1)
+    if counters.get("hash_table.lookups"):
+        rates["hash_table.probes_per_lookup"] = round(counters["hash_table.probes"] / counters["hash_table.lookups"], 3)
+    return {"counters": dict(sorted(counters.items())), "timers": timer_summary, "rates": rates}
+
+def write_results(target):
+    # Write everything collected to target (see the top of this file)
+    disable()
+    if target.endswith((".prof", ".pstats")):
+        if _profiler is not None:
+            _profiler.dump_stats(target)
+        target = os.path.splitext(target)[0] + ".json"
+    output = json.dumps(summary(), indent = 2)
+    if target in ("1", "-"):
+        sys.stderr.write(output + "\n")
+    else:
+        with open(target, 'w', encoding = 'utf-8') as out_file:
+            out_file.write(output + "\n")
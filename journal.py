@@ -0,0 +1,424 @@
+# Append-only binary journal of delivery events, with replay and checkpoints
+# Every event is one fixed-size record (see RECORD), appended through a buffered file and fsynced in batches, so a busy fleet costs one
+# struct.pack per event and one fsync per batch instead of one per event. Replay memory-maps the journal and unpacks it with struct.iter_unpack.
+# The writer keeps the replayed state up to date as it appends (one apply per fsync batch) and saves it as a checkpoint (plain data plus how many records
+# it covers) every CHECKPOINT_EVERY records, so a replay only reads the records written after the last checkpoint.
+# The state is kept in arrays indexed by package ID, so a checkpoint is a few raw byte strings that load at memcpy speed.
+# A checkpoint that can't be read for any reason is ignored and the whole journal is replayed.
+# A crash can at worst leave half a record at the end of the file, it is cut off the next time the journal is opened (see recover).
+#
+# JournalWriter takes the same record/assign/finalize calls as a Timeline, so the day can be simulated straight into a journal,
+# and the JournalState a replay returns answers the same departure/delivery/address/miles questions, so main.status_records works on it.
+#
+# Usage: python journal.py record day.journal
+#        python journal.py replay day.journal --times 09:00,12:00 --packages 1-40 --format csv
+
+import argparse
+import heapq
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from operator import itemgetter
+from timeline import DEPARTURE, DELIVERY, HUB_RETURN, ADDRESS_CORRECTION
+
+# File header: magic, format version, record size
+HEADER = struct.Struct("<8sII")
+MAGIC = b"WGUPSJNL"
+JOURNAL_VERSION = 1
+CHECKPOINT_VERSION = 2 # Version 1 pickled the departures/deliveries dicts
+
+# One event: time (minutes since midnight), truck odometer (miles), package ID (0 = none), truck ID (0 = none), address index (-1 = none), kind
+RECORD = struct.Struct("<ddiiiB3x")
+
+# Record kinds. ASSIGN is a package put on a truck (Timeline.assign), the others are the Timeline event kinds.
+ASSIGN = 0
+KIND_CODES = {DEPARTURE: 1, DELIVERY: 2, HUB_RETURN: 3, ADDRESS_CORRECTION: 4}
+
+SYNC_EVERY = 1024 # Records written between fsyncs
+SYNC_SECONDS = 1.0 # Longest time a written record waits for its fsync while records keep coming (checked on append, see JournalWriter)
+CHECKPOINT_EVERY = 100000 # Records between checkpoints
+
+_MIDNIGHT = datetime.strptime("00:00:00", "%H:%M:%S") # Same date as the datetimes the trucks and Timeline use
+
+def _minutes(moment):
+    return (moment - _MIDNIGHT).total_seconds() / 60
+
+def _time_of(minutes):
+    # Rounded to the microsecond so a time read back prints exactly as it was recorded
+    return _MIDNIGHT + timedelta(microseconds = round(minutes * 60000000))
+
+def checkpoint_path(path):
+    return path + ".checkpoint"
+
+def record_count(path):
+    # Number of whole records in the journal (0 if it doesn't exist yet)
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+    return max(size - HEADER.size, 0) // RECORD.size
+
+def recover(path):
+    '''
+    Make the journal safe to append to after a crash: write the header if the file is new or empty, check it otherwise,
+    and cut off a partly written record at the end. Returns the number of whole records.
+    '''
+    with open(path, 'ab+') as journal_file:
+        journal_file.seek(0)
+        header = journal_file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            journal_file.truncate(0)
+            journal_file.write(HEADER.pack(MAGIC, JOURNAL_VERSION, RECORD.size))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            return 0
+        magic, version, size = HEADER.unpack(header)
+        if magic != MAGIC or version != JOURNAL_VERSION or size != RECORD.size:
+            raise ValueError(f"{path} is not a version {JOURNAL_VERSION} delivery journal")
+        count = record_count(path)
+        end = HEADER.size + count * RECORD.size
+        if os.path.getsize(path) != end:
+            journal_file.truncate(end)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        return count
+
+class JournalWriter:
+    def __init__(self, path, distance_table = None, sync_every = SYNC_EVERY, sync_seconds = SYNC_SECONDS, checkpoint_every = CHECKPOINT_EVERY):
+        '''
+        Open (or create) a journal for appending:
+        path: journal file, the checkpoint is written next to it (see checkpoint_path)
+        distance_table: turns corrected addresses into address indexes, only needed when ADDRESS_CORRECTION events are recorded
+        sync_every, sync_seconds: fsync after this many records or this many seconds, whichever comes first.
+            Both are checked when a record is appended, there is no timer: the tail written before the writer goes idle is only
+            fsynced by the next append, sync(), finalize() or close(), so a long-lived writer should call sync() when it runs out of events.
+        checkpoint_every: records between checkpoints (0 = never)
+        The writer keeps the journal's JournalState in memory (state), updated on every sync, and checkpoints from it.
+        '''
+        self.path = path
+        self.distance_table = distance_table
+        self.sync_every = sync_every
+        self.sync_seconds = sync_seconds
+        self.checkpoint_every = checkpoint_every
+        self.count = recover(path)
+        self.state = replay(path) # Starts from the checkpoint, so reopening a long journal only reads its tail
+        self.pending = bytearray() # Records written since the state was last updated
+        self.file = open(path, 'ab', buffering = 1 << 16)
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, kind, minutes, truck_id = 0, package_id = 0, miles = 0.0, address_index = -1):
+        # Write one record (see RECORD), it is durable after the next sync()
+        record = RECORD.pack(minutes, miles, package_id, truck_id, address_index, kind)
+        self.file.write(record)
+        self.pending += record
+        self.count += 1
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_seconds:
+            self.sync()
+        if self.checkpoint_every and self.count % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def sync(self):
+        # Flush the buffer and fsync, every record appended so far survives a crash after this. The records are then applied to state.
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.state.apply(self.pending, self.state.records)
+        self.pending.clear()
+
+    def checkpoint(self):
+        # Save the in-memory state (everything appended so far) as the new checkpoint
+        self.sync()
+        save_checkpoint(self.path, self.state)
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    # The same calls a Timeline takes while a day is simulated
+    def record(self, event):
+        address_index = -1
+        if event.kind == ADDRESS_CORRECTION:
+            if self.distance_table is None:
+                raise ValueError("Recording address corrections needs the distance table")
+            address_index = self.distance_table.index_of(event.address)
+        self.append(KIND_CODES[event.kind], _minutes(event.time), event.truck_id or 0, event.package_id or 0, event.miles, address_index)
+
+    def assign(self, package_id, truck_id, departure_time):
+        self.append(ASSIGN, _minutes(departure_time), truck_id, package_id)
+
+    def finalize(self):
+        self.sync()
+
+def _merge_tail(times, miles, new_times, new_miles):
+    '''
+    Add one truck's new (time, odometer) readings to its series, keeping it sorted by time.
+    Only the new readings are sorted (stable, they usually arrive in order already), then merged into the part of the series
+    they overlap, so a batch that comes after everything already stored is a plain extend.
+    '''
+    if any(new_times[index] > new_times[index + 1] for index in range(len(new_times) - 1)):
+        order = sorted(range(len(new_times)), key = new_times.__getitem__)
+        new_times = array('d', [new_times[index] for index in order])
+        new_miles = array('d', [new_miles[index] for index in order])
+    start = bisect_right(times, new_times[0])
+    if start == len(times):
+        times.extend(new_times)
+        miles.extend(new_miles)
+        return
+    # Readings already stored come first on equal times, like the stable sort of a Timeline
+    merged = list(heapq.merge(zip(times[start:], miles[start:]), zip(new_times, new_miles), key = itemgetter(0)))
+    del times[start:]
+    del miles[start:]
+    times.extend(reading[0] for reading in merged)
+    miles.extend(reading[1] for reading in merged)
+
+class JournalState:
+    # Everything replayed from a journal, answering the same status questions as a Timeline (departure, delivery, address_at, miles)
+    def __init__(self, addresses = None):
+        '''
+        Initialize an empty state with these parameters:
+        addresses: street addresses in distance table order, turns the address indexes of corrections back into addresses
+
+        Departures and deliveries are arrays indexed by package ID (truck 0 = none yet), they grow to the largest package ID seen.
+        '''
+        self.addresses = addresses
+        self.records = 0 # Journal records applied
+        self.last_record = b"" # Bytes of the last record applied, to recognize the journal a checkpoint belongs to
+        self.departure_truck = array('i') # First assignment wins
+        self.departure_minutes = array('d')
+        self.delivery_truck = array('i') # Earliest delivery wins
+        self.delivery_minutes = array('d')
+        self.corrections = {} # package_id -> ([correction minutes], [address indexes]), in time order
+        self.truck_times = {} # truck_id -> array of event minutes, in time order
+        self.truck_miles = {} # truck_id -> array of odometer readings at those times
+
+    def _grow(self, package_id):
+        # Make room for package_id in the package arrays (at least doubling, so growing one ID at a time stays cheap)
+        extra = max(package_id + 1, 2 * len(self.departure_truck)) - len(self.departure_truck)
+        for column in (self.departure_truck, self.departure_minutes, self.delivery_truck, self.delivery_minutes):
+            column.frombytes(bytes(extra * column.itemsize))
+
+    def apply(self, view, start):
+        # Apply the records in view (a buffer of whole records, record number start first)
+        assign_code, delivery_code, correction_code = ASSIGN, KIND_CODES[DELIVERY], KIND_CODES[ADDRESS_CORRECTION]
+        departure_truck, departure_minutes = self.departure_truck, self.departure_minutes
+        delivery_truck, delivery_minutes = self.delivery_truck, self.delivery_minutes
+        corrections = self.corrections
+        new_readings = {} # truck_id -> (times, odometers) in this batch, merged into the stored series at the end
+        touched_corrections = set()
+        for minutes, miles, package_id, truck_id, address_index, kind in RECORD.iter_unpack(view):
+            if kind == correction_code:
+                times, addresses = corrections.setdefault(package_id, ([], []))
+                times.append(minutes)
+                addresses.append(address_index)
+                touched_corrections.add(package_id)
+                continue
+            if kind == assign_code or kind == delivery_code:
+                if package_id >= len(departure_truck):
+                    self._grow(package_id) # Grows the arrays in place, the local names stay valid
+            if kind == assign_code:
+                if not departure_truck[package_id]:
+                    departure_truck[package_id] = truck_id
+                    departure_minutes[package_id] = minutes
+                continue
+            readings = new_readings.get(truck_id)
+            if readings is None:
+                readings = new_readings[truck_id] = (array('d'), array('d'))
+            readings[0].append(minutes)
+            readings[1].append(miles)
+            if kind == delivery_code and (not delivery_truck[package_id] or minutes < delivery_minutes[package_id]):
+                delivery_truck[package_id] = truck_id
+                delivery_minutes[package_id] = minutes
+
+        # Records can arrive out of time order (e.g. one truck's whole day after another's), each series stays sorted by time
+        for truck_id, (new_times, new_miles) in new_readings.items():
+            if truck_id not in self.truck_times:
+                self.truck_times[truck_id] = array('d')
+                self.truck_miles[truck_id] = array('d')
+            _merge_tail(self.truck_times[truck_id], self.truck_miles[truck_id], new_times, new_miles)
+        for package_id in touched_corrections: # A few corrections per package at most
+            times, addresses = corrections[package_id]
+            order = sorted(range(len(times)), key = times.__getitem__)
+            corrections[package_id] = ([times[index] for index in order], [addresses[index] for index in order])
+        count = len(view) // RECORD.size
+        if count:
+            self.records = start + count
+            self.last_record = bytes(view[(count - 1) * RECORD.size:count * RECORD.size])
+
+    def departure(self, package_id):
+        # (truck_id, departure time) for a package, or (None, None) if it never left the hub
+        if 0 <= package_id < len(self.departure_truck) and self.departure_truck[package_id]:
+            return self.departure_truck[package_id], _time_of(self.departure_minutes[package_id])
+        return None, None
+
+    def delivery(self, package_id):
+        # (truck_id, delivery time) for a package, or (None, None) if it was never delivered
+        if 0 <= package_id < len(self.delivery_truck) and self.delivery_truck[package_id]:
+            return self.delivery_truck[package_id], _time_of(self.delivery_minutes[package_id])
+        return None, None
+
+    def address_at(self, package_id, check_time, current_address):
+        # Address on file for a package at check_time, taking mid-day corrections into account
+        if package_id not in self.corrections:
+            return current_address
+        times, addresses = self.corrections[package_id]
+        index = bisect_right(times, _minutes(check_time))
+        if index == 0:
+            return current_address
+        address_index = addresses[index - 1]
+        return self.addresses[address_index] if self.addresses else f"address #{address_index}"
+
+    def truck_miles_at(self, truck_id, check_time):
+        # Odometer of one truck at check_time, interpolated between the two surrounding events like Timeline.truck_miles_at
+        times = self.truck_times.get(truck_id)
+        if not times:
+            return 0.0
+        miles = self.truck_miles[truck_id]
+        minutes = _minutes(check_time)
+        index = bisect_right(times, minutes)
+        if index == 0:
+            return 0.0
+        if index == len(times):
+            return miles[-1]
+        span = times[index] - times[index - 1]
+        if span <= 0:
+            return miles[index - 1]
+        return miles[index - 1] + (miles[index] - miles[index - 1]) * (minutes - times[index - 1]) / span
+
+    def total_miles_at(self, check_time):
+        return sum(self.truck_miles_at(truck_id, check_time) for truck_id in self.truck_times)
+
+    def truck_ids(self):
+        return sorted(self.truck_times)
+
+def save_checkpoint(path, state):
+    '''
+    Write the state as the journal's checkpoint (temp file + rename, so a crash never leaves half a checkpoint).
+    Only plain data is stored (a versioned dict holding the raw bytes of the state's arrays and the small corrections dict), no JournalState instance,
+    so the checkpoint loads the same whether it was written by "python journal.py" or by code that imported journal.
+    '''
+    data = {
+        "version": CHECKPOINT_VERSION,
+        "records": state.records,
+        "last_record": state.last_record,
+        "departure_truck": state.departure_truck.tobytes(),
+        "departure_minutes": state.departure_minutes.tobytes(),
+        "delivery_truck": state.delivery_truck.tobytes(),
+        "delivery_minutes": state.delivery_minutes.tobytes(),
+        "corrections": state.corrections,
+        "trucks": {truck_id: (state.truck_times[truck_id].tobytes(), state.truck_miles[truck_id].tobytes()) for truck_id in state.truck_times},
+    }
+    target = checkpoint_path(path)
+    with open(target + ".tmp", 'wb') as out_file:
+        pickle.dump(data, out_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(target + ".tmp", target)
+
+def load_checkpoint(path, journal_view):
+    # The checkpointed JournalState if it belongs to this journal (its last record matches the journal's record at that position), else None
+    try:
+        with open(checkpoint_path(path), 'rb') as checkpoint_file:
+            data = pickle.load(checkpoint_file)
+        if data["version"] != CHECKPOINT_VERSION:
+            return None
+        state = JournalState()
+        state.records = data["records"]
+        state.last_record = data["last_record"]
+        for name in ("departure_truck", "departure_minutes", "delivery_truck", "delivery_minutes"):
+            getattr(state, name).frombytes(data[name])
+        state.corrections = data["corrections"]
+        for truck_id, (times, miles) in data["trucks"].items():
+            state.truck_times[truck_id] = array('d', times)
+            state.truck_miles[truck_id] = array('d', miles)
+        if not (len(state.departure_truck) == len(state.departure_minutes) == len(state.delivery_truck) == len(state.delivery_minutes)):
+            return None
+    except Exception:
+        return None # Missing, corrupt, old or foreign checkpoint: replay the whole journal instead
+    if state.records * RECORD.size > len(journal_view):
+        return None
+    if state.records and bytes(journal_view[(state.records - 1) * RECORD.size:state.records * RECORD.size]) != state.last_record:
+        return None
+    return state
+
+def replay(path, addresses = None, use_checkpoint = True):
+    '''
+    Rebuild the delivery state from a journal and return it as a JournalState.
+    The journal is memory-mapped read-only. With use_checkpoint, replay starts from the checkpoint and only applies the records after it.
+    A partly written record at the end (crash while appending) is ignored.
+    '''
+    count = record_count(path)
+    state = None
+    with open(path, 'rb') as journal_file:
+        header = journal_file.read(HEADER.size)
+        if len(header) == HEADER.size and HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"{path} is not a delivery journal")
+        if count == 0:
+            return JournalState(addresses)
+        with mmap.mmap(journal_file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                with view[HEADER.size:HEADER.size + count * RECORD.size] as records:
+                    if use_checkpoint:
+                        state = load_checkpoint(path, records)
+                    if state is None:
+                        state = JournalState()
+                    state.addresses = addresses
+                    with records[state.records * RECORD.size:] as tail:
+                        state.apply(tail, state.records)
+    return state
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Record the delivery day to a binary journal, or replay a journal into status queries")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    record_parser = commands.add_parser("record", help = "simulate the day into a new journal")
+    record_parser.add_argument("journal")
+    replay_parser = commands.add_parser("replay", help = "rebuild the day from the journal and print package statuses")
+    replay_parser.add_argument("journal")
+    replay_parser.add_argument("--times", default = "17:00", help = "comma-separated times (HH:MM or HH:MM:SS)")
+    replay_parser.add_argument("--packages", default = "", help = "package IDs or ranges, e.g. 1-10,15 (default all)")
+    replay_parser.add_argument("--format", choices = ["jsonl", "csv"], default = "jsonl")
+    replay_parser.add_argument("--no-checkpoint", action = "store_true", help = "replay every record instead of starting from the checkpoint")
+    args = parser.parse_args(argv)
+    if args.command == "record" and record_count(args.journal):
+        # Appending would put a second copy of the day after the first
+        record_parser.error(f"{args.journal} already holds a journal, delete it (and {checkpoint_path(args.journal)}) to record the day again")
+
+    import main as wgups # The day's data and queries, only loaded when the journal is used from the command line
+    wgups.app.load()
+    if args.command == "record":
+        with JournalWriter(args.journal, wgups.app.distance_table) as writer:
+            wgups.record_day(writer)
+            print(f"{writer.count} records in {args.journal}")
+        return
+
+    started = time.perf_counter()
+    state = replay(args.journal, wgups.app.distance_table.addresses, not args.no_checkpoint)
+    seconds = time.perf_counter() - started
+    try:
+        check_times = wgups.parse_check_times(args.times)
+    except ValueError as error:
+        replay_parser.error(f"--times: {error}")
+    try:
+        package_ids = wgups.parse_id_ranges(args.packages) if args.packages else sorted(package_id for package_id, package in wgups.app.package_hash.items())
+    except ValueError as error:
+        replay_parser.error(f"--packages: {error}")
+    exit_code = wgups.print_records(wgups.status_records(check_times, package_ids, state), args.format)
+    print(f"Replayed {state.records} records in {seconds * 1000:.1f} ms", file = sys.stderr)
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# Streaming loaders for the WGUPS package, address and distance CSV files
+# Nothing here runs at import time, every function reads its file only when called.
+# Parsers are generators so large files are processed row by row instead of being read into memory first.
+
+import codecs
+import csv
+from array import array
+from package_store import PackageStore
+from package import Package
+from distances import DistanceTable, symmetric_matrix, shortest_path_closure
+
+# Package fields in the order Package() takes them, with words that identify each column in the package file header
+PACKAGE_FIELDS = ["package_id", "address", "city", "state", "zip_code", "delivery_deadline", "weight_kilo", "special_notes"]
+HEADER_KEYWORDS = {
+    "package_id": "id",
+    "address": "address",
+    "city": "city",
+    "state": "state",
+    "zip_code": "zip",
+    "delivery_deadline": "deadline",
+    "weight_kilo": "weight",
+    "special_notes": "notes",
+}
+
+class RowError:
+    # A row that could not be loaded, collected instead of stopping the whole load
+    def __init__(self, filename, line_number, message, row):
+        self.filename = filename
+        self.line_number = line_number
+        self.message = message
+        self.row = row
+
+    def __str__(self):
+        return f"{self.filename}, line {self.line_number}: {self.message}"
+
+def _report(error, errors):
+    # Collect the error if the caller passed an errors list, otherwise fail loudly
+    if errors is None:
+        raise ValueError(str(error))
+    errors.append(error)
+
+def _header_columns(header):
+    '''
+    Map each package field to its column number using the package file header.
+    The header cells span several lines ("Package\\nID", "Delivery\\nDeadline") and carry page footer text, so cells are matched by keyword instead of exact text.
+    Returns None if the row isn't a recognizable header.
+    '''
+    names = [" ".join(cell.split()).lower() for cell in header]
+    columns = {}
+    for field in PACKAGE_FIELDS:
+        keyword = HEADER_KEYWORDS[field]
+        for index, name in enumerate(names):
+            if keyword in name.split() or (field == "special_notes" and keyword in name):
+                columns[field] = index
+                break
+    if "package_id" not in columns or "address" not in columns:
+        return None
+    return columns
+
+def iter_packages(filename, errors = None):
+    '''
+    Generator that yields one Package per valid row of the package file.
+    Deadlines and weights are parsed once here (see Package).
+    Bad rows are reported through errors (a list of RowError) if given, else a ValueError is raised.
+    '''
+    seen_ids = set()
+    with open(filename, mode = 'r', encoding = 'utf-8-sig', newline = '') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        columns = None
+        for row in csv_reader:
+            if not row or not any(cell.strip() for cell in row): # Skip empty rows
+                continue
+            if columns is None:
+                columns = _header_columns(row)
+                if columns is not None:
+                    continue # Header row
+                columns = {field: index for index, field in enumerate(PACKAGE_FIELDS)} # No header, use file order
+
+            line_number = csv_reader.line_num
+            values = {field: (row[index].strip() if index < len(row) else "") for field, index in columns.items()}
+            values.setdefault("special_notes", "")
+
+            package_id = values.get("package_id", "")
+            if not package_id.isdigit():
+                _report(RowError(filename, line_number, f"invalid package ID '{package_id}'", row), errors)
+                continue
+            package_id = int(package_id)
+            if package_id in seen_ids:
+                _report(RowError(filename, line_number, f"duplicate package ID {package_id}", row), errors)
+                continue
+            if not values.get("address"):
+                _report(RowError(filename, line_number, f"package {package_id} has no address", row), errors)
+                continue
+            try:
+                package = Package(package_id, values["address"], values.get("city", ""), values.get("state", ""), values.get("zip_code", ""),
+                                  values.get("delivery_deadline") or "EOD", values.get("weight_kilo", ""), values["special_notes"])
+            except ValueError:
+                _report(RowError(filename, line_number, f"package {package_id} has an invalid deadline or weight", row), errors)
+                continue
+
+            seen_ids.add(package_id)
+            yield package
+
+def load_package_store(filename, errors = None):
+    '''
+    Load every package into a columnar PackageStore, for bulk scans of a large manifest (due_before, in_zip, total_weight).
+    The day itself is loaded as Package objects (iter_packages / snapshot.load_day): a PackageStore builds a new Package on every get(), without an address_index.
+    '''
+    package_store = PackageStore()
+    for package in iter_packages(filename, errors):
+        package_store.add(package.package_id, package)
+    return package_store
+
+def iter_addresses(filename):
+    # Generator that yields (index, location name, street address) for each row of the address file
+    with open(filename, mode = 'r', encoding = 'utf-8-sig', newline = '') as csv_file:
+        for row in csv.reader(csv_file):
+            if len(row) >= 3:
+                yield int(row[0]), row[1].strip(), row[2].strip()
+
+def load_address_list(filename):
+    # Street addresses in distance table order
+    return [address for index, name, address in iter_addresses(filename)]
+
+def iter_distance_rows(filename):
+    '''
+    Generator that yields each row of the lower-triangular distance file as an array of doubles.
+    Row i only keeps its first i + 1 cells, the empty cells past the diagonal are never parsed.
+    The file is read as bytes and lines are split directly instead of going through csv.reader, the distance file is plain numbers
+    (float() takes bytes, so nothing is decoded).
+    '''
+    with open(filename, mode = 'rb') as distance_file:
+        row_index = 0
+        for line in distance_file:
+            if row_index == 0 and line.startswith(codecs.BOM_UTF8):
+                line = line[len(codecs.BOM_UTF8):]
+            if line.isspace():
+                continue
+            cells = line.split(b",", row_index + 1)[:row_index + 1]
+            try:
+                row = array('d', map(float, cells)) # Fast path, every cell up to the diagonal is filled in
+            except ValueError:
+                row = array('d', [float(cell) if cell.strip() else 0.0 for cell in cells])
+            yield row
+            row_index += 1
+
+def load_distance_matrix(filename, size = None):
+    '''
+    Read the distance file straight into a flat symmetric matrix of doubles, returns (size, matrix).
+    When size is known (from the address file) rows are copied into the matrix as they stream in, otherwise they are collected first to count them.
+    Parsing the CSV is bound by float() on every cell: about 2.4 s for 5,000 addresses (12.5 million cells), short of the "well under a second"
+    target. That target is met by the snapshot instead (snapshot.load_day memory-maps the parsed matrix, about 0.1 s for 5,000 addresses),
+    so only the first load after the distance file changes pays for parsing.
+    '''
+    if size is None:
+        rows = list(iter_distance_rows(filename))
+        return len(rows), symmetric_matrix(rows, len(rows))
+    matrix = array('d', bytes(8 * size * size))
+    for i, row in enumerate(iter_distance_rows(filename)):
+        if i >= size:
+            break
+        matrix[i * size:i * size + len(row)] = row
+    # Mirror the lower triangle into the upper triangle
+    for i in range(size - 1):
+        matrix[i * size + i + 1:(i + 1) * size] = matrix[(i + 1) * size + i::size]
+    return size, matrix
+
+def load_distance_table(address_filename, distance_filename, closure = False):
+    '''
+    Build the DistanceTable from the address file and distance file.
+    closure: replace every distance with the shortest drive between the two addresses (see distances.shortest_path_closure).
+    Off by default: the closure is O(n^3) in pure Python (about 6 s at 400 addresses), callers that want it opt in.
+    '''
+    addresses = load_address_list(address_filename)
+    size, matrix = load_distance_matrix(distance_filename, len(addresses))
+    if not closure:
+        return DistanceTable(addresses, matrix = matrix)
+    matrix, predecessors = shortest_path_closure(matrix, size)
+    return DistanceTable(addresses, matrix = matrix, predecessors = predecessors)
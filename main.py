@@ -1,245 +1,295 @@
 
 
 from datetime import datetime, timedelta
+import heapq
 from hash_table import HashTable
-from package import Package
-from load_packages import package_hash
-from load_packages import load_package_data
+from package import Package, EOD_MINUTES
+from routing import plan_route, minutes_of, TRUCK_SPEED_MPH, MAX_MOVES
+from constraints import day_constraints, assign_trucks, ADDRESS_CORRECTIONS, HUB_ADDRESS, TRUCK_CAPACITY
+from deadline_index import DeadlineIndex
+from simulation_state import SimulationState
+from timeline import Timeline, Event, DEPARTURE, DELIVERY, HUB_RETURN, ADDRESS_CORRECTION
+from simulator import DRIVER_COUNT, DAY_START_MINUTES
 import csv 
-
-# Load Distance Table
-distance_matrix = []
-address_list = []
-
-# Load addresses from wgups_address_file.csv
-def load_address_file(filename):
-    with open(filename, mode = 'r', encoding = 'utf-8-sig') as csv_file:
-        csv_reader = csv.reader(csv_file)
-        for row in csv_reader:
-            # row[1] is the address, skip row[0] because it's the hub
-            address_list.append(row[2].strip())
-
-# Load distance table from wgups_distance_file.csv
-def load_distance_table(filename):
-    with open(filename, mode = 'r', encoding = 'utf-8-sig') as csv_file:
-        csv_reader = csv.reader(csv_file)
-        for row in csv_reader:
-            if row:
-                row_distances = [float(d.strip()) if d.strip() else 0.0 for d in row]
-                distance_matrix.append(row_distances)
+import json
+import os
+import sys
+# snapshot (hashing/pickle), argparse and instrumentation are imported where they are used, so a bare "import main" stays cheap
 
 # Get distance between two addresses from csv files for distance and addresses
-def get_distance(address1, address2):
-    address1 = address1.strip()
-    address2 = address2.strip()
-
-    try:
-        index1 = address_list.index(address1)
-        index2 = address_list.index(address2)
-    except ValueError:
-        print(f"Address not found: '{address1}' or '{address2}'") 
-        return 0.0
-    
-# Check distance from address1 to address 2. 
-# If distance is missing/empty for address1 to address2, look up reverse (address 2 to address 1).
-# If row 2, column 14 is empty on the distance table then it's not showing distance from address 2 to address 14, so the code clips it and checks the distance from address 14 to address 2 which is row 14 column 2. 
-    distance = distance_matrix[index1][index2]
-    if distance == 0.0:
-        distance = distance_matrix[index2][index1]
-    return distance 
-
-# Constant for Hub address format to match from wgups_address_file.csv
-HUB_ADDRESS = "4001 South 700 East"
+# The DistanceTable is built once after loading, so each lookup is a dictionary hit plus an array read instead of two list.index() scans.
+# The lower-triangular table is already mirrored into a symmetric matrix, so no need to flip the indices when a cell is empty.
+# An address that isn't in the address file raises addresses.AddressNotFound instead of counting as 0.0 miles.
+def get_distance(address1, address2, context = None):
+    return (context or app).distance_table.distance_between(address1, address2)
 
 # Truck class
 # This class models a delivery truck with truck ID, start time, assigned packages (manually loaded), current location, miles traveled, and the current time tracking.
 # A new truck is initialized when a Truck object is created and time advances with deliveries. 
 class Truck:
-    def __init__(self, truck_id, start_time, packages):
+    def __init__(self, truck_id, start_time, packages, speed_mph = TRUCK_SPEED_MPH):
         self.truck_id = truck_id
         self.start_time = start_time
         self.packages = packages # List of package IDs assigned to a truck
+        self.speed_mph = speed_mph # Truck speed is 18mph unless a scenario changes it
         self.current_location = HUB_ADDRESS
         self.miles_traveled = 0.0
         self.time = start_time # Track the time during deliveries 
 
     def add_miles(self, miles):
         self.miles_traveled += miles
-        self.time += timedelta(hours = miles / 18) # Truck speed is 18mph
+        self.time += timedelta(hours = miles / self.speed_mph)
 
-# Truck objects for the three trucks, manually assigned packages. These 3 trucks are created with preloaded packages and departure times from the Hub based on delivery constraints. 
-
-# Truck 1 leaves first, Truck 2 leave after Truck 1 returns or delayed packages arrive, Truck 3 waits until package 9 address correction is made at 10:20 AM. 
+# Truck objects for the three trucks. Packages are loaded automatically from the special notes constraints (see constraints.py and load_trucks below),
+# and the departure times come from the day's events (see schedule_departures below), so neither is set here.
 
 # Truck 1 leaves first for 9 AM deadlines
 truck1 = Truck(
     truck_id  = 1,
-    start_time = datetime.strptime("08:05:00", "%H:%M:%S"),
-       packages = [1, 7, 8, 13, 14, 15, 16, 19, 20, 29, 30, 31, 34, 37, 40] # Early deadlines and no constraints (15 total)
+    start_time = None,
+    packages = []
 )
 
-# Truck 2 leaves once Truck 1 comes back or if delayed packages become available
+# Truck 2 leaves once delayed packages become available
 truck2 = Truck(
     truck_id  = 2,
-    start_time = datetime.strptime("09:15:00", "%H:%M:%S"),
-    packages = [3, 5, 10, 11, 12, 17, 18, 21, 22, 23, 24, 25, 36, 38] 
+    start_time = None,
+    packages = []
 )
 
-# Truck 3 leaves last and finishes the EOD deliveries 
+# Truck 3 leaves last and finishes the EOD deliveries, once a driver is back and package 9's address is corrected
 truck3 = Truck(
     truck_id  = 3,
-    start_time = datetime.strptime("10:25:00", "%H:%M:%S"), # Delayed start time because driver on truck 1 returns and package 9 is ready
-    packages = [2, 4, 9, 26, 27, 32, 33, 35, 39] # Package 9 was delayed until 10:20 AM plus remaining packages. (9 total)
+    start_time = None,
+    packages = []
 )
 
-# Delayed packages
-delayed_packages = [6, 28, 32]
-delayed_package_ready_time = {
-    6: datetime.strptime("09:05:00", "%H:%M:%S"),
-    28: datetime.strptime("09:05:00", "%H:%M:%S"),
-    32: datetime.strptime("09:05:00", "%H:%M:%S"),
-    9: datetime.strptime("10:20:00", "%H:%M:%S")
-}
-
-# Function to sort packages by deadline and distance 
-def sort_by_deadline_then_distance(package_item):
-    deadline, distance, package = package_item
-
-    # Prioritize package 25 meets its 10:30 deadline
-    if package_item[2].package_id == 25:
-        # Manually assign earlier deadline to sort it first
-        deadline = datetime.strptime("09:30:00", "%H:%M:%S")
-
-    return (deadline, distance)
-
-# Delivery simulation using Nearest-Neighbor Algorithm
-def deliver_packages(truck, check_time):
-    # Address correction for package 9 at 10:20 AM
-    if check_time >= datetime.strptime("10:20:00", "%H:%M:%S"):
-        package9 = package_hash.get(9)
-        package9.address = "410 S State St"
-        package9.city = "Salt Lake City"
-        package9.state = "UT"
-        package9.zip_code = "84111"
+trucks = [truck1, truck2, truck3]
+
+# Packages delivered less than this many minutes before their deadline are reported as at risk
+AT_RISK_MINUTES = 30
+
+# Data files for the delivery day
+DAY_FILES = ("wgups_package_file.csv", "wgups_address_file.csv", "wgups_distance_table.csv")
+
+# Simulate the delivery day up to this time
+end_of_day = datetime.strptime("17:00:00", "%H:%M:%S") 
+
+# AppContext class
+# Everything loaded for the delivery day lives on one context object instead of module globals. Nothing is read until the first load(),
+# so importing main (as the server, scenario runner and worker processes do) costs no I/O, and the data is loaded once per process.
+class AppContext:
+    def __init__(self, day_files, closure = False, fleet = None, capacity = TRUCK_CAPACITY, driver_count = DRIVER_COUNT, address_corrections = ADDRESS_CORRECTIONS):
+        '''
+        Initialize an empty context with these parameters:
+        day_files: (package file, address file, distance file)
+        closure: route on shortest-path distances (see snapshot.load_day)
+        fleet: Truck objects for the day, only their truck IDs and speeds are used (default the three WGUPS trucks)
+        capacity: packages per truck
+        driver_count: drivers sharing the fleet (see schedule_departures)
+        address_corrections: package_id -> (correction minutes, address, city, state, zip)
+        '''
+        self.day_files = day_files
+        self.closure = closure
+        self.fleet = trucks if fleet is None else fleet
+        self.capacity = capacity
+        self.driver_count = driver_count
+        self.address_corrections = address_corrections
+        self.loaded = False
+        self.day_packages = []
+        self.package_hash = HashTable() # package ID -> Package
+        self.distance_table = None # Distance lookups between addresses from the address and distance files
+        self.package_constraints = {} # package ID -> PackageConstraints parsed from the special notes, filled in by load_trucks
+        self.truck_loads = {} # truck ID -> package IDs, filled in by load_trucks
+        self.truck_departures = {} # truck ID -> departure time, filled in by load_trucks
+        self.deadline_index = DeadlineIndex() # Packages with a timed deadline, bucketed by deadline and tagged with their truck (see deadline_index.py)
+        self.day_timeline = None # Simulated day, built by get_day_timeline on first use
+
+    def load(self):
+        # Load the day the first time it is needed, later calls do nothing
+        if not self.loaded:
+            self.reload()
+        return self
+
+    def reload(self, simulate = False):
+        '''
+        Load (or reload) the day's data and reload the trucks. With simulate the day is simulated right away as well,
+        otherwise the timeline is thrown away and the next query re-simulates.
+        Everything is built on a new context first and copied over only once it all worked, so a reload that fails
+        (bad manifest, a truck load that doesn't fit) leaves this context serving the previous day untouched.
+        The parsed data is cached in a binary snapshot (see snapshot.py), so only the first run after the files change parses the CSVs
+        '''
+        import snapshot
+        staged = AppContext(self.day_files, self.closure, self.fleet, self.capacity, self.driver_count, self.address_corrections)
+        staged.day_packages, staged.distance_table = snapshot.load_day(*self.day_files, closure = self.closure)
+        for package in staged.day_packages:
+            staged.package_hash.add(package.package_id, package)
+        load_trucks(staged.day_packages, staged)
+        staged.loaded = True
+        if simulate:
+            timeline = Timeline()
+            record_day(timeline, staged)
+            staged.day_timeline = timeline
+        self.__dict__.update(staged.__dict__) # One call, so a query on another thread sees either the old day or the new one
+
+# Routed on the file's distances as given: with the shortest-path closure the local search ends in a slightly longer day (93.0 miles instead of 92.3)
+app = AppContext(DAY_FILES)
+
+# Turn minutes since midnight into the datetimes used by the trucks
+def time_of(minutes):
+    return datetime.strptime("00:00:00", "%H:%M:%S") + timedelta(minutes = minutes)
+
+# Parse every package's special notes and load the trucks automatically into context (app unless a staged context is passed in)
+def load_trucks(packages, context = None):
+    if context is None:
+        context = app
+    context.package_constraints.clear()
+    context.package_constraints.update(day_constraints(packages, context.address_corrections))
+    planned = planned_departures(context.package_constraints, context.fleet)
+    context.truck_loads.clear()
+    context.truck_loads.update(assign_trucks(packages, context.package_constraints, planned, context.distance_table, HUB_ADDRESS, context.capacity))
+    context.truck_departures.clear()
+    context.truck_departures.update(schedule_departures(planned, context))
+
+    # EOD packages can never be late, only timed deadlines go in the index
+    context.deadline_index.clear()
+    for truck_id, package_ids in context.truck_loads.items():
+        for package_id in package_ids:
+            deadline = context.package_hash.get(package_id).deadline_minutes
+            if deadline < EOD_MINUTES:
+                context.deadline_index.add(package_id, deadline, truck_id)
+
+# Departure times the trucks are loaded for, as a list of (truck ID, minutes since midnight): each time a batch of packages becomes ready
+# (the start of the day, the delayed flight, the address correction) is one truck's departure, in order, and the last truck waits for the last batch
+def planned_departures(constraints, fleet):
+    ready = sorted({max(available, DAY_START_MINUTES) for available in (package_constraints.available_minutes() for package_constraints in constraints.values())
+                    if available is not None}) or [DAY_START_MINUTES]
+    planned = []
+    for position, truck in enumerate(fleet):
+        minutes = ready[-1] if position == len(fleet) - 1 else ready[min(position, len(ready) - 1)]
+        planned.append((truck.truck_id, minutes))
+    return planned
+
+# Work out when each loaded truck actually leaves, returns truck ID -> departure time
+# The context's drivers (DRIVER_COUNT for WGUPS) start at the beginning of the day. In order of when their loads are ready, each truck leaves once its last package is ready
+# and a driver is at the hub, and that driver is free again when the truck gets back (its trip is driven once on a scratch state to find out when).
+# A truck with nothing to deliver keeps its planned time and doesn't take a driver.
+def schedule_departures(planned, context = None):
+    if context is None:
+        context = app
+    drivers = [DAY_START_MINUTES] * context.driver_count # Minutes each driver is free, as a heap
+    scratch = SimulationState(max(package_id for package_id, package in context.package_hash.items()) + 1)
+    departures = {}
+    speeds = {truck.truck_id: truck.speed_mph for truck in context.fleet}
+    loads = []
+    for truck_id, minutes in planned:
+        package_ids = context.truck_loads.get(truck_id, [])
+        if not package_ids:
+            departures[truck_id] = time_of(minutes)
+            continue
+        load_ready = max([DAY_START_MINUTES] + [context.package_constraints[package_id].available_minutes() for package_id in package_ids])
+        loads.append((load_ready, truck_id, package_ids))
+    for load_ready, truck_id, package_ids in sorted(loads):
+        departure = time_of(max(heapq.heappop(drivers), load_ready))
+        truck = Truck(truck_id, departure, list(package_ids), speeds[truck_id])
+        deliver_packages(truck, end_of_day, scratch, context = context)
+        heapq.heappush(drivers, minutes_of(truck.time))
+        departures[truck_id] = departure
+    return departures
+
+# Time a package can leave the hub (arrived and address known), None if never
+def package_ready_time(package_id, context = None):
+    constraints = (context or app).package_constraints.get(package_id)
+    if constraints is None:
+        return None
+    available = constraints.available_minutes()
+    return time_of(available) if available else None
+
+# Delivery simulation
+# The delivery order is planned once when the truck leaves (nearest neighbor, then 2-opt/Or-opt improvement, see routing.py), then the truck drives it stop by stop.
+# Everything the run changes goes into state (a SimulationState), the Package objects in app.package_hash are never modified, so runs can't interfere with each other.
+# If a Timeline is passed in, every departure, delivery and hub return is recorded to it with the truck's cumulative miles.
+def deliver_packages(truck, check_time, state, timeline = None, context = None):
+    if context is None:
+        context = app
+    # Apply any address corrections received by check_time
+    for package_id, (correction_minutes, address, city, state_code, zip_code) in context.address_corrections.items():
+        if check_time >= time_of(correction_minutes):
+            state.override_address(package_id, address, city, state_code, zip_code)
     
     # Only simulate the deliveries if the truck has left
     if truck.start_time > check_time:
         return # Truck not departed yet
 
-    # Check if any delayed packages are ready now and assign them to a truck
-    for package_id in delayed_package_ready_time:
-        ready_time = delayed_package_ready_time[package_id]
-        if ready_time <= truck.start_time:
-            package = package_hash.get(package_id)
-            # If delayed package isn't already assigned to a truck
-            if package.truck_id is None: # Not assigned a truck yet
-                # If possible, assign to Truck 2, else to Truck 3
-                if truck.truck_id == 2: 
-                    truck.packages.append(package_id)
-                elif truck.truck_id == 3 and package_id not in truck2.packages:
-                    truck.packages.append(package_id)
-    
     # Assign truck number and departure time when truck leaves the hub
+    start_minutes = minutes_of(truck.start_time)
     for package_id in truck.packages:
-        package = package_hash.get(package_id)
-        # Prioritize package 25 being manually added to Truck 2 to meet 10:30 AM deadline
-        if truck.truck_id == 2 and 25 in truck.packages:
-            # Manually ensure package 25 is delivered at 9:30 to make the 10:30 deadline
-            if package.package_id == 25:
-                deadline = datetime.strptime("09:30:00", "%H:%M:%S")
-        if package.truck_id is None:
-            package.truck_id = truck.truck_id
-            package.truck_departure_time = truck.start_time
-    
-    while truck.packages:
-        # Get current location of truck
-        current_address = truck.current_location
-        # Sort available packages on the truck by deadline and distance
-        available_packages = []
-
-        for package_id in truck.packages:
-            package = package_hash.get(package_id)
-
-            # Skip DELAYED packages until they are ready
-            if package_id in delayed_package_ready_time:
-                if delayed_package_ready_time[package_id] > check_time:
-                    continue
-
-            # Skip package 9 if address is not corrected yet, or change address if after 10:20
-            if package_id == 9:
-                if check_time < datetime.strptime("10:20:00", "%H:%M:%S"):
-                    continue
-                else:
-                    package.address = "410 S State St" # The corrected address
-
-            # Skip packages that must be on Truck 2
-            if package_id in [3, 18, 36, 38] and truck.truck_id != 2:
-                continue
-
-            # Skip packages that must be delivered together/grouped on same truck
-            # Package 14 must be delivered with 15 & 19
-            if package_id in [15, 19] and 14 in truck.packages:
-                continue
-            # Package 16 must be delivered with 13 and 19
-            if package_id in [13, 19] and 16 in truck.packages:
-                continue
-            # Package 20 must be delivered with 13 & 15
-            if package_id in [13, 15] and 20 in truck.packages:
-                continue
+        state.assign(package_id, truck.truck_id, start_minutes)
+        if timeline is not None:
+            timeline.assign(package_id, truck.truck_id, truck.start_time)
 
-            try:
-                deadline = datetime.strptime(package.delivery_deadline, "%H:%M:%S")
-            except ValueError:
-                deadline = datetime.strptime("23:59:00", "%H:%M:%S")
-
-            # Find distance to a package 
-            distance = get_distance(current_address, package.address)
-            available_packages.append((deadline, distance, package))
-
-        # Exit loop if no valid packages available 
-        if len(available_packages) == 0:
-            break
-
-        # Sort packages by deadline then distance from the current location 
-        available_packages.sort(key = sort_by_deadline_then_distance)
-        closest_deadline, shortest_distance, closest_package = available_packages[0]
-        
-        travel_time = timedelta(hours = shortest_distance / 18) # Trucks travel at 18mph
-        arrival_time = truck.time + travel_time
-
-        # Deliver the closest package
-        truck.add_miles(shortest_distance)
-        truck.current_location = closest_package.address
-        closest_package.time_delivered = arrival_time
-        closest_package.truck_departure_time = truck.start_time
-        closest_package.truck_id = truck.truck_id
-        truck.time = arrival_time
-
-        if closest_package.package_id in truck.packages:
-            truck.packages.remove(closest_package.package_id)
-
-        # Deliver packages that must be grouped together
-        grouped_packages = {
-            14: [15, 19],
-            16: [13, 19], 
-            20: [13, 15]
-        }
-
-        if closest_package.package_id in grouped_packages:
-            for package_id in grouped_packages[closest_package.package_id]:
-                p = package_hash.get(package_id)
-                if p.time_delivered == datetime.max:
-                    p.time_delivered = arrival_time
-                    p.truck_departure_time = truck.start_time
-                    p.truck_id = truck.truck_id
-                    if package_id in truck.packages:
-                        truck.packages.remove(package_id)
+    if timeline is not None:
+        timeline.record(Event(truck.start_time, DEPARTURE, truck.truck_id, miles = truck.miles_traveled))
+    
+    # Packages this truck can deliver on this trip
+    deliverable = []
+    for package_id in truck.packages:
+        package = context.package_hash.get(package_id)
+
+        # Skip packages that aren't ready yet (delayed or waiting on an address correction)
+        ready_time = package_ready_time(package_id, context)
+        if ready_time is not None and ready_time > check_time:
+            continue
+
+        # Skip packages restricted to another truck
+        if context.package_constraints[package_id].truck_id not in (None, truck.truck_id):
+            continue
+
+        deliverable.append(package)
+
+    # Plan the whole trip once. Packages that must be delivered together are all on this truck, so they are simply routed with everything else.
+    distance_table = context.distance_table
+    start_index = distance_table.index_of(truck.current_location)
+    # The local search is capped by moves, not seconds, so the day's routes don't depend on how busy the machine is
+    route = plan_route(deliverable, distance_table, start_index, minutes_of(truck.time), distance_table.index_of(HUB_ADDRESS),
+                       truck.speed_mph, address_of = state.address_of, max_moves = MAX_MOVES)
+
+    current_index = start_index
+    for stop in route:
+        # Drive to the next stop
+        truck.add_miles(distance_table.distance(current_index, stop.address_index))
+        current_index = stop.address_index
+        truck.current_location = distance_table.addresses[current_index]
+        arrival_time = truck.time
+
+        # Deliver every package for this address
+        for package_id in stop.package_ids:
+            state.deliver(package_id, truck.truck_id, minutes_of(arrival_time), start_minutes)
+            if package_id in truck.packages:
+                truck.packages.remove(package_id)
+            if timeline is not None:
+                timeline.record(Event(arrival_time, DELIVERY, truck.truck_id, package_id, truck.miles_traveled))
 
     # Drive back to the Hub if finished early
     if truck.time < check_time and truck.current_location != HUB_ADDRESS:
-        distance_to_hub = get_distance(truck.current_location, HUB_ADDRESS)
+        distance_to_hub = distance_table.distance_between(truck.current_location, HUB_ADDRESS)
         truck.add_miles(distance_to_hub)
         truck.current_location = HUB_ADDRESS
+        if timeline is not None:
+            timeline.record(Event(truck.time, HUB_RETURN, truck.truck_id, miles = truck.miles_traveled))
+
+# Simulate the day up to check_time with fresh copies of the trucks, returns (state, trucks)
+# Pass a forked state to start a what-if run from an existing one. Nothing shared is modified, so several runs can go at once.
+def simulate_day(check_time, state = None, timeline = None, context = None):
+    if context is None:
+        context = app.load()
+    if state is None:
+        state = SimulationState(max(package_id for package_id, package in context.package_hash.items()) + 1)
+    run_trucks = [Truck(truck.truck_id, context.truck_departures[truck.truck_id], list(context.truck_loads.get(truck.truck_id, [])), truck.speed_mph)
+                  for truck in context.fleet]
+    for truck in run_trucks:
+        deliver_packages(truck, check_time, state, timeline, context)
+    return state, run_trucks
 
 ''' WGUPS delivery program user interface loops through many options until the user selects option 4- Exit program. Depending on the user's choice, the main_menu function calls other functions for package status lookups, single package search, or total miles calculation.
 '''
@@ -250,10 +300,11 @@ def main_menu():
         print("**************************************")
         print("1. View all package statuses at a specific time")
         print("2. Look up package by ID and time")
-        print("3. Exit program")
+        print("3. View packages at risk of missing their deadline at a specific time")
+        print("4. Exit program")
         print("**************************************")
 
-        choice = input("Enter your choice (1-3): ")
+        choice = input("Enter your choice (1-4): ")
 
         if choice == "1":
             time_str = input("Enter time (HH:MM:SS or HH:MM): ")
@@ -263,22 +314,87 @@ def main_menu():
             package_id = int(input("Enter package ID # to look up: "))
             lookup_package(package_id, time_str)
         elif choice == "3":
+            time_str = input("Enter time (HH:MM:SS or HH:MM): ")
+            show_at_risk_packages(time_str)
+        elif choice == "4":
             print("Exiting program. Goodbye!")
             break
         else:
             print("Please enter a valid choice.\n")
 
-# Function to parse time
-def parse_time_input(time_str):
-    try:
-        return datetime.strptime(time_str, "%H:%M:%S")
-    except ValueError:
+# Function to parse time, None if time_str is neither HH:MM:SS nor HH:MM
+def parse_clock(time_str):
+    for time_format in ("%H:%M:%S", "%H:%M"):
         try:
-            return datetime.strptime(time_str, "%H:%M")
+            return datetime.strptime(time_str, time_format)
         except ValueError:
-            print("Invalid time format. Please enter time as HH:MM or HH:MM:SS.\n")
-            return None
+            continue
+    return None
 
+# Function to parse time typed into the menu, tells the user when it can't be read
+def parse_time_input(time_str):
+    check_time = parse_clock(time_str)
+    if check_time is None:
+        print("Invalid time format. Please enter time as HH:MM or HH:MM:SS.\n")
+    return check_time
+
+# The delivery day is simulated once into an event log (see timeline.py), every status query after that is a lookup/binary search on the log
+def get_day_timeline():
+    # Simulate the whole day once (up to end_of_day) and keep the event log in the app context for all later queries
+    app.load()
+    if app.day_timeline is None:
+        timeline = Timeline()
+        record_day(timeline)
+        app.day_timeline = timeline
+    return app.day_timeline
+
+# Simulate the whole day into timeline: a Timeline, or anything taking the same record/assign/finalize calls (e.g. journal.JournalWriter)
+def record_day(timeline, context = None):
+    if context is None:
+        context = app.load()
+    simulate_day(end_of_day, timeline = timeline, context = context)
+    for package_id, (correction_minutes, address, city, state, zip_code) in context.address_corrections.items():
+        timeline.record(Event(time_of(correction_minutes), ADDRESS_CORRECTION, package_id = package_id,
+                              address = address, previous_address = context.package_hash.get(package_id).address))
+    timeline.finalize()
+
+# Determine the status of a package at check_time from the day's event log
+# Returns the status text, the truck ID (None if the package hasn't left the hub), the scheduled delivery time (None if not on a truck yet), and the address on file at check_time
+def package_status(package, check_time, timeline, context = None):
+    if context is None:
+        context = app
+    package_id = package.package_id
+    truck_id, departure_time = timeline.departure(package_id)
+    if departure_time is None or departure_time > check_time:
+        truck_id = None # Truck hasn't left the hub with this package yet
+    delivery_time = timeline.delivery(package_id)[1] if truck_id is not None else None
+
+    ready_time = package_ready_time(package_id, context)
+    if ready_time is not None and ready_time > check_time:
+        # Delayed package logic
+        if context.package_constraints[package_id].wrong_address:
+            status = f"DELAYED - Address correction at {ready_time.strftime('%H:%M')}"
+        else:
+            status = f"DELAYED - Available at {ready_time.strftime('%H:%M')}"
+    elif delivery_time is not None and delivery_time < check_time:
+        # Package already delivered
+        status = f"DELIVERED at {delivery_time.strftime('%H:%M:%S')}"
+    elif truck_id is None:
+        # Truck hasn't left yet or package is not yet assigned to a truck
+        status = "AT HUB"
+    else:
+        # Truck has left and package is en route for delivery
+        status = "EN ROUTE"
+
+    address = timeline.address_at(package_id, check_time, package.address)
+    return status, truck_id, delivery_time, address
+
+# Print the mileage of each truck and the total at check_time
+def print_mileage_summary(check_time, timeline):
+    print(f"\n*********** TRUCK MILEAGE SUMMARY at {check_time.strftime('%H:%M:%S')} ***********")
+    for truck_id in timeline.truck_ids():
+        print(f"Truck {truck_id} mileage: {timeline.truck_miles_at(truck_id, check_time):.2f} miles")
+    print(f"\nTotal miles traveled by all trucks at {check_time.strftime('%H:%M:%S')}: {timeline.total_miles_at(check_time):.2f}")
 
 # Function to display all package statuses at a specific time
 def view_all_packages(time_str):
@@ -286,61 +402,25 @@ def view_all_packages(time_str):
     if not check_time:
         return
     
-    # Reset trucks and simulate deliveries up to the time selected by user
-    reset_trucks()
-    deliver_packages(truck1, check_time)
-    deliver_packages(truck2, check_time)
-    deliver_packages(truck3, check_time)
+    timeline = get_day_timeline()
 
     print(f"\nPackage statuses at {check_time.strftime('%H:%M:%S')}")
 
     for package_id in range(1, 41):
-        package = package_hash.get(package_id)
-
-        # Determine the status of package
-        if package_id in delayed_package_ready_time and delayed_package_ready_time[package_id] > check_time:
-            # Delayed package logic
-            if package_id == 9:
-                status = f"DELAYED - Address correction at 10:20"
-            else:
-                ready_time = delayed_package_ready_time[package_id].strftime('%H:%M')
-                status = f"DELAYED - Available at {ready_time}"
-
-        elif package.time_delivered < check_time:
-            # Package already delivered
-            status = f"DELIVERED at {package.time_delivered.strftime('%H:%M:%S')}"
-
-        elif package.truck_departure_time > check_time or package.truck_id is None:
-            # Truck hasn't left yet or package is not yet assigned to a truck
-            status = "AT HUB"
-
-        else:
-            # Truck has left and package is en route for delivery
-            status = "EN ROUTE"
-
-        # For package 9, only update address after 10:20
-        if package.package_id == 9 and check_time < datetime.strptime("10:20:00", "%H:%M:%S"):
-            package.address = "300 State St" # Wrong address before correction
-        else:
-            package.address = package.address # Corrected address
+        package = app.package_hash.get(package_id)
+        status, truck_id, delivery_time, address = package_status(package, check_time, timeline)
 
         print(f"\n*********** Package {package.package_id} ***********")
-        print(f"Address: {package.address} | " 
+        print(f"Address: {address} | " 
               f"Deadline: {package.delivery_deadline} | " 
-              f"Truck: {package.truck_id if package.truck_id else 'Not assigned'} | " 
-              f"Delivery Time: {package.time_delivered.strftime('%H:%M:%S') if package.time_delivered != datetime.max else 'N/A'} | " 
-              f"Weight (in kilos): {package.weight_kilo} | "
+              f"Truck: {truck_id if truck_id else 'Not assigned'} | " 
+              f"Delivery Time: {delivery_time.strftime('%H:%M:%S') if delivery_time else 'N/A'} | " 
+              f"Weight (in kilos): {package.weight_kilo:g} | "
               f"Special Notes: {package.special_notes} | "
               f"Status: {status}\n")
 
     # Total mileage for this time
-    total_miles = truck1.miles_traveled + truck2.miles_traveled + truck3.miles_traveled
-
-    print(f"\n*********** TRUCK MILEAGE SUMMARY at {check_time.strftime('%H:%M:%S')} ***********")
-    print(f"Truck 1 mileage: {truck1.miles_traveled:.2f} miles")
-    print(f"Truck 2 mileage: {truck2.miles_traveled:.2f} miles")
-    print(f"Truck 3 mileage: {truck3.miles_traveled:.2f} miles")
-    print(f"\nTotal miles traveled by all trucks at {check_time.strftime('%H:%M:%S')}: {total_miles:.2f}")
+    print_mileage_summary(check_time, timeline)
 
 # Function to look up a single package status
 # This function displays the delivery status of a specific package (by package ID) at a time specified by the user.
@@ -349,105 +429,243 @@ def lookup_package(package_id, time_str):
     if not check_time:
         return
     
-    # Reset trucks and simulate deliveries up to time specified by user
-    reset_trucks()
-    deliver_packages(truck1, check_time)
-    deliver_packages(truck2, check_time)
-    deliver_packages(truck3, check_time)
+    timeline = get_day_timeline()
 
-    package = package_hash.get(package_id)
+    package = app.package_hash.get(package_id)
 
     if not package:
         print(f"Package {package_id} not found.")
         return
     
     # Determine status of a package
-    if package_id in delayed_package_ready_time and delayed_package_ready_time[package_id] > check_time:
-        if package_id == 9:
-            status = f"DELAYED - Address correction at 10:20"
-        else:
-            ready_time = delayed_package_ready_time[package_id].strftime('%H:%M')
-            status = f"DELAYED - Available at {ready_time}"
-    elif package.time_delivered < check_time:
-        status = f"DELIVERED at {package.time_delivered.strftime('%H:%M:%S')}"
-    elif package.truck_departure_time > check_time or package.truck_id is None:
-        status = "AT HUB"
-    else:
-        status = "EN ROUTE"
-
-    # For package 9, only update address after 10:20
-    if package_id == 9 and check_time < datetime.strptime("10:20:00", "%H:%M:%S"):
-        address = "300 State St" # Original incorrect address
-    else:
-        address = package.address
+    status, truck_id, delivery_time, address = package_status(package, check_time, timeline)
 
     # Print results for package number specified by user
     print(f"\n*********** Package {package.package_id} ***********")
     print(f"Address: {address} | " 
           f"Deadline: {package.delivery_deadline} | "
-          f"Truck: {package.truck_id if package.truck_id else 'Not assigned'} | "
-          f"Weight (in kilos): {package.weight_kilo} | "
+          f"Truck: {truck_id if truck_id else 'Not assigned'} | "
+          f"Weight (in kilos): {package.weight_kilo:g} | "
           f"Special Notes: {package.special_notes} | "
           f"Status: {status}\n"
           )
     
     # Print total mileage for this time
-    total_miles = truck1.miles_traveled + truck2.miles_traveled + truck3.miles_traveled
-    print(f"\n*********** TRUCK MILEAGE SUMMARY at {check_time.strftime('%H:%M:%S')} ***********")
-    print(f"Truck 1 mileage: {truck1.miles_traveled:.2f} miles")
-    print(f"Truck 2 mileage: {truck2.miles_traveled:.2f} miles")
-    print(f"Truck 3 mileage: {truck3.miles_traveled:.2f} miles")
-    print(f"\nTotal miles traveled by all trucks at {check_time.strftime('%H:%M:%S')}: {total_miles:.2f}")
-
-def reset_trucks():
-    # Reset trucks to initial state with original package assignments
-    truck1.time = truck1.start_time
-    truck2.time = truck2.start_time
-    truck3.time = truck3.start_time
-    truck1.miles_traveled = 0.0
-    truck2.miles_traveled = 0.0
-    truck3.miles_traveled = 0.0
-    truck1.current_location = HUB_ADDRESS
-    truck2.current_location = HUB_ADDRESS
-    truck3.current_location = HUB_ADDRESS
-
-    # Reload original package truck assignments
-    truck1.packages = [1, 7, 8, 13, 14, 15, 16, 19, 20, 29, 30, 31, 34, 37, 40]
-    truck2.packages = [3, 5, 10, 11, 12, 17, 18, 21, 22, 23, 24, 25, 36, 38]
-    truck3.packages = [2, 4, 9, 26, 27, 32, 33, 35, 39]
-
-    # Reset package delivery statuses
-    for package_id in range(1, 41):
-        package = package_hash.get(package_id)
-        package.time_delivered = datetime.max
-        package.truck_departure_time = datetime.min
-        package.truck_id = None 
+    print_mileage_summary(check_time, timeline)
+
+# Function to list the timed-deadline packages that are still undelivered at a specific time and will be late or close to late
+# Only packages in the deadline index are checked, so the report doesn't scale with the EOD bulk of the manifest
+def show_at_risk_packages(time_str):
+    check_time = parse_time_input(time_str)
+    if not check_time:
+        return
+
+    timeline = get_day_timeline()
+    now = minutes_of(check_time)
+
+    # Index of just the packages still open at check_time, with their planned arrival times
+    open_packages = DeadlineIndex()
+    arrivals = {}
+    for package_id in app.deadline_index.due_before(EOD_MINUTES):
+        delivery_time = timeline.delivery(package_id)[1]
+        if delivery_time is not None and delivery_time < check_time:
+            continue # Already delivered
+        open_packages.add(package_id, app.deadline_index.item_deadline[package_id], app.deadline_index.item_truck.get(package_id))
+        arrivals[package_id] = minutes_of(delivery_time) if delivery_time is not None else None
+
+    print(f"\n*********** PACKAGES AT RISK at {check_time.strftime('%H:%M:%S')} ***********")
+    at_risk = 0
+    for package_id in open_packages.due_before(EOD_MINUTES):
+        package = app.package_hash.get(package_id)
+        arrival = arrivals[package_id]
+        slack = package.deadline_minutes - (arrival if arrival is not None else now)
+        if slack >= AT_RISK_MINUTES:
+            continue
+        at_risk += 1
+        planned = time_of(arrival).strftime('%H:%M:%S') if arrival is not None else "Not scheduled"
+        status = "LATE" if slack < 0 else f"{slack:.0f} min to spare"
+        print(f"Package {package_id} | Deadline: {package.delivery_deadline} | Truck: {open_packages.item_truck.get(package_id)} | "
+              f"Planned Delivery: {planned} | {status}")
+    if at_risk == 0:
+        print("No packages at risk.")
+
+    # Tightest remaining deadline on each truck
+    scheduled = {package_id: arrival for package_id, arrival in arrivals.items() if arrival is not None}
+    for truck in app.fleet:
+        slack = open_packages.earliest_slack(truck.truck_id, now, scheduled)
+        if slack is not None:
+            print(f"Truck {truck.truck_id} earliest slack: {slack:.0f} minutes")
 
 # Function to calculate total miles traveled by all trucks at a specific time provided by the user.
 def show_total_miles(time_str):
     check_time = parse_time_input(time_str)
     if not check_time:
         return
-    
-    # Reset the trucks and package status
-    reset_trucks() 
 
-    # Simulate deliveries up to the check_time time
-    deliver_packages(truck1, check_time)
-    deliver_packages(truck2, check_time)
-    deliver_packages(truck3, check_time)
-
-    total_miles = truck1.miles_traveled + truck2.miles_traveled + truck3.miles_traveled
+    total_miles = get_day_timeline().total_miles_at(check_time)
     print(f"\nTotal miles traveled by all trucks at {check_time.strftime('%H:%M:%S')}: {total_miles:.2f}\n")
 
-# Load data from CSV files
-load_address_file("wgups_address_file.csv")
-load_distance_table("wgups_distance_table.csv")
-load_package_data("wgups_package_file.csv")
+# Batch query mode: status records for many (time, package) pairs without the menu, e.g.
+#   python main.py query --times 09:00,10:00,12:00 --packages 1-40 --format jsonl
+# The day is simulated once, the per-package fields (truck, deadline, formatted times) are worked out once per package instead of once per query,
+# and the records are written in blocks through a buffered writer.
+
+QUERY_FIELDS = ["time", "package_id", "status", "truck_id", "delivery_time", "address", "deadline"]
+QUERY_BLOCK = 4096 # Records per write
+
+# Turn "09:00,12:30:15" into a list of check times, raises ValueError naming the bad part
+def parse_check_times(text):
+    check_times = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        check_time = parse_clock(part)
+        if check_time is None:
+            raise ValueError(f"invalid time '{part}' (expected HH:MM or HH:MM:SS)")
+        check_times.append(check_time)
+    if not check_times:
+        raise ValueError("no check times given")
+    return check_times
+
+# Turn "1-40,45,50-60" into a list of package IDs, raises ValueError naming the bad part
+def parse_id_ranges(text):
+    package_ids = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        last = last or first
+        if not (first.strip().isdigit() and last.strip().isdigit()) or int(last) < int(first):
+            raise ValueError(f"invalid package ID or range '{part}' (expected IDs and ranges like 1-40,45)")
+        package_ids.extend(range(int(first), int(last) + 1))
+    return package_ids
+
+# Yield one status record (a list in QUERY_FIELDS order) for every check time and package ID
+def status_records(check_times, package_ids, timeline, context = None):
+    if context is None:
+        context = app
+    # Fields that don't depend on the check time, worked out once per package
+    package_info = []
+    for package_id in package_ids:
+        package = context.package_hash.get(package_id)
+        if package is None:
+            package_info.append((package_id, None))
+            continue
+        truck_id, departure_time = timeline.departure(package_id)
+        delivery_time = timeline.delivery(package_id)[1]
+        ready_time = package_ready_time(package_id, context)
+        if ready_time is not None:
+            reason = "Address correction" if context.package_constraints[package_id].wrong_address else "Available"
+            delayed_status = f"DELAYED - {reason} at {ready_time.strftime('%H:%M')}"
+        else:
+            delayed_status = None
+        package_info.append((package_id, (package, truck_id, departure_time, delivery_time,
+                                          delivery_time.strftime('%H:%M:%S') if delivery_time else None, ready_time, delayed_status)))
+
+    for check_time in check_times:
+        time_text = check_time.strftime('%H:%M:%S')
+        for package_id, info in package_info:
+            if info is None:
+                yield [time_text, package_id, "NOT FOUND", None, None, None, None]
+                continue
+            package, truck_id, departure_time, delivery_time, delivery_text, ready_time, delayed_status = info
+            if departure_time is None or departure_time > check_time:
+                truck_id = delivery_time = delivery_text = None # Not on a truck yet
+            if ready_time is not None and ready_time > check_time:
+                status = delayed_status
+            elif delivery_time is not None and delivery_time < check_time:
+                status = f"DELIVERED at {delivery_text}"
+            elif truck_id is None:
+                status = "AT HUB"
+            else:
+                status = "EN ROUTE"
+            address = timeline.address_at(package_id, check_time, package.address)
+            yield [time_text, package_id, status, truck_id, delivery_text, address, package.delivery_deadline]
+
+# Write the records as JSON lines or CSV, a block of QUERY_BLOCK records per write call
+def write_records(records, output_format, out_file):
+    if output_format == "csv":
+        writer = csv.writer(out_file)
+        writer.writerow(QUERY_FIELDS)
+        block = []
+        for record in records:
+            block.append(record)
+            if len(block) == QUERY_BLOCK:
+                writer.writerows(block)
+                block.clear()
+        writer.writerows(block)
+    else:
+        block = []
+        for record in records:
+            block.append(json.dumps(dict(zip(QUERY_FIELDS, record))))
+            if len(block) == QUERY_BLOCK:
+                block.append("")
+                out_file.write("\n".join(block))
+                block.clear()
+        if block:
+            block.append("")
+            out_file.write("\n".join(block))
+
+# Command line entry point for the batch query mode (arguments after "query")
+def run_query(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "main.py query", description = "Print package statuses at one or more times without the menu")
+    parser.add_argument("--times", required = True, help = "comma-separated check times (HH:MM or HH:MM:SS)")
+    parser.add_argument("--packages", default = None, help = "package IDs and ranges, e.g. 1-40,45 (default every package)")
+    parser.add_argument("--format", choices = ["jsonl", "csv"], default = "jsonl")
+    parser.add_argument("--output", help = "write to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        check_times = parse_check_times(args.times)
+    except ValueError as error:
+        parser.error(f"--times: {error}")
+    app.load()
+    if args.packages:
+        try:
+            package_ids = parse_id_ranges(args.packages)
+        except ValueError as error:
+            parser.error(f"--packages: {error}")
+    else:
+        package_ids = sorted(package_id for package_id, package in app.package_hash.items())
 
-# Simulate the delivery day
-end_of_day = datetime.strptime("17:00:00", "%H:%M:%S") 
+    records = status_records(check_times, package_ids, get_day_timeline())
+    if args.output:
+        with open(args.output, 'w', newline = '', encoding = 'utf-8', buffering = 1 << 20) as out_file:
+            write_records(records, args.format, out_file)
+    else:
+        return print_records(records, args.format)
+    return 0
+
+# Write the records to stdout, returns the exit code
+# A reader that stops early (e.g. piping into head) is not an error: the rest of the output is dropped instead of raising BrokenPipeError
+def print_records(records, output_format):
+    try:
+        write_records(records, output_format, sys.stdout)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Point stdout at devnull so Python's own flush at exit doesn't fail on the closed pipe again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    return 0
 
 # Start the command line program
+# Optional counters and timers (WGUPS_PROFILE=<file> or --profile <file>, see instrumentation.py), nothing is wrapped when neither is given
 if __name__ == "__main__":
+    profile_target = None
+    if "--profile" in sys.argv or os.environ.get("WGUPS_PROFILE"):
+        import instrumentation
+        profile_target = instrumentation.profile_target(sys.argv)
+    if profile_target:
+        this_module = sys.modules[__name__]
+        instrumentation.enable(profile_target, [(this_module, "package_status", "query.package_status"),
+                                                (this_module, "status_records", "query.status_records"),
+                                                (this_module, "get_day_timeline", "query.get_day_timeline"),
+                                                (this_module, "view_all_packages", "menu.view_all_packages"),
+                                                (this_module, "lookup_package", "menu.lookup_package")])
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        sys.exit(run_query(sys.argv[2:]))
     main_menu()
\ No newline at end of file
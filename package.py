@@ -1,7 +1,48 @@
 # Create Package class to hold data from WGUPS package file (wgups_package_file.csv)
 
-class Package: 
-    def __init__(self, package_id, address, city, state, zip_code, delivery_deadline, weight_kilo, special_notes): 
+import sys
+
+# "EOD" deadlines sort after every timed deadline (23:59, same fallback the router uses)
+EOD_MINUTES = 23 * 60 + 59
+
+def parse_deadline(deadline):
+    '''
+    Convert a deadline string from the package file into minutes since midnight.
+    Accepts "10:30 AM", "9:00 PM", "EOD", "HH:MM" and "HH:MM:SS". Integers are treated as already-parsed minutes.
+    '''
+    if isinstance(deadline, int):
+        return deadline
+    text = deadline.strip().upper()
+    if text in ("", "EOD"):
+        return EOD_MINUTES
+    suffix = None
+    if text.endswith("AM") or text.endswith("PM"):
+        suffix = text[-2:]
+        text = text[:-2].strip()
+    parts = text.split(":")
+    hours = int(parts[0])
+    minutes = int(parts[1]) if len(parts) > 1 else 0
+    if suffix == "PM" and hours != 12:
+        hours += 12
+    elif suffix == "AM" and hours == 12:
+        hours = 0
+    return hours * 60 + minutes
+
+def format_deadline(minutes):
+    # Minutes since midnight back to the package file's format ("10:30 AM" or "EOD")
+    if minutes >= EOD_MINUTES:
+        return "EOD"
+    hours = minutes // 60
+    suffix = "AM" if hours < 12 else "PM"
+    return f"{(hours - 1) % 12 + 1}:{minutes % 60:02d} {suffix}"
+
+class Package:
+    # Packages are the day's manifest and aren't changed by the simulation, delivery status for a run lives in a SimulationState (see simulation_state.py)
+    # __slots__ drops the per-instance __dict__, which is most of the memory of a small object like this one
+    __slots__ = ("package_id", "address", "city", "state", "zip_code", "delivery_deadline", "deadline_minutes",
+                 "weight_kilo", "special_notes", "address_index")
+
+    def __init__(self, package_id, address, city, state, zip_code, delivery_deadline, weight_kilo, special_notes):
         '''
         Initalize a Package object with these parameters:
         self
@@ -10,29 +51,32 @@ class Package:
         city: City of delivery location
         state: State of delivery location
         zip_code: Zip code of delivery location
-        delivery_deadline: deadline for the package delivery (specific time deadline or by end of day/EOD)
+        delivery_deadline: deadline for the package delivery (specific time deadline or by end of day/EOD), parsed once into deadline_minutes (minutes since midnight)
+        weight_kilo: package weight, stored as a float
         special_notes: Note with delivery constraints (needs to be on specific truck or part of a multi-package delivery, etc.)
         '''
         self.package_id = int(package_id) # Store each package as an integer for easy hashing
         self.address = address
-        self.city = city
-        self.state = state
-        self.zip_code = zip_code
-        self.delivery_deadline = delivery_deadline
-        self.weight_kilo = weight_kilo
+        # City, state and zip repeat across thousands of packages, interning keeps one shared copy of each string
+        self.city = sys.intern(city.strip())
+        self.state = sys.intern(state.strip())
+        self.zip_code = sys.intern(str(zip_code).strip())
+        self.deadline_minutes = parse_deadline(delivery_deadline)
+        # Original text, kept for display
+        self.delivery_deadline = delivery_deadline if isinstance(delivery_deadline, str) else format_deadline(self.deadline_minutes)
+        self.weight_kilo = float(weight_kilo)
         self.special_notes = special_notes
-        self.time_delivered = None 
-        self.truck_departure_time = None 
+        self.address_index = None # Row of the distance table for address, filled in once at load time (see addresses.AddressIndex.resolve_packages)
 
-# Create and initalize a string containing the details of a Package object to print package details to command line interface. 
+# Create and initalize a string containing the details of a Package object to print package details to command line interface.
     def __str__(self):
         return (
             #Print package ID and address information on first list
             #Print delivery deadline, package weight, and notes on second line
             f"Address: {self.address}, City: {self.city}, State: {self.state}, Zip Code: {self.zip_code}\n"
-            f"Delivery Deadline: {self.delivery_deadline}, Weight (in kilo): {self.weight_kilo}, Special Notes: {self.special_notes}"
+            f"Delivery Deadline: {self.delivery_deadline}, Weight (in kilo): {self.weight_kilo:g}, Special Notes: {self.special_notes}"
             )
-    
+
 # Output human readable package information, not object references!
 def print(self):
     print('---WGUPS PACKAGE HASH TABLE---')
@@ -40,4 +84,4 @@ def print(self):
         if item is not None:
             for pair in item:
                 print(f"Package ID: {pair[0]}, Data: {pair[1]}")
-    
+
@@ -0,0 +1,126 @@
+# Create class PackageStore, an optional columnar store for large manifests
+# Each field is kept in its own typed array indexed by package ID, so a six-figure manifest costs a few bytes per package per field instead of one Python object per package.
+# loader.load_package_store fills one from a package file. It has the same add/get/items/len/in calls as the package HashTable,
+# but get() builds a new Package on each call (address_index not set), so it answers lookups and scans, it doesn't replace the day's Package objects.
+
+from array import array
+from itertools import compress, repeat
+from operator import eq, lt, le
+from package import Package, parse_deadline
+
+NO_DEADLINE = 0xFFFF # Deadline stored in empty slots, later than any real deadline
+
+class PackageStore:
+    def __init__(self, capacity = 0):
+        '''
+        Initialize an empty PackageStore.
+        capacity: number of package ID slots to preallocate (the store grows automatically past it)
+
+        Columns (all indexed by package_id):
+        present: 1 if a package with this ID was added
+        deadline_minutes: delivery deadline as minutes since midnight
+        weight_kilo: package weight
+        address_id / city_id / state_id / zip_id / notes_id: indexes into the shared string table below (zips stay strings, e.g. "84115-1234" or "02134")
+        '''
+        self.count = 0
+        self.present = array('b')
+        self.deadline_minutes = array('H')
+        self.weight_kilo = array('d')
+        self.address_id = array('I')
+        self.city_id = array('I')
+        self.state_id = array('I')
+        self.zip_id = array('I')
+        self.notes_id = array('I')
+
+        # Each distinct string is stored once, the columns hold its index. Empty slots point at "" (string 0).
+        self.strings = []
+        self.string_ids = {}
+        self._string_id("")
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        extra = capacity - len(self.present)
+        if extra <= 0:
+            return
+        self.present.extend(bytes(extra))
+        self.deadline_minutes.extend(repeat(NO_DEADLINE, extra))
+        for column in (self.address_id, self.city_id, self.state_id, self.zip_id, self.notes_id):
+            column.extend(repeat(0, extra))
+        self.weight_kilo.extend(repeat(0.0, extra))
+
+    def _string_id(self, text):
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self.string_ids[text] = string_id
+        return string_id
+
+    def add_fields(self, package_id, address, city, state, zip_code, delivery_deadline, weight_kilo, special_notes):
+        # Add or overwrite one package, same arguments as Package()
+        if package_id >= len(self.present):
+            self._grow(max(package_id + 1, len(self.present) * 2))
+        if not self.present[package_id]:
+            self.count += 1
+        self.present[package_id] = 1
+        self.deadline_minutes[package_id] = parse_deadline(delivery_deadline)
+        self.weight_kilo[package_id] = float(weight_kilo)
+        self.address_id[package_id] = self._string_id(address.strip())
+        self.city_id[package_id] = self._string_id(city.strip())
+        self.state_id[package_id] = self._string_id(state.strip())
+        self.zip_id[package_id] = self._string_id(str(zip_code).strip())
+        self.notes_id[package_id] = self._string_id(special_notes)
+
+    def add(self, package_id, package):
+        # Copy a Package object into the store, same call as HashTable.add(package_id, package)
+        self.add_fields(package_id, package.address, package.city, package.state, package.zip_code,
+                        package.deadline_minutes, package.weight_kilo, package.special_notes)
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, package_id):
+        return 0 <= package_id < len(self.present) and self.present[package_id] == 1
+
+    def get(self, package_id):
+        # Build a Package object for one ID (None if missing), for code that still wants the object view
+        if package_id not in self:
+            return None
+        strings = self.strings
+        return Package(package_id, strings[self.address_id[package_id]], strings[self.city_id[package_id]],
+                       strings[self.state_id[package_id]], strings[self.zip_id[package_id]],
+                       self.deadline_minutes[package_id], self.weight_kilo[package_id], strings[self.notes_id[package_id]])
+
+    def package_ids(self):
+        # All package IDs in the store, in order
+        return list(compress(range(len(self.present)), self.present))
+
+    def items(self):
+        # (package_id, Package) pairs in ID order, like HashTable.items()
+        for package_id in self.package_ids():
+            yield package_id, self.get(package_id)
+
+    def due_before(self, minutes, inclusive = False):
+        '''
+        All package IDs with a deadline before `minutes` (minutes since midnight), e.g. due_before(10 * 60 + 30).
+        The comparison runs over the whole deadline column with map/compress, which loop in C instead of Python bytecode.
+        Empty slots hold NO_DEADLINE, so they never match.
+        '''
+        compare = le if inclusive else lt
+        return list(compress(range(len(self.deadline_minutes)), map(compare, self.deadline_minutes, repeat(minutes))))
+
+    def total_weight(self, package_ids = None):
+        # Total weight of the given packages (all packages if none given)
+        if package_ids is None:
+            return sum(self.weight_kilo)
+        weights = self.weight_kilo
+        return sum(weights[package_id] for package_id in package_ids)
+
+    def in_zip(self, zip_code):
+        # All package IDs delivered to one zip code, compared as text ("84115" does not match "84115-1234")
+        zip_id = self.string_ids.get(str(zip_code).strip())
+        if zip_id is None:
+            return []
+        matches = compress(range(len(self.zip_id)), map(eq, self.zip_id, repeat(zip_id)))
+        return [package_id for package_id in matches if self.present[package_id]] # Empty slots point at "" too
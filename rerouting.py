@@ -0,0 +1,169 @@
+# Incremental re-routing of a truck that is already out on its route
+# When a package is added to a truck, has its address corrected or is cancelled, only the affected stop changes.
+# Added or moved packages go into the cheapest gap of the remaining route that keeps every deadline (cheapest insertion).
+# Removed stops are spliced out. The rest of the route keeps its order, it is not re-optimized from scratch.
+# Arrival times and the deadline slack behind every stop are cached, so checking one gap is O(1) and an update costs O(remaining stops).
+
+from package import EOD_MINUTES
+from routing import Stop, TRUCK_SPEED_MPH
+
+class LiveRoute:
+    def __init__(self, distance_table, truck_id, position_index, clock_minutes, stops, end_index, speed_mph = TRUCK_SPEED_MPH, package_deadlines = None):
+        '''
+        In-progress route of one truck:
+        truck_id: truck driving the route
+        position_index: address index the truck is at (or last left)
+        clock_minutes: time the truck is at/left position_index, minutes since midnight
+        stops: remaining Stops in delivery order (the list is copied, the Stops are not)
+        end_index: where the truck finishes, usually the hub
+        package_deadlines: package_id -> deadline minutes, defaults to each stop's deadline for its packages
+        '''
+        self.distance_table = distance_table
+        self.truck_id = truck_id
+        self.position_index = position_index
+        self.clock_minutes = clock_minutes
+        self.stops = list(stops)
+        self.end_index = end_index
+        self.minutes_per_mile = 60 / speed_mph
+        self.locked = 0 # 1 while the truck is driving to stops[0], nothing can be inserted before it
+        self.package_stops = {} # package_id -> Stop it is delivered at
+        self.package_deadlines = {}
+        for stop in self.stops:
+            for package_id in stop.package_ids:
+                self.package_stops[package_id] = stop
+                self.package_deadlines[package_id] = package_deadlines[package_id] if package_deadlines else stop.deadline_minutes
+        self._retime()
+
+    def _retime(self):
+        # Recompute the arrival time at every remaining stop and slack[i], the most stops i.. can be delayed without missing a deadline
+        distance = self.distance_table.distance
+        arrivals = []
+        clock = self.clock_minutes
+        current = self.position_index
+        for stop in self.stops:
+            clock += distance(current, stop.address_index) * self.minutes_per_mile
+            arrivals.append(clock)
+            current = stop.address_index
+        slack = [0.0] * (len(self.stops) + 1)
+        slack[-1] = float("inf")
+        for i in range(len(self.stops) - 1, -1, -1):
+            slack[i] = min(slack[i + 1], self.stops[i].deadline_minutes - arrivals[i])
+        self.arrivals = arrivals
+        self.slack = slack
+
+    def miles_remaining(self):
+        # Miles left on the route, including the drive to end_index
+        distance = self.distance_table.distance
+        route = [self.position_index] + [stop.address_index for stop in self.stops] + [self.end_index]
+        return sum(distance(route[i], route[i + 1]) for i in range(len(route) - 1))
+
+    def late_stops(self):
+        # Remaining stops that will miss their deadline on the current plan
+        return [stop for stop, arrival in zip(self.stops, self.arrivals) if arrival > stop.deadline_minutes]
+
+    def advance_to(self, minutes):
+        '''
+        Move the truck along its route up to `minutes`.
+        Returns the Stops delivered since the last call. If the truck is between stops at `minutes`, the stop it is driving to is locked in place.
+        The position is always the last completed stop, and once the route is done the clock moves on to `minutes`.
+        '''
+        delivered = 0
+        while delivered < len(self.stops) and self.arrivals[delivered] <= minutes:
+            delivered += 1
+        if delivered:
+            done = self.stops[:delivered]
+            self.position_index = done[-1].address_index
+            self.clock_minutes = self.arrivals[delivered - 1]
+            del self.stops[:delivered]
+            for stop in done:
+                for package_id in stop.package_ids:
+                    del self.package_stops[package_id]
+                    del self.package_deadlines[package_id]
+            self._retime()
+        else:
+            done = []
+        if self.stops and minutes > self.clock_minutes:
+            self.locked = 1 # Driving to stops[0], timed from when it left position_index (clock_minutes), so that arrival still holds
+        else:
+            self.locked = 0
+            if minutes > self.clock_minutes:
+                # Every stop is done, the truck waits at its last stop, anything added from now on leaves from there at `minutes`
+                self.clock_minutes = minutes
+                self._retime()
+        return done
+
+    def _best_gap(self, address_index, deadline_minutes):
+        # (position, added miles, on time) of the cheapest gap for a new stop, on-time gaps are preferred over late ones
+        distance = self.distance_table.distance
+        minutes_per_mile = self.minutes_per_mile
+        best = None
+        previous = self.position_index if self.locked == 0 else self.stops[0].address_index
+        clock = self.clock_minutes if self.locked == 0 else self.arrivals[0]
+        for position in range(self.locked, len(self.stops) + 1):
+            following = self.stops[position].address_index if position < len(self.stops) else self.end_index
+            to_new = distance(previous, address_index)
+            added = to_new + distance(address_index, following) - distance(previous, following)
+            on_time = clock + to_new * minutes_per_mile <= deadline_minutes and added * minutes_per_mile <= self.slack[position]
+            if best is None or (on_time, -added) > (best[2], -best[1]):
+                best = (position, added, on_time)
+            if position < len(self.stops):
+                previous = following
+                clock = self.arrivals[position]
+        return best
+
+    def add_package(self, package_id, address_index, deadline_minutes = EOD_MINUTES):
+        '''
+        Add a package that is on the truck to the remaining route.
+        It joins a remaining stop at the same address if the truck gets there before the package's deadline, otherwise a new stop is inserted into the cheapest gap that keeps every deadline
+        (or the cheapest gap overall if none does, see late_stops()).
+        Returns the added miles (0 when it joins an existing stop).
+        '''
+        if package_id in self.package_stops:
+            raise ValueError(f"Package {package_id} is already on truck {self.truck_id}'s route")
+        self.package_deadlines[package_id] = deadline_minutes
+        for position, stop in enumerate(self.stops):
+            if stop.address_index == address_index and self.arrivals[position] <= deadline_minutes:
+                stop.package_ids.append(package_id)
+                stop.deadline_minutes = min(stop.deadline_minutes, deadline_minutes)
+                self.package_stops[package_id] = stop
+                self._retime()
+                return 0.0
+
+        position, added, on_time = self._best_gap(address_index, deadline_minutes)
+        stop = Stop(address_index, [package_id], deadline_minutes)
+        self.stops.insert(position, stop)
+        self.package_stops[package_id] = stop
+        self._retime()
+        return added
+
+    def remove_package(self, package_id):
+        '''
+        Take a package off the remaining route (cancelled, or about to be moved).
+        A stop left with no packages is spliced out, its neighbours are joined directly. Returns the miles saved.
+        '''
+        stop = self.package_stops.pop(package_id, None)
+        if stop is None:
+            raise KeyError(f"Package {package_id} is not on truck {self.truck_id}'s remaining route")
+        del self.package_deadlines[package_id]
+        stop.package_ids.remove(package_id)
+        if stop.package_ids:
+            stop.deadline_minutes = min(self.package_deadlines[other] for other in stop.package_ids)
+            self._retime()
+            return 0.0
+
+        position = self.stops.index(stop)
+        distance = self.distance_table.distance
+        previous = self.stops[position - 1].address_index if position > 0 else self.position_index
+        following = self.stops[position + 1].address_index if position + 1 < len(self.stops) else self.end_index
+        saved = distance(previous, stop.address_index) + distance(stop.address_index, following) - distance(previous, following)
+        del self.stops[position]
+        if position < self.locked:
+            self.locked = 0 # The truck turns around, timed from its last stop (the part of the leg already driven is ignored)
+        self._retime()
+        return saved
+
+    def change_address(self, package_id, address_index):
+        # Move a package to a corrected address (removed from its old stop, inserted at the new one), returns the change in miles
+        deadline_minutes = self.package_deadlines.get(package_id, EOD_MINUTES)
+        saved = self.remove_package(package_id)
+        return self.add_package(package_id, address_index, deadline_minutes) - saved
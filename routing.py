@@ -0,0 +1,302 @@
+# Route optimization for a single truck
+# A truck's packages are grouped into stops (one per address), ordered with a deadline-aware nearest-neighbor pass, then improved with 2-opt and Or-opt local search.
+# Every improvement move is scored with an O(1) distance delta on the DistanceTable matrix, the full route is only re-timed to check deadlines for moves that actually save miles.
+
+import time
+from package import EOD_MINUTES
+from deadline_index import DeadlineIndex
+from addresses import package_address_index
+
+TRUCK_SPEED_MPH = 18
+MAX_MOVES = 1000 # Improving 2-opt/Or-opt moves per route, the default local search budget (see RouteOptimizer)
+
+def minutes_of(moment):
+    # datetime -> minutes since midnight
+    return moment.hour * 60 + moment.minute + moment.second / 60
+
+class Stop:
+    def __init__(self, address_index, package_ids, deadline_minutes):
+        '''
+        Initialize a Stop with these parameters:
+        address_index: row/column of the stop's address in the DistanceTable
+        package_ids: packages delivered at this address
+        deadline_minutes: earliest deadline of those packages (minutes since midnight)
+        '''
+        self.address_index = address_index
+        self.package_ids = package_ids
+        self.deadline_minutes = deadline_minutes
+
+def build_stops(packages, distance_table, address_of = None):
+    # Group packages by delivery address, one Stop per address (address_of(package) overrides package.address, e.g. SimulationState.address_of)
+    stops = {}
+    for package in packages:
+        address_index = package_address_index(package, distance_table, address_of)
+        stop = stops.get(address_index)
+        if stop is None:
+            stops[address_index] = Stop(address_index, [package.package_id], package.deadline_minutes)
+        else:
+            stop.package_ids.append(package.package_id)
+            stop.deadline_minutes = min(stop.deadline_minutes, package.deadline_minutes)
+    return list(stops.values())
+
+def nearest_neighbor(start_index, stops, distance_table):
+    # Deadline-aware nearest neighbor: from each stop go to the closest remaining stop with the earliest deadline
+    # The DeadlineIndex hands back only the stops in the earliest open deadline bucket. The current address's candidate list (distances.py) is checked first,
+    # nearest first, and the bucket is only scanned when none of the candidates is in it.
+    index = DeadlineIndex()
+    positions_at = {} # address index -> positions of the stops there
+    for position, stop in enumerate(stops):
+        index.add(position, stop.deadline_minutes)
+        positions_at.setdefault(stop.address_index, []).append(position)
+    order = []
+    current = start_index
+    while len(index):
+        due = index.next_due()
+        best = _nearest_candidate(current, due, positions_at, distance_table)
+        if best is None:
+            row = distance_table.row(current)
+            best = min(due, key = lambda position: (row[stops[position].address_index], position))
+        index.remove(best)
+        order.append(stops[best])
+        current = stops[best].address_index
+    return order
+
+def _nearest_candidate(current, due, positions_at, distance_table):
+    # Closest stop in `due` at the current address or on its candidate list, ties broken by stop position like the full scan. None if no candidate is due.
+    row = distance_table.row(current)
+    best = None
+    for address_index in (current, *distance_table.neighbors_of(current)):
+        if best is not None and row[address_index] > best[0]:
+            break # Candidates are nearest first, nothing further on can be closer
+        for position in positions_at.get(address_index, ()):
+            if position in due and (best is None or (row[address_index], position) < best):
+                best = (row[address_index], position)
+    return best[1] if best is not None else None
+
+def route_miles(route, distance_table):
+    # Total miles along a list of address indexes
+    distance = distance_table.distance
+    return sum(distance(route[i], route[i + 1]) for i in range(len(route) - 1))
+
+def route_lateness(route, deadlines, distance_table, start_minutes, speed_mph = TRUCK_SPEED_MPH):
+    # Total minutes past deadline over every stop of the route (deadlines maps address index -> deadline minutes)
+    distance = distance_table.distance
+    minutes_per_mile = 60 / speed_mph
+    clock = start_minutes
+    lateness = 0.0
+    for i in range(1, len(route)):
+        clock += distance(route[i - 1], route[i]) * minutes_per_mile
+        deadline = deadlines.get(route[i], EOD_MINUTES)
+        if clock > deadline:
+            lateness += clock - deadline
+    return lateness
+
+class RouteOptimizer:
+    def __init__(self, distance_table, start_minutes, deadlines, speed_mph = TRUCK_SPEED_MPH, time_budget = None, max_moves = MAX_MOVES):
+        '''
+        Initialize a RouteOptimizer with these parameters:
+        distance_table: DistanceTable used for all move deltas
+        start_minutes: departure time (minutes since midnight), used to time the route against deadlines
+        deadlines: address index -> deadline minutes for the stops being routed
+        speed_mph: truck speed
+        time_budget: seconds of local search allowed per route (None = no time limit)
+        max_moves: improving moves allowed per route (None = no limit). Unlike time_budget this doesn't depend on how busy the machine is,
+            so the same route always comes out the same
+        '''
+        self.distance_table = distance_table
+        self.start_minutes = start_minutes
+        self.deadlines = deadlines
+        self.speed_mph = speed_mph
+        self.time_budget = time_budget
+        self.max_moves = max_moves
+        self.moves = 0 # Improving moves made so far
+        # With only EOD deadlines there is nothing to check, every move that saves miles is accepted
+        self.has_deadlines = any(deadline < EOD_MINUTES for deadline in deadlines.values())
+
+    def _lateness(self, route):
+        if not self.has_deadlines:
+            return 0.0
+        return route_lateness(route, self.deadlines, self.distance_table, self.start_minutes, self.speed_mph)
+
+    def optimize(self, route):
+        '''
+        Improve a route (list of address indexes, first and last entries are fixed: start and end of the trip) in place with 2-opt and Or-opt.
+        A move is kept only if it saves miles without adding lateness.
+        Routes longer than the candidate lists only try moves toward each stop's nearest neighbors (distances.py) at first, and fall back to
+        full passes once those find nothing. Stops when no move improves the route or the time budget or move budget runs out. Returns the route.
+        '''
+        deadline = float("inf") if self.time_budget is None else time.perf_counter() + self.time_budget
+        lateness = self._lateness(route)
+        neighbors_first = len(route) > self.distance_table.neighbor_count + 3
+        use_neighbors = neighbors_first
+        while not self._out_of_budget(deadline):
+            improved, lateness = self._two_opt_pass(route, lateness, deadline, use_neighbors)
+            moved, lateness = self._or_opt_pass(route, lateness, deadline, use_neighbors)
+            if improved or moved:
+                use_neighbors = neighbors_first
+            elif use_neighbors:
+                use_neighbors = False # Candidates exhausted, finish with full scans
+            else:
+                break
+        return route
+
+    def _out_of_budget(self, deadline):
+        return (self.max_moves is not None and self.moves >= self.max_moves) or time.perf_counter() > deadline
+
+    def _positions(self, route):
+        # address index -> position in the route, for the stops between the fixed start and end
+        return {route[k]: k for k in range(1, len(route) - 1)}
+
+    def _two_opt_pass(self, route, lateness, deadline, use_neighbors = False):
+        # Reverse route[i..j] when d(a,c) + d(b,e) < d(a,b) + d(c,e), where a, b = route[i-1], route[i] and c, e = route[j], route[j+1]
+        # Rows of a and b are read straight from the matrix and the current edge lengths are kept in a list, so each candidate costs a few array reads
+        # With use_neighbors, c only runs over a's candidate list closer to a than b is, instead of over every later stop
+        table = self.distance_table
+        improved = False
+        last = len(route) - 1
+        edges = [table.distance(route[k], route[k + 1]) for k in range(last)]
+        positions = self._positions(route) if use_neighbors else None
+        for i in range(1, last - 1):
+            if self._out_of_budget(deadline):
+                break
+            row_a, row_b = table.row(route[i - 1]), table.row(route[i])
+            d_ab = edges[i - 1]
+            if use_neighbors:
+                candidates = []
+                for c in table.neighbors_of(route[i - 1]):
+                    if row_a[c] >= d_ab:
+                        break
+                    j = positions.get(c)
+                    if j is not None and i < j < last:
+                        candidates.append(j)
+            else:
+                candidates = range(i + 1, last)
+            for j in candidates:
+                delta = row_a[route[j]] + row_b[route[j + 1]] - d_ab - edges[j]
+                if delta < -1e-9:
+                    candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                    new_lateness = self._lateness(candidate)
+                    if new_lateness <= lateness + 1e-9:
+                        route[:] = candidate
+                        lateness = new_lateness
+                        improved = True
+                        self.moves += 1
+                        if self._out_of_budget(deadline):
+                            return improved, lateness
+                        edges = [table.distance(route[k], route[k + 1]) for k in range(last)]
+                        row_b = table.row(route[i])
+                        d_ab = edges[i - 1]
+                        if use_neighbors:
+                            positions = self._positions(route)
+                            break # The candidate positions are stale, move on to the next i
+        return improved, lateness
+
+    def _or_opt_pass(self, route, lateness, deadline, use_neighbors = False):
+        # Move a segment of 1-3 stops to a better position (either direction), scored as removal gain plus insertion cost
+        # With use_neighbors, only the gaps next to the candidate neighbors of the segment's ends are tried instead of every gap
+        # Like _two_opt_pass, the rows of the segment's ends are read straight from the matrix and the route's edge lengths are kept in a list
+        # (the gap between rest[p] and rest[p + 1] is edges[p] before the segment and edges[p + segment_length] after it)
+        distance = self.distance_table.distance
+        table = self.distance_table
+        improved = False
+        edges = [distance(route[k], route[k + 1]) for k in range(len(route) - 1)]
+        for segment_length in (1, 2, 3):
+            i = 1
+            positions = self._positions(route) if use_neighbors else None
+            while i + segment_length < len(route):
+                if self._out_of_budget(deadline):
+                    return improved, lateness
+                first, last_stop = route[i], route[i + segment_length - 1]
+                row_first, row_last = table.row(first), table.row(last_stop)
+                before, after = route[i - 1], route[i + segment_length]
+                removal_gain = edges[i - 1] + edges[i + segment_length - 1] - distance(before, after)
+                moved = False
+                rest = route[:i] + route[i + segment_length:]
+                if use_neighbors:
+                    gaps = set()
+                    for c in (*table.neighbors_of(first), *table.neighbors_of(last_stop)):
+                        q = positions.get(c)
+                        if q is None or i <= q < i + segment_length:
+                            continue
+                        q = q if q < i else q - segment_length # Position of c in rest
+                        gaps.update((q - 1, q))
+                    gaps = sorted(p for p in gaps if 0 <= p < len(rest) - 1)
+                else:
+                    gaps = range(len(rest) - 1)
+                for p in gaps:
+                    if p == i - 1:
+                        continue # Same position
+                    x, y = rest[p], rest[p + 1]
+                    d_xy = edges[p] if p < i else edges[p + segment_length]
+                    forward = row_first[x] + row_last[y] - d_xy
+                    backward = row_last[x] + row_first[y] - d_xy
+                    insert_cost, reverse = (backward, True) if backward < forward else (forward, False)
+                    if insert_cost - removal_gain < -1e-9:
+                        segment = route[i:i + segment_length]
+                        if reverse:
+                            segment.reverse()
+                        candidate = rest[:p + 1] + segment + rest[p + 1:]
+                        new_lateness = self._lateness(candidate)
+                        if new_lateness <= lateness + 1e-9:
+                            route[:] = candidate
+                            lateness = new_lateness
+                            improved = moved = True
+                            self.moves += 1
+                            edges = [distance(route[k], route[k + 1]) for k in range(len(route) - 1)]
+                            if use_neighbors:
+                                positions = self._positions(route)
+                            break
+                if not moved:
+                    i += 1
+        return improved, lateness
+
+def plan_stops(stops, distance_table, start_index, start_minutes, end_index = None, speed_mph = TRUCK_SPEED_MPH, time_budget = None, max_moves = MAX_MOVES):
+    # Order already-built Stops (nearest neighbor + local search, see RouteOptimizer for the budgets), returns the Stops in delivery order
+    if not stops:
+        return []
+    if end_index is None:
+        end_index = start_index
+    order = nearest_neighbor(start_index, stops, distance_table)
+
+    stops_by_address = {stop.address_index: stop for stop in stops}
+    deadlines = {stop.address_index: stop.deadline_minutes for stop in stops}
+    route = [start_index] + [stop.address_index for stop in order] + [end_index]
+    RouteOptimizer(distance_table, start_minutes, deadlines, speed_mph, time_budget, max_moves).optimize(route)
+    return [stops_by_address[index] for index in route[1:-1]]
+
+def plan_route(packages, distance_table, start_index, start_minutes, end_index = None, speed_mph = TRUCK_SPEED_MPH, time_budget = None, address_of = None, max_moves = MAX_MOVES):
+    '''
+    Plan a delivery order for one truck.
+    packages: Package objects to deliver
+    start_index: address index the truck starts from (usually the hub)
+    start_minutes: departure time, minutes since midnight
+    end_index: address index the truck finishes at, defaults to start_index (back to the hub)
+    address_of: optional function giving each package's current address
+    time_budget, max_moves: local search budgets, see RouteOptimizer (by default only max_moves, so the same day always gets the same routes)
+    Returns the list of Stops in delivery order.
+    '''
+    return plan_stops(build_stops(packages, distance_table, address_of), distance_table, start_index, start_minutes, end_index, speed_mph,
+                      time_budget, max_moves)
+
+def drive_route(stops, distance_table, start_index, start_minutes, end_index = None, speed_mph = TRUCK_SPEED_MPH):
+    '''
+    Time a planned route.
+    Returns (arrival minutes at each stop, cumulative miles at each stop, total miles including the return leg, minutes when the truck is back at end_index).
+    '''
+    if end_index is None:
+        end_index = start_index
+    minutes_per_mile = 60 / speed_mph
+    arrivals = []
+    miles = []
+    clock = start_minutes
+    total = 0.0
+    current = start_index
+    for stop in stops:
+        leg = distance_table.distance(current, stop.address_index)
+        total += leg
+        clock += leg * minutes_per_mile
+        arrivals.append(clock)
+        miles.append(total)
+        current = stop.address_index
+    leg = distance_table.distance(current, end_index)
+    return arrivals, miles, total + leg, clock + leg * minutes_per_mile
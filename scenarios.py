@@ -0,0 +1,224 @@
+# What-if scenarios: re-run the delivery day with different departure times, speed, truck count, capacity or flight-delay times
+# Every combination of the given parameters is one Scenario. Each scenario loads the trucks (constraints.assign_trucks), plans and times every route
+# and records the results in its own SimulationState, so scenarios never touch each other or the real day.
+# Scenarios are spread over a ProcessPoolExecutor, workers share one copy of the distance matrix (see dispatcher.SharedDistanceMatrix).
+#
+# Usage: python scenarios.py --departures 08:05,09:15,10:25 --departures 08:00,09:05,10:20 --speeds 16,18,20 --truck-counts 2,3 --format csv
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import operator
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import snapshot
+from dispatcher import SharedDistanceMatrix, shared_table
+from simulation_state import SimulationState
+from package import parse_deadline, format_deadline
+from routing import plan_route, drive_route, TRUCK_SPEED_MPH, MAX_MOVES
+from constraints import day_constraints, assign_trucks, ADDRESS_CORRECTIONS, HUB_ADDRESS, TRUCK_CAPACITY
+
+DEFAULT_DEPARTURES = "08:05,09:15,10:25" # The real day's departure times (see main.py)
+
+class Scenario:
+    def __init__(self, departures, speed_mph = TRUCK_SPEED_MPH, truck_count = None, capacity = TRUCK_CAPACITY, delayed_ready = None):
+        '''
+        One set of what-if parameters:
+        departures: departure time of each truck (minutes since midnight), trucks past the end of the list leave with the last one
+        speed_mph: speed of every truck
+        truck_count: number of trucks (None = one per departure time)
+        capacity: packages per truck
+        delayed_ready: time delayed packages arrive at the hub (minutes since midnight, None = the time in their special notes)
+        '''
+        self.departures = list(departures)
+        self.speed_mph = speed_mph
+        self.truck_count = truck_count or len(self.departures)
+        self.capacity = capacity
+        self.delayed_ready = delayed_ready
+
+    def truck_departures(self):
+        # (truck_id, departure minutes) for every truck in the scenario
+        return [(truck_id, self.departures[min(truck_id - 1, len(self.departures) - 1)]) for truck_id in range(1, self.truck_count + 1)]
+
+    def label(self):
+        # Short description of the parameters, used as the first column of the results table
+        departures = "/".join(format_deadline(departure) for departure in self.departures[:self.truck_count])
+        ready = format_deadline(self.delayed_ready) if self.delayed_ready is not None else "notes"
+        return f"trucks={self.truck_count} dep={departures} mph={self.speed_mph:g} cap={self.capacity} ready={ready}"
+
+class ScenarioResult:
+    def __init__(self, scenario, total_miles = None, late_packages = None, undelivered = None, finish_minutes = None, truck_finish = None, error = None):
+        '''
+        Metrics for one scenario:
+        total_miles: miles driven by all trucks, including the drive back to the hub
+        late_packages: packages delivered after their deadline
+        undelivered: packages that never got delivered
+        finish_minutes: time the last truck is back at the hub
+        truck_finish: truck_id -> time that truck is back at the hub
+        error: why the scenario couldn't run (e.g. the packages don't fit on the trucks), the metrics are None when set
+        '''
+        self.scenario = scenario
+        self.total_miles = total_miles
+        self.late_packages = late_packages
+        self.undelivered = undelivered
+        self.finish_minutes = finish_minutes
+        self.truck_finish = truck_finish or {}
+        self.error = error
+
+    def as_row(self):
+        # Dictionary of the result for the CSV/JSON/table output
+        def clock(minutes):
+            return f"{int(minutes) // 60:02d}:{int(minutes) % 60:02d}" if minutes is not None else ""
+        return {
+            "scenario": self.scenario.label(),
+            "total_miles": round(self.total_miles, 1) if self.total_miles is not None else "",
+            "late": self.late_packages if self.late_packages is not None else "",
+            "undelivered": self.undelivered if self.undelivered is not None else "",
+            "finish": clock(self.finish_minutes),
+            "truck_finish": " ".join(f"{truck_id}:{clock(minutes)}" for truck_id, minutes in sorted(self.truck_finish.items())),
+            "error": self.error or "",
+        }
+
+def deadline_array(packages, manifest_size):
+    # Deadline of every package indexed by package ID (NaN where there is no package), compared against SimulationState.delivered_minutes
+    deadlines = array('d', [math.nan]) * manifest_size
+    for package in packages:
+        deadlines[package.package_id] = package.deadline_minutes
+    return deadlines
+
+def run_scenario(scenario, packages, distance_table, deadlines = None, max_moves = MAX_MOVES):
+    '''
+    Simulate one scenario and return its ScenarioResult.
+    packages: the day's Package objects (not modified)
+    deadlines: deadline_array(packages, ...), pass it in when running many scenarios so it is only built once
+    max_moves: improving local search moves per truck route (a move count, not seconds, so a scenario always gives the same result)
+    '''
+    manifest_size = max(package.package_id for package in packages) + 1
+    if deadlines is None:
+        deadlines = deadline_array(packages, manifest_size)
+    packages_by_id = {package.package_id: package for package in packages}
+
+    # Constraints are re-parsed per scenario because the delayed-ready time may change them
+    constraints = day_constraints(packages)
+    if scenario.delayed_ready is not None:
+        for package_constraints in constraints.values():
+            if package_constraints.ready_minutes is not None:
+                package_constraints.ready_minutes = scenario.delayed_ready
+
+    trucks = scenario.truck_departures()
+    try:
+        loads = assign_trucks(packages, constraints, trucks, distance_table, HUB_ADDRESS, scenario.capacity)
+    except ValueError as error:
+        return ScenarioResult(scenario, error = str(error))
+
+    # assign_trucks only loads a corrected package on a truck leaving after the correction, so every correction is known by the time it is routed
+    state = SimulationState(manifest_size)
+    for package_id, (correction_minutes, address, city, state_code, zip_code) in ADDRESS_CORRECTIONS.items():
+        if package_id in packages_by_id:
+            state.override_address(package_id, address, city, state_code, zip_code)
+
+    hub_index = distance_table.index_of(HUB_ADDRESS)
+    total_miles = 0.0
+    truck_finish = {}
+    for truck_id, departure in trucks:
+        truck_packages = [packages_by_id[package_id] for package_id in loads[truck_id]]
+        route = plan_route(truck_packages, distance_table, hub_index, departure, hub_index, scenario.speed_mph, address_of = state.address_of, max_moves = max_moves)
+        arrivals, miles, route_total, finish = drive_route(route, distance_table, hub_index, departure, hub_index, scenario.speed_mph)
+        for stop, arrival in zip(route, arrivals):
+            for package_id in stop.package_ids:
+                state.deliver(package_id, truck_id, arrival, departure)
+        total_miles += route_total
+        truck_finish[truck_id] = finish if route else departure
+
+    # Late and undelivered counts straight from the state's arrays (NaN compares False, so empty slots never count as late)
+    delivered = state.delivered_minutes
+    late_packages = sum(map(operator.gt, delivered, deadlines))
+    undelivered = sum(1 for package_id in packages_by_id if math.isnan(delivered[package_id]))
+    return ScenarioResult(scenario, total_miles, late_packages, undelivered, max(truck_finish.values(), default = None), truck_finish)
+
+# Worker process state, set once per worker by _attach_worker
+_worker_memory = None
+_worker_day = None
+
+def _attach_worker(memory_name, size, addresses, neighbor_count, packages, max_moves):
+    # Pool initializer: attach to the shared matrix and keep the day's packages for every scenario this worker runs
+    global _worker_memory, _worker_day
+    _worker_memory, distance_table = shared_table(memory_name, size, addresses, neighbor_count)
+    deadlines = deadline_array(packages, max(package.package_id for package in packages) + 1)
+    _worker_day = (packages, distance_table, deadlines, max_moves)
+
+def _run_in_worker(scenario):
+    packages, distance_table, deadlines, max_moves = _worker_day
+    return run_scenario(scenario, packages, distance_table, deadlines, max_moves)
+
+def run_scenarios(scenarios, packages, distance_table, max_moves = MAX_MOVES, max_workers = None):
+    '''
+    Run every scenario and return their ScenarioResults in the same order.
+    max_workers: worker processes (None = one per CPU). With one scenario or max_workers=1 everything runs in this process.
+    '''
+    scenarios = list(scenarios)
+    if len(scenarios) <= 1 or max_workers == 1:
+        deadlines = deadline_array(packages, max(package.package_id for package in packages) + 1)
+        return [run_scenario(scenario, packages, distance_table, deadlines, max_moves) for scenario in scenarios]
+
+    with SharedDistanceMatrix(distance_table) as shared:
+        with ProcessPoolExecutor(max_workers = max_workers, initializer = _attach_worker,
+                                 initargs = shared.attach_args() + (list(packages), max_moves)) as executor:
+            return list(executor.map(_run_in_worker, scenarios, chunksize = 8))
+
+def scenario_grid(departure_sets, speeds, truck_counts, capacities, delayed_ready_times):
+    # Every combination of the parameter lists, as Scenarios
+    return [Scenario(departures, speed_mph, truck_count, capacity, delayed_ready)
+            for departures, speed_mph, truck_count, capacity, delayed_ready
+            in itertools.product(departure_sets, speeds, truck_counts, capacities, delayed_ready_times)]
+
+def write_results(results, output_format, out_file):
+    # Write the results table as an aligned text table, CSV or JSON lines
+    rows = [result.as_row() for result in results]
+    columns = ["scenario", "total_miles", "late", "undelivered", "finish", "truck_finish", "error"]
+    if output_format == "csv":
+        writer = csv.DictWriter(out_file, fieldnames = columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    elif output_format == "json":
+        for row in rows:
+            out_file.write(json.dumps(row) + "\n")
+    else:
+        widths = {column: max([len(column)] + [len(str(row[column])) for row in rows]) for column in columns}
+        out_file.write("  ".join(column.ljust(widths[column]) for column in columns).rstrip() + "\n")
+        for row in rows:
+            out_file.write("  ".join(str(row[column]).ljust(widths[column]) for column in columns).rstrip() + "\n")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run what-if delivery scenarios over a grid of parameters")
+    parser.add_argument("--departures", action = "append", help = f"comma-separated truck departure times, repeat for several sets (default {DEFAULT_DEPARTURES})")
+    parser.add_argument("--speeds", default = str(TRUCK_SPEED_MPH), help = "comma-separated truck speeds in mph")
+    parser.add_argument("--truck-counts", default = "", help = "comma-separated truck counts (default one truck per departure time)")
+    parser.add_argument("--capacities", default = str(TRUCK_CAPACITY), help = "comma-separated packages per truck")
+    parser.add_argument("--delayed-ready", default = "", help = "comma-separated times the delayed packages arrive (default the time in their notes)")
+    parser.add_argument("--route-moves", type = int, default = MAX_MOVES, help = "improving local search moves per truck route")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default one per CPU)")
+    parser.add_argument("--format", choices = ["table", "csv", "json"], default = "table")
+    parser.add_argument("--closure", action = "store_true", help = "use shortest-path distances (computed once and cached, slow for large tables)")
+    parser.add_argument("--package-file", default = "wgups_package_file.csv")
+    parser.add_argument("--address-file", default = "wgups_address_file.csv")
+    parser.add_argument("--distance-file", default = "wgups_distance_table.csv")
+    args = parser.parse_args(argv)
+
+    def numbers(text, kind):
+        return [kind(value) for value in text.split(",") if value.strip()]
+
+    departure_sets = [[parse_deadline(time.strip()) for time in departures.split(",")] for departures in (args.departures or [DEFAULT_DEPARTURES])]
+    truck_counts = numbers(args.truck_counts, int) or [None]
+    delayed_ready_times = [parse_deadline(time.strip()) for time in args.delayed_ready.split(",") if time.strip()] or [None]
+    scenarios = scenario_grid(departure_sets, numbers(args.speeds, float), truck_counts, numbers(args.capacities, int), delayed_ready_times)
+
+    packages, distance_table = snapshot.load_day(args.package_file, args.address_file, args.distance_file, closure = args.closure)
+    results = run_scenarios(scenarios, packages, distance_table, args.route_moves, args.workers)
+    write_results(results, args.format, sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# Local HTTP status service for package and fleet lookups
+# A small asyncio server (stdlib only) answering the same questions as lookup_package and view_all_packages in main.py:
+#   GET /package/{id}?at=HH:MM   status of one package at a time
+#   GET /fleet?at=HH:MM          truck mileage and package status counts at a time
+# The day is simulated once at startup. The manifest files are polled and the day is reloaded and re-simulated only when one of them changes.
+# Answers are cached per (path, minute) in an LRU cache that is cleared on every reload.
+#
+# Usage: python server.py --host 127.0.0.1 --port 8080
+
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qs
+import main
+from addresses import AddressNotFound
+
+CACHE_SIZE = 4096 # Cached responses (one per path and minute asked for)
+MAX_HEADER_LINES = 100
+LINGER_BYTES = 1 << 20 # Unread request bytes read and dropped after an error answer, so closing doesn't reset the connection before the client reads it
+LINGER_SECONDS = 1.0
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+class DayWatcher:
+    # Remembers the size/mtime of the day's data files and reloads the app context when they change
+    def __init__(self, context):
+        self.context = context
+        self.signature = self._signature()
+
+    def _signature(self):
+        signature = []
+        for filename in self.context.day_files:
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                signature.append(None) # Missing is a state too, so a deleted file is reported once, not on every poll
+                continue
+            signature.append((stat.st_size, stat.st_mtime_ns))
+        return signature
+
+    def check(self):
+        # Reload and re-simulate if any file changed, returns True if it did. Runs on a worker thread (see watch_day),
+        # the context keeps serving the previous day until the new one is completely built.
+        signature = self._signature()
+        if signature == self.signature:
+            return False
+        # Remembered before reloading: if these files can't be loaded, the next try is when they change again, not on every poll
+        self.signature = signature
+        self.context.reload(simulate = True)
+        return True
+
+def parse_at(query):
+    # The ?at=HH:MM (or HH:MM:SS) parameter, rounded down to the minute, so repeated polls in the same minute share a cache entry. Default end of day.
+    values = parse_qs(query).get("at")
+    if not values:
+        return main.end_of_day.strftime("%H:%M")
+    for time_format in ("%H:%M:%S", "%H:%M"):
+        try:
+            return datetime.strptime(values[0], time_format).strftime("%H:%M")
+        except ValueError:
+            continue
+    return None
+
+def package_answer(package_id, at):
+    # (status code, JSON body) for /package/{id}
+    check_time = datetime.strptime(at, "%H:%M")
+    record = next(main.status_records([check_time], [package_id], main.get_day_timeline()))
+    if record[2] == "NOT FOUND":
+        return 404, {"error": f"Package {package_id} not found"}
+    return 200, dict(zip(main.QUERY_FIELDS, record))
+
+def fleet_answer(at):
+    # (status code, JSON body) for /fleet
+    check_time = datetime.strptime(at, "%H:%M")
+    timeline = main.get_day_timeline()
+    counts = {}
+    package_ids = sorted(package_id for package_id, package in main.app.package_hash.items())
+    for record in main.status_records([check_time], package_ids, timeline):
+        status = record[2].split(" - ")[0].split(" at ")[0] # "DELIVERED at 09:40:40" -> "DELIVERED", "DELAYED - ..." -> "DELAYED"
+        counts[status] = counts.get(status, 0) + 1
+    return 200, {
+        "time": check_time.strftime("%H:%M:%S"),
+        "trucks": [{"truck_id": truck_id, "miles": round(timeline.truck_miles_at(truck_id, check_time), 2)} for truck_id in timeline.truck_ids()],
+        "total_miles": round(timeline.total_miles_at(check_time), 2),
+        "packages": counts,
+    }
+
+@lru_cache(maxsize = CACHE_SIZE)
+def answer(path, at):
+    # Encoded (status code, body) for a GET, cached per path and minute
+    parts = path.strip("/").split("/")
+    if at is None:
+        status, body = 400, {"error": "at must be HH:MM or HH:MM:SS"}
+    elif len(parts) == 2 and parts[0] == "package":
+        try:
+            status, body = package_answer(int(parts[1]), at)
+        except ValueError:
+            status, body = 400, {"error": "package ID must be a number"}
+    elif parts == ["fleet"]:
+        status, body = fleet_answer(at)
+    else:
+        status, body = 404, {"error": f"Unknown path {path}"}
+    return status, json.dumps(body).encode('utf-8')
+
+def response(status, body, keep_alive):
+    # Raw HTTP/1.1 response bytes
+    headers = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+               f"Content-Type: application/json\r\n"
+               f"Content-Length: {len(body)}\r\n"
+               f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return headers.encode('ascii') + body
+
+async def linger(reader, writer):
+    # Send our end of the connection, then drop what is left of the request: closing with unread input makes the OS reset the connection,
+    # and the client can lose the answer that was just written
+    await writer.drain()
+    writer.write_eof()
+    dropped = 0
+    try:
+        while dropped < LINGER_BYTES:
+            chunk = await asyncio.wait_for(reader.read(65536), LINGER_SECONDS)
+            if not chunk:
+                break
+            dropped += len(chunk)
+    except asyncio.TimeoutError:
+        pass
+
+async def handle_client(reader, writer):
+    # Serve requests on one connection until the client closes it or asks for Connection: close
+    try:
+        while True:
+            try:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+            except ValueError:
+                # readline raises ValueError for a line longer than the StreamReader limit (64 KiB)
+                writer.write(response(400, b'{"error": "Request line or header too long"}', False))
+                await linger(reader, writer)
+                break
+
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                writer.write(response(400, b'{"error": "Malformed request"}', False))
+                break
+            keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+            if method != "GET":
+                status, body = 405, b'{"error": "Only GET is supported"}'
+            else:
+                url = urlsplit(target)
+                status, body = answer(url.path, parse_at(url.query))
+            writer.write(response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass # Client went away
+    finally:
+        writer.close()
+
+async def watch_day(watcher, interval):
+    # Poll the data files and reload the day when they change, the reload runs in the default executor so queries are answered meanwhile
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await loop.run_in_executor(None, watcher.check):
+                answer.cache_clear()
+                print("Manifest changed, day reloaded")
+        except (OSError, ValueError, AddressNotFound) as error:
+            print(f"Reload failed, still serving the previous day: {error}")
+
+async def serve(host, port, poll_interval):
+    watcher = DayWatcher(main.app)
+    main.get_day_timeline() # Load and simulate the day before accepting requests
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"Serving WGUPS status on http://{host}:{port} (/package/<id>?at=HH:MM, /fleet?at=HH:MM)")
+    watch_task = asyncio.create_task(watch_day(watcher, poll_interval))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watch_task.cancel()
+
+def run(argv = None):
+    parser = argparse.ArgumentParser(description = "Serve WGUPS package and fleet status over HTTP")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8080)
+    parser.add_argument("--poll", type = float, default = 2.0, help = "seconds between checks of the manifest files")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.poll))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,82 @@
+# Create class SimulationState to hold everything one simulation run changes, separate from the package manifest
+# The Package objects loaded from the manifest are never modified by a run. Delivery times, departure times and truck assignments live in
+# compact arrays indexed by package ID, and address corrections live in a small override dict.
+# fork() gives a new state that shares the parent's arrays until it first writes to them (copy-on-write), so many what-if runs can start
+# from the same point without copying the package table or each other's results.
+
+import math
+from array import array
+
+NOT_SET = math.nan # Stored in the time arrays until a package departs/is delivered
+
+class SimulationState:
+    def __init__(self, manifest_size):
+        '''
+        Initialize an empty state with these parameters:
+        manifest_size: largest package ID + 1 (the arrays are indexed by package ID)
+        '''
+        self.manifest_size = manifest_size
+        self.delivered_minutes = array('d', [NOT_SET]) * manifest_size # Delivery time, minutes since midnight
+        self.departure_minutes = array('d', [NOT_SET]) * manifest_size # Time the package's truck left the hub
+        self.truck_ids = array('i', bytes(4 * manifest_size)) # 0 = not on a truck
+        self.address_overrides = {} # package_id -> (address, city, state, zip_code)
+        self._owned = True # False while the arrays are still shared with the state this one was forked from
+
+    def fork(self):
+        # New state starting from this one, arrays are shared until either side writes
+        child = SimulationState.__new__(SimulationState)
+        child.manifest_size = self.manifest_size
+        child.delivered_minutes = self.delivered_minutes
+        child.departure_minutes = self.departure_minutes
+        child.truck_ids = self.truck_ids
+        child.address_overrides = dict(self.address_overrides)
+        child._owned = False
+        self._owned = False # The parent must copy too before its next write, the child still points at these arrays
+        return child
+
+    def _own(self):
+        # Copy the shared arrays before the first write (array slicing is a single memcpy)
+        if not self._owned:
+            self.delivered_minutes = self.delivered_minutes[:]
+            self.departure_minutes = self.departure_minutes[:]
+            self.truck_ids = self.truck_ids[:]
+            self._owned = True
+
+    def assign(self, package_id, truck_id, departure_minutes):
+        # Put a package on a truck leaving at departure_minutes (first assignment wins, like loading it on the truck)
+        if self.truck_ids[package_id]:
+            return
+        self._own()
+        self.truck_ids[package_id] = truck_id
+        self.departure_minutes[package_id] = departure_minutes
+
+    def deliver(self, package_id, truck_id, delivered_minutes, departure_minutes):
+        # Record a delivery
+        self._own()
+        self.truck_ids[package_id] = truck_id
+        self.departure_minutes[package_id] = departure_minutes
+        self.delivered_minutes[package_id] = delivered_minutes
+
+    def truck_of(self, package_id):
+        # Truck carrying the package, None if it hasn't been loaded
+        truck_id = self.truck_ids[package_id]
+        return truck_id or None
+
+    def delivered_at(self, package_id):
+        # Delivery time in minutes since midnight, None if not delivered
+        minutes = self.delivered_minutes[package_id]
+        return None if math.isnan(minutes) else minutes
+
+    def departed_at(self, package_id):
+        # Departure time in minutes since midnight, None if the package hasn't left the hub
+        minutes = self.departure_minutes[package_id]
+        return None if math.isnan(minutes) else minutes
+
+    def override_address(self, package_id, address, city, state, zip_code):
+        # Correct a package's address for this run only
+        self.address_overrides[package_id] = (address, city, state, zip_code)
+
+    def address_of(self, package):
+        # Street address of a package in this run (the override if one was made, else the manifest address)
+        override = self.address_overrides.get(package.package_id)
+        return override[0] if override else package.address
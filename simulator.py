@@ -0,0 +1,336 @@
+# Discrete-event simulation of the whole fleet
+# Instead of simulating each truck on its own with hand-picked departure times, every truck, driver and package moves on one clock.
+# A heapq of timestamped events drives the day: packages becoming ready at the hub, address corrections, drivers becoming available,
+# truck departures, arrivals at stops and returns to the hub. Nothing is rescanned between events, the engine pops the next event and handles it.
+#
+# Dispatching: whenever a driver and a truck are both idle at the hub and there are packages ready, the truck is loaded and leaves.
+# Loads take the truck's restricted packages first, then timed deadlines earliest first, then the EOD packages nearest to what is already loaded.
+# The last idle driver waits for packages that become ready soon (within hold_minutes) if they have a timed deadline or the truck isn't full,
+# instead of leaving them for a later trip.
+# Trucks come back to the hub for another load while packages remain.
+
+import heapq
+from datetime import datetime, timedelta
+from addresses import package_address_index
+from constraints import build_groups, ADDRESS_CORRECTIONS, TRUCK_CAPACITY
+from deadline_index import DeadlineIndex
+from package import EOD_MINUTES, parse_deadline
+from routing import plan_route, drive_route, TRUCK_SPEED_MPH
+from simulation_state import SimulationState
+from timeline import Event, DEPARTURE, DELIVERY, HUB_RETURN, ADDRESS_CORRECTION
+
+DRIVER_COUNT = 2 # WGUPS has two drivers for its three trucks
+DAY_START_MINUTES = parse_deadline("08:00")
+HOLD_MINUTES = 70 # How long the last idle driver will wait for packages that are about to be ready
+TRIP_MOVES = 200 # Improving 2-opt/Or-opt moves per trip route
+
+# Event kinds, in the order events at the same minute are handled (corrections before the packages they release, returns before dispatching)
+CORRECTION_EVENT = 0
+READY_EVENT = 1
+ARRIVAL_EVENT = 2
+RETURN_EVENT = 3
+DRIVER_EVENT = 4
+
+class Trip:
+    def __init__(self, truck_id, departure_minutes, stops, arrivals, miles, total_miles, return_minutes):
+        '''
+        One load of a truck:
+        truck_id: truck that made the trip
+        departure_minutes: time it left the hub
+        stops: Stops in delivery order
+        arrivals: arrival time at each stop
+        miles: miles into the trip at each stop
+        total_miles: miles for the trip including the drive back to the hub
+        return_minutes: time it was back at the hub
+        '''
+        self.truck_id = truck_id
+        self.departure_minutes = departure_minutes
+        self.stops = stops
+        self.arrivals = arrivals
+        self.miles = miles
+        self.total_miles = total_miles
+        self.return_minutes = return_minutes
+
+    def package_ids(self):
+        return [package_id for stop in self.stops for package_id in stop.package_ids]
+
+class SimulationResult:
+    def __init__(self, state, trips, truck_miles, events_processed, timeline = None):
+        '''
+        Outcome of one simulated day:
+        state: SimulationState with every delivery, departure and address correction
+        trips: every Trip in departure order
+        truck_miles: truck_id -> miles driven over the day
+        events_processed: number of events popped from the queue
+        timeline: the day's Timeline if one was requested
+        '''
+        self.state = state
+        self.trips = trips
+        self.truck_miles = truck_miles
+        self.events_processed = events_processed
+        self.timeline = timeline
+
+    def total_miles(self):
+        return sum(self.truck_miles.values())
+
+    def finish_minutes(self):
+        # Time the last truck is back at the hub
+        return max((trip.return_minutes for trip in self.trips), default = None)
+
+class EventSimulator:
+    def __init__(self, packages, constraints, distance_table, hub_address, truck_count = 3, driver_count = DRIVER_COUNT,
+                 capacity = TRUCK_CAPACITY, speed_mph = TRUCK_SPEED_MPH, start_minutes = DAY_START_MINUTES,
+                 hold_minutes = HOLD_MINUTES, max_moves = TRIP_MOVES, address_corrections = ADDRESS_CORRECTIONS):
+        '''
+        Set up a simulated day with these parameters:
+        packages: the day's Package objects (not modified)
+        constraints: package_id -> PackageConstraints (see constraints.parse_special_notes)
+        hub_address: where trucks load and return
+        truck_count, driver_count: fleet size, a truck only moves with a driver
+        capacity: packages per truck load
+        start_minutes: time drivers start, minutes since midnight
+        hold_minutes: see HOLD_MINUTES
+        max_moves: improving local search moves per trip route (a move count, so the same day always simulates the same way)
+        address_corrections: package_id -> (correction minutes, address, city, state, zip)
+        '''
+        self.packages = {package.package_id: package for package in packages}
+        self.constraints = constraints
+        self.distance_table = distance_table
+        self.hub_index = distance_table.index_of(hub_address)
+        self.truck_count = truck_count
+        self.driver_count = driver_count
+        self.capacity = capacity
+        self.speed_mph = speed_mph
+        self.start_minutes = start_minutes
+        self.hold_minutes = hold_minutes
+        self.max_moves = max_moves
+        self.address_corrections = address_corrections
+
+        # Reject groups no truck could ever carry up front (like constraints.assign_trucks), they would otherwise never leave the hub
+        for group in build_groups(list(self.packages.values()), constraints):
+            if len(group.package_ids) > capacity:
+                raise ValueError(f"No truck can carry packages {group.package_ids} ({len(group.package_ids)} packages, capacity {capacity})")
+            if group.truck_id is not None and not 1 <= group.truck_id <= truck_count:
+                raise ValueError(f"No truck can carry packages {group.package_ids} (restricted to truck {group.truck_id}, {truck_count} trucks)")
+
+    def _push(self, minutes, kind, payload = None):
+        self.sequence += 1
+        heapq.heappush(self.queue, (minutes, kind, self.sequence, payload))
+
+    def run(self, timeline = None):
+        # Simulate the day and return a SimulationResult, events are also recorded to timeline if one is passed in
+        self.queue = []
+        self.sequence = 0
+        self.timeline = timeline
+        self.state = SimulationState(max(self.packages, default = 0) + 1)
+        self.trips = []
+        self.truck_miles = {truck_id: 0.0 for truck_id in range(1, self.truck_count + 1)}
+        self.idle_trucks = list(range(1, self.truck_count + 1)) # Heap of truck IDs at the hub
+        self.idle_drivers = 0
+
+        # Ready groups by kind: restricted to one truck, timed deadline (in a DeadlineIndex by group position), and EOD by first address
+        self.groups = build_groups(list(self.packages.values()), self.constraints)
+        self.restricted = {} # truck_id -> list of group positions
+        self.timed = DeadlineIndex()
+        self.eod_by_address = {} # address index -> list of group positions
+        self.pending = [] # Heap of (ready minutes, group position) for groups not ready yet, entries for ready groups are skipped on read
+        self.pending_timed = [] # Same, only the groups with a timed deadline
+        self.ready = set() # Positions of groups that have reached the hub
+
+        for package_id, (correction_minutes, address, city, state, zip_code) in self.address_corrections.items():
+            if package_id in self.packages:
+                self._push(correction_minutes, CORRECTION_EVENT, package_id)
+        for position, group in enumerate(self.groups):
+            ready = max(group.available_minutes, self.start_minutes)
+            heapq.heappush(self.pending, (ready, position))
+            if group.deadline_minutes < EOD_MINUTES:
+                heapq.heappush(self.pending_timed, (ready, position))
+            self._push(ready, READY_EVENT, position)
+        self._push(self.start_minutes, DRIVER_EVENT, self.driver_count)
+
+        events_processed = 0
+        while self.queue:
+            minutes, kind, sequence, payload = heapq.heappop(self.queue)
+            events_processed += 1
+            if kind == CORRECTION_EVENT:
+                self._correct_address(minutes, payload)
+            elif kind == READY_EVENT:
+                self._group_ready(payload)
+            elif kind == ARRIVAL_EVENT:
+                self._arrive(minutes, *payload)
+                continue # Deliveries don't change anything at the hub
+            elif kind == RETURN_EVENT:
+                self._truck_returned(minutes, payload)
+            elif kind == DRIVER_EVENT:
+                self.idle_drivers += payload
+            self._dispatch(minutes)
+
+        if timeline is not None:
+            timeline.finalize()
+        return SimulationResult(self.state, self.trips, self.truck_miles, events_processed, timeline)
+
+    def _correct_address(self, minutes, package_id):
+        correction_minutes, address, city, state, zip_code = self.address_corrections[package_id]
+        self.state.override_address(package_id, address, city, state, zip_code)
+        if self.timeline is not None:
+            self.timeline.record(Event(_time_of(minutes), ADDRESS_CORRECTION, package_id = package_id,
+                                       address = address, previous_address = self.packages[package_id].address))
+
+    def _group_ready(self, position):
+        # A group's last member reached the hub (or got its address fixed), file it under the truck, deadline or address it will be loaded by
+        group = self.groups[position]
+        self.ready.add(position)
+        group.address_indexes = sorted({package_address_index(self.packages[package_id], self.distance_table, self.state.address_of)
+                                        for package_id in group.package_ids})
+        if group.truck_id is not None:
+            self.restricted.setdefault(group.truck_id, []).append(position)
+        elif group.deadline_minutes < EOD_MINUTES:
+            self.timed.add(position, group.deadline_minutes)
+        else:
+            self.eod_by_address.setdefault(group.address_indexes[0], []).append(position)
+
+    def _truck_returned(self, minutes, truck_id):
+        heapq.heappush(self.idle_trucks, truck_id)
+        self.idle_drivers += 1
+        if self.timeline is not None:
+            self.timeline.record(Event(_time_of(minutes), HUB_RETURN, truck_id, miles = self.truck_miles[truck_id]))
+
+    def _has_ready_work(self):
+        return bool(self.eod_by_address) or len(self.timed) > 0 or any(truck_id in self.restricted for truck_id in self.idle_trucks)
+
+    def _next_pending(self, pending):
+        # Ready time of the next group in a pending heap that is still on its way to the hub (None if there isn't one)
+        while pending and pending[0][1] in self.ready:
+            heapq.heappop(pending)
+        return pending[0][0] if pending else None
+
+    def _should_hold(self, minutes, load):
+        # True if the last idle driver should wait for packages about to reach the hub instead of leaving with this load
+        if self.idle_drivers != 1:
+            return False
+        next_timed = self._next_pending(self.pending_timed)
+        if next_timed is not None and next_timed - minutes <= self.hold_minutes:
+            return True
+        next_ready = self._next_pending(self.pending)
+        return (next_ready is not None and next_ready - minutes <= self.hold_minutes
+                and sum(len(self.groups[position].package_ids) for position in load) < self.capacity)
+
+    def _dispatch(self, minutes):
+        # Send out loaded trucks while there are idle drivers, idle trucks and ready packages
+        while self.idle_drivers and self.idle_trucks and self._has_ready_work():
+            # A truck with restricted packages waiting goes first, otherwise the lowest numbered idle truck
+            truck_id = min((truck_id for truck_id in self.restricted if truck_id in self.idle_trucks), default = self.idle_trucks[0])
+            load = self._load(truck_id)
+            if not load:
+                # Ready packages but nothing fits on the truck, dispatching again would loop forever at this minute
+                raise RuntimeError(f"Dispatch at {minutes:.0f} min made no progress: no ready package fits on truck {truck_id}")
+            if self._should_hold(minutes, load):
+                self._unload(load) # Wait for the packages that are almost here
+                return
+            self.idle_trucks.remove(truck_id)
+            heapq.heapify(self.idle_trucks)
+            self.idle_drivers -= 1
+            self._depart(minutes, truck_id, load)
+
+    def _load(self, truck_id):
+        # Pick the groups for one truck load, they are taken out of the ready structures (see _unload to put them back)
+        load = []
+        room = self.capacity
+
+        def take(position):
+            nonlocal room
+            size = len(self.groups[position].package_ids)
+            if size > room:
+                return False
+            load.append(position)
+            room -= size
+            return True
+
+        # Packages that can only go on this truck
+        restricted = self.restricted.get(truck_id, [])
+        kept = [position for position in restricted if not take(position)]
+        if kept:
+            self.restricted[truck_id] = kept
+        else:
+            self.restricted.pop(truck_id, None)
+
+        # Timed deadlines, earliest first (groups too big for the room left go back afterwards)
+        skipped = []
+        while room and len(self.timed) and len(skipped) <= self.capacity:
+            position = next(iter(self.timed.next_due()))
+            self.timed.remove(position)
+            if not take(position):
+                skipped.append(position)
+        for position in skipped:
+            self.timed.add(position, self.groups[position].deadline_minutes)
+
+        # EOD packages nearest to the first stop loaded (or, with nothing loaded yet, starting from the ready address farthest from the hub)
+        if room and self.eod_by_address:
+            if load:
+                seed = self.groups[load[0]].address_indexes[0]
+            else:
+                hub_row = self.distance_table.row(self.hub_index)
+                seed = max(self.eod_by_address, key = hub_row.__getitem__)
+            seed_row = self.distance_table.row(seed)
+            for address_index in heapq.nsmallest(room, self.eod_by_address, key = seed_row.__getitem__):
+                positions = self.eod_by_address[address_index]
+                while positions and room and take(positions[-1]):
+                    positions.pop()
+                if not positions:
+                    del self.eod_by_address[address_index]
+                if room == 0:
+                    break
+        return load
+
+    def _unload(self, load):
+        # Put the groups of an abandoned load back where _load took them from
+        for position in load:
+            group = self.groups[position]
+            if group.truck_id is not None:
+                self.restricted.setdefault(group.truck_id, []).append(position)
+            elif group.deadline_minutes < EOD_MINUTES:
+                self.timed.add(position, group.deadline_minutes)
+            else:
+                self.eod_by_address.setdefault(group.address_indexes[0], []).append(position)
+
+    def _depart(self, minutes, truck_id, load):
+        # Plan the load's route, record the departure and schedule the first arrival
+        packages = [self.packages[package_id] for position in load for package_id in self.groups[position].package_ids]
+        stops = plan_route(packages, self.distance_table, self.hub_index, minutes, self.hub_index, self.speed_mph,
+                           address_of = self.state.address_of, max_moves = self.max_moves)
+        arrivals, miles, total_miles, return_minutes = drive_route(stops, self.distance_table, self.hub_index, minutes, self.hub_index, self.speed_mph)
+        trip = Trip(truck_id, minutes, stops, arrivals, miles, total_miles, return_minutes)
+        self.trips.append(trip)
+
+        for package in packages:
+            self.state.assign(package.package_id, truck_id, minutes)
+            if self.timeline is not None:
+                self.timeline.assign(package.package_id, truck_id, _time_of(minutes))
+        if self.timeline is not None:
+            self.timeline.record(Event(_time_of(minutes), DEPARTURE, truck_id, miles = self.truck_miles[truck_id]))
+
+        if stops:
+            self._push(arrivals[0], ARRIVAL_EVENT, (trip, 0))
+        else:
+            self._push(return_minutes, RETURN_EVENT, truck_id)
+
+    def _arrive(self, minutes, trip, stop_number):
+        # Deliver everything for this stop and schedule the next arrival (or the return to the hub)
+        truck_id = trip.truck_id
+        miles_before_trip = self.truck_miles[truck_id]
+        for package_id in trip.stops[stop_number].package_ids:
+            self.state.deliver(package_id, truck_id, minutes, trip.departure_minutes)
+            if self.timeline is not None:
+                self.timeline.record(Event(_time_of(minutes), DELIVERY, truck_id, package_id, miles_before_trip + trip.miles[stop_number]))
+        stop_number += 1
+        if stop_number < len(trip.stops):
+            self._push(trip.arrivals[stop_number], ARRIVAL_EVENT, (trip, stop_number))
+        else:
+            self.truck_miles[truck_id] += trip.total_miles
+            self._push(trip.return_minutes, RETURN_EVENT, truck_id)
+
+_MIDNIGHT = datetime.strptime("00:00:00", "%H:%M:%S")
+
+def _time_of(minutes):
+    # Minutes since midnight -> the datetimes the Timeline uses
+    return _MIDNIGHT + timedelta(minutes = minutes)
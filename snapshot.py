@@ -0,0 +1,145 @@
+# Binary snapshot cache of the parsed package manifest and distance table
+# The first run parses the CSV files and writes a snapshot, later runs memory-map the snapshot instead of re-parsing as long as the source files are unchanged.
+#
+# Snapshot files (in the cache directory, or its closure/ subdirectory for a snapshot with shortest-path distances, so both kinds stay cached):
+# snapshot_meta.json: size/mtime/sha256 of each source file plus the address list
+# distances.bin: the dense symmetric distance matrix (raw or shortest-path) as raw native doubles (memory-mapped on load)
+# predecessors.bin: closure snapshots only, the matching shortest-path predecessors as raw native ints (memory-mapped on load, see distances.shortest_path_closure)
+# neighbors.bin: each address's nearest-neighbor candidate list as raw native ints (memory-mapped on load, see distances.nearest_neighbors)
+# packages.pickle: one tuple of fields per package
+
+import hashlib
+import json
+import mmap
+import os
+import pickle
+from array import array
+import loader
+from distances import DistanceTable
+from package import Package
+
+SNAPSHOT_VERSION = 3
+CACHE_DIR_NAME = ".wgups_cache"
+CLOSURE_DIR_NAME = "closure" # Subdirectory of the cache directory for the shortest-path snapshot
+
+def _file_hash(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def _source_info(filename, known = None):
+    '''
+    Size, mtime and content hash of a source file.
+    If the size and mtime match the known entry the stored hash is reused, so an unchanged file is never re-read.
+    '''
+    stat = os.stat(filename)
+    info = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if known and known.get("size") == info["size"] and known.get("mtime_ns") == info["mtime_ns"]:
+        info["sha256"] = known["sha256"]
+    else:
+        info["sha256"] = _file_hash(filename)
+    return info
+
+def default_cache_dir(package_file):
+    # Keep the snapshot next to the data files
+    return os.path.join(os.path.dirname(os.path.abspath(package_file)), CACHE_DIR_NAME)
+
+def _map_array(path, typecode, length):
+    # Memory-map a raw array file read-only and view it as typecode items (the memoryview keeps the mapping open)
+    if length == 0:
+        return array(typecode)
+    with open(path, 'rb') as array_file:
+        mapped = mmap.mmap(array_file.fileno(), 0, access = mmap.ACCESS_READ)
+    values = memoryview(mapped).cast(typecode)
+    if len(values) != length:
+        raise ValueError(f"{os.path.basename(path)} does not match the snapshot size")
+    return values
+
+def load_snapshot(package_file, address_file, distance_file, cache_dir = None, closure = False):
+    # Returns (packages, distance_table) from the snapshot, or None if there is no usable snapshot for these source files (and closure setting, see loader.load_distance_table)
+    cache_dir = cache_dir or default_cache_dir(package_file)
+    try:
+        with open(os.path.join(cache_dir, "snapshot_meta.json"), encoding = 'utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != SNAPSHOT_VERSION or meta.get("closure") != closure:
+            return None
+        sources = meta["sources"]
+        for key, filename in (("packages", package_file), ("addresses", address_file), ("distances", distance_file)):
+            known = sources.get(key)
+            if not known or _source_info(filename, known)["sha256"] != known["sha256"]:
+                return None
+
+        size, neighbor_count = meta["size"], meta["neighbor_count"]
+        matrix = _map_array(os.path.join(cache_dir, "distances.bin"), 'd', size * size)
+        neighbors = _map_array(os.path.join(cache_dir, "neighbors.bin"), 'i', size * neighbor_count)
+        predecessors = _map_array(os.path.join(cache_dir, "predecessors.bin"), 'i', size * size) if meta["closure"] else None
+        with open(os.path.join(cache_dir, "packages.pickle"), 'rb') as packages_file:
+            records = pickle.load(packages_file)
+    except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+        return None
+
+    packages = [Package(*record) for record in records]
+    return packages, DistanceTable(meta["addresses"], matrix = matrix, neighbors = neighbors, neighbor_count = neighbor_count, predecessors = predecessors)
+
+def save_snapshot(package_file, address_file, distance_file, packages, distance_table, cache_dir = None):
+    # Write the parsed data to the cache directory, each file is written to a temp name and renamed so a crash never leaves a half-written snapshot
+    cache_dir = cache_dir or default_cache_dir(package_file)
+    os.makedirs(cache_dir, exist_ok = True)
+
+    def write(name, data):
+        path = os.path.join(cache_dir, name)
+        with open(path + ".tmp", 'wb') as out_file:
+            out_file.write(data)
+        os.replace(path + ".tmp", path)
+
+    # Remove the old meta file first so a partially replaced snapshot is never treated as valid
+    try:
+        os.remove(os.path.join(cache_dir, "snapshot_meta.json"))
+    except FileNotFoundError:
+        pass
+
+    write("distances.bin", memoryview(distance_table.matrix).cast('B'))
+    write("neighbors.bin", memoryview(distance_table.build_neighbors()).cast('B'))
+    if distance_table.predecessors is not None:
+        write("predecessors.bin", memoryview(distance_table.predecessors).cast('B'))
+    records = [(package.package_id, package.address, package.city, package.state, package.zip_code,
+                package.delivery_deadline, package.weight_kilo, package.special_notes) for package in packages]
+    write("packages.pickle", pickle.dumps(records, protocol = pickle.HIGHEST_PROTOCOL))
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "sources": {
+            "packages": _source_info(package_file),
+            "addresses": _source_info(address_file),
+            "distances": _source_info(distance_file),
+        },
+        "size": distance_table.size,
+        "neighbor_count": distance_table.neighbor_count,
+        "closure": distance_table.predecessors is not None,
+        "addresses": distance_table.addresses,
+    }
+    write("snapshot_meta.json", json.dumps(meta).encode('utf-8'))
+
+def load_day(package_file, address_file, distance_file, cache_dir = None, closure = False):
+    '''
+    Load the packages and distance table for a day, from the snapshot when it is up to date, otherwise from the CSV files (and refresh the snapshot).
+    closure: use shortest-path distances (see loader.load_distance_table, off by default because it is slow for large tables).
+    The closure is computed once and cached in its own snapshot (CLOSURE_DIR_NAME), so only the first load after the files change pays for it.
+    Returns (list of Package, DistanceTable), every package's address_index filled in. Raises addresses.AddressNotFound if a package's address isn't in the address file.
+    '''
+    if closure:
+        cache_dir = os.path.join(cache_dir or default_cache_dir(package_file), CLOSURE_DIR_NAME)
+    cached = load_snapshot(package_file, address_file, distance_file, cache_dir, closure)
+    if cached is not None:
+        packages, distance_table = cached
+    else:
+        packages = list(loader.iter_packages(package_file))
+        distance_table = loader.load_distance_table(address_file, distance_file, closure)
+        try:
+            save_snapshot(package_file, address_file, distance_file, packages, distance_table, cache_dir)
+        except OSError:
+            pass # Read-only location, keep running without a snapshot
+    # Resolve every package's address once, an address missing from the address file stops the load here instead of routing as 0.0 miles
+    distance_table.address_index.resolve_packages(packages)
+    return packages, distance_table
@@ -0,0 +1,110 @@
+# Create class Timeline to hold the simulated delivery day as an ordered event log
+# The day is simulated once, then every "status at time T" question is answered from the log with a binary search instead of re-running the routing.
+
+from bisect import bisect_right
+
+# Event types recorded in the log
+DEPARTURE = "DEPARTURE"
+DELIVERY = "DELIVERY"
+HUB_RETURN = "HUB_RETURN"
+ADDRESS_CORRECTION = "ADDRESS_CORRECTION"
+
+class Event:
+    def __init__(self, time, kind, truck_id = None, package_id = None, miles = 0.0, address = None, previous_address = None):
+        '''
+        Initialize an Event with these parameters:
+        time: datetime the event happened
+        kind: DEPARTURE, DELIVERY, HUB_RETURN or ADDRESS_CORRECTION
+        truck_id: truck the event belongs to (None for address corrections)
+        package_id: package delivered or corrected (None for truck-only events)
+        miles: cumulative miles driven by the truck when the event happened
+        address: the new address for ADDRESS_CORRECTION events
+        previous_address: the address on file before an ADDRESS_CORRECTION
+        '''
+        self.time = time
+        self.kind = kind
+        self.truck_id = truck_id
+        self.package_id = package_id
+        self.miles = miles
+        self.address = address
+        self.previous_address = previous_address
+
+    def __repr__(self):
+        return f"Event({self.time.strftime('%H:%M:%S')}, {self.kind}, truck={self.truck_id}, package={self.package_id}, miles={self.miles:.1f})"
+
+class Timeline:
+    def __init__(self):
+        self.events = []
+        self.truck_times = {} # truck_id -> sorted times of that truck's events
+        self.truck_miles = {} # truck_id -> cumulative miles at each of those times
+        self.departures = {} # package_id -> (truck_id, departure time)
+        self.deliveries = {} # package_id -> (truck_id, delivery time), first delivery only
+        self.corrections = {} # package_id -> (original address, [correction times], [addresses])
+
+    def record(self, event):
+        # Add an event during the simulation, call finalize() once the day is done
+        self.events.append(event)
+
+    def finalize(self):
+        # Order the log by time and build the per-truck and per-package indexes used by the queries
+        self.events.sort(key = lambda event: event.time)
+        self.truck_times = {}
+        self.truck_miles = {}
+        self.deliveries = {}
+        self.corrections = {}
+        for event in self.events:
+            if event.truck_id is not None:
+                self.truck_times.setdefault(event.truck_id, []).append(event.time)
+                self.truck_miles.setdefault(event.truck_id, []).append(event.miles)
+            if event.kind == DELIVERY and event.package_id not in self.deliveries:
+                self.deliveries[event.package_id] = (event.truck_id, event.time)
+            elif event.kind == ADDRESS_CORRECTION:
+                original, times, addresses = self.corrections.setdefault(event.package_id, (event.previous_address, [], []))
+                times.append(event.time)
+                addresses.append(event.address)
+
+    def assign(self, package_id, truck_id, departure_time):
+        # Remember which truck carries a package and when it leaves the hub (first assignment wins)
+        if package_id not in self.departures:
+            self.departures[package_id] = (truck_id, departure_time)
+
+    def truck_miles_at(self, truck_id, check_time):
+        # Miles driven by one truck at check_time, interpolated between the two surrounding events (trucks drive at constant speed between stops)
+        times = self.truck_times.get(truck_id)
+        if not times:
+            return 0.0
+        miles = self.truck_miles[truck_id]
+        index = bisect_right(times, check_time)
+        if index == 0:
+            return 0.0
+        if index == len(times):
+            return miles[-1]
+        start_time, end_time = times[index - 1], times[index]
+        span = (end_time - start_time).total_seconds()
+        if span <= 0:
+            return miles[index - 1]
+        fraction = (check_time - start_time).total_seconds() / span
+        return miles[index - 1] + (miles[index] - miles[index - 1]) * fraction
+
+    def total_miles_at(self, check_time):
+        # Miles driven by every truck at check_time
+        return sum(self.truck_miles_at(truck_id, check_time) for truck_id in self.truck_times)
+
+    def truck_ids(self):
+        return sorted(self.truck_times)
+
+    def departure(self, package_id):
+        # (truck_id, departure time) for a package, or (None, None) if it never left the hub
+        return self.departures.get(package_id, (None, None))
+
+    def delivery(self, package_id):
+        # (truck_id, delivery time) for a package, or (None, None) if it was never delivered
+        return self.deliveries.get(package_id, (None, None))
+
+    def address_at(self, package_id, check_time, current_address):
+        # Address on file for a package at check_time, taking mid-day corrections into account
+        if package_id not in self.corrections:
+            return current_address
+        original_address, times, addresses = self.corrections[package_id]
+        index = bisect_right(times, check_time)
+        return addresses[index - 1] if index else original_address
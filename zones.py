@@ -0,0 +1,298 @@
+# Split a large delivery day into zones that are simulated independently, then merge them back into one day
+# Zones come from the packages' zip codes, from k-medoids clustering on the distance matrix, or both (clusters that keep every zip code whole).
+# Each zone gets its own trucks and drivers, the hub and only its own rows of the distance matrix. A ZoneTask is plain data (lists, tuples and
+# an array of doubles), so it can be pickled to a worker process here or sent to another machine. The coordinator runs every zone through the
+# event simulator (simulator.py) and merges the zone timelines and mileage into one day, with truck IDs renumbered so they are unique across zones.
+#
+# Usage: python zones.py --by medoids --zones 3 --trucks-per-zone 2 --workers 3
+
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import snapshot
+from distances import DistanceTable
+from package import Package
+from addresses import package_address_index
+from constraints import build_groups, day_constraints, ADDRESS_CORRECTIONS, HUB_ADDRESS, TRUCK_CAPACITY
+from routing import TRUCK_SPEED_MPH
+from simulator import EventSimulator, DRIVER_COUNT, TRIP_MOVES
+from timeline import Timeline, Event
+
+ZONE_METHODS = ("zip", "medoids", "both")
+
+def k_medoids(distance_table, address_indexes, k, iterations = 20):
+    '''
+    Cluster addresses into k groups around medoids (the member with the smallest total distance to the rest of its group).
+    Starts from farthest-first medoids, then alternates assigning every address to its nearest medoid and re-picking each group's medoid until nothing moves.
+    Returns a list of k lists of address indexes (fewer if there are fewer addresses).
+    '''
+    address_indexes = sorted(set(address_indexes))
+    k = min(k, len(address_indexes))
+    if k <= 0:
+        return []
+    distance = distance_table.distance
+
+    def total_distance(candidate, members):
+        row = distance_table.row(candidate)
+        return sum(row[member] for member in members)
+
+    # Farthest-first start: the most central address, then repeatedly the address farthest from every medoid picked so far
+    medoids = [min(address_indexes, key = lambda candidate: total_distance(candidate, address_indexes))]
+    nearest = {address: distance(address, medoids[0]) for address in address_indexes}
+    while len(medoids) < k:
+        farthest = max(address_indexes, key = nearest.__getitem__)
+        medoids.append(farthest)
+        row = distance_table.row(farthest)
+        for address in address_indexes:
+            nearest[address] = min(nearest[address], row[address])
+
+    for _ in range(iterations):
+        clusters = {medoid: [] for medoid in medoids}
+        for address in address_indexes:
+            clusters[min(medoids, key = lambda medoid: (distance(address, medoid), medoid))].append(address)
+        updated = [min(members, key = lambda candidate: (total_distance(candidate, members), candidate)) for members in clusters.values()]
+        if updated == medoids:
+            break
+        medoids = updated
+    return [sorted(members) for members in clusters.values()]
+
+class Zone:
+    def __init__(self, zone_id, package_ids, address_indexes):
+        '''
+        One part of the day:
+        zone_id: number of the zone, from 1
+        package_ids: packages delivered by the zone's trucks
+        address_indexes: every address the zone's trucks may drive to (indexes into the full distance table), the hub first
+        '''
+        self.zone_id = zone_id
+        self.package_ids = package_ids
+        self.address_indexes = address_indexes
+
+def partition(packages, distance_table, zone_count = None, method = "medoids", hub_address = HUB_ADDRESS, address_corrections = ADDRESS_CORRECTIONS):
+    '''
+    Split the day's packages into Zones.
+    method: "zip" (one zone per zip code), "medoids" (zone_count clusters of the distance matrix) or "both" (zone_count clusters, each zip code moved whole to the cluster holding most of its addresses)
+    Packages that must go together (see constraints.build_groups) always land in the same zone, the zone of their first address.
+    A corrected address is added to its package's zone so the zone's trucks can drive there.
+    '''
+    if method not in ZONE_METHODS:
+        raise ValueError(f"Unknown zone method '{method}', expected one of {', '.join(ZONE_METHODS)}")
+    hub_index = distance_table.index_of(hub_address)
+    address_of = {package.package_id: package_address_index(package, distance_table) for package in packages}
+
+    # Zone key of every address: its zip code, its cluster, or the cluster of its zip code
+    zip_of = {}
+    for package in packages:
+        zip_of.setdefault(address_of[package.package_id], package.zip_code)
+    if method == "zip":
+        zone_of_address = dict(zip_of)
+    else:
+        clusters = k_medoids(distance_table, [address for address in zip_of if address != hub_index], zone_count or 1)
+        zone_of_address = {address: number for number, members in enumerate(clusters) for address in members}
+        zone_of_address.setdefault(hub_index, 0)
+        if method == "both":
+            votes = {}
+            for address, zip_code in zip_of.items():
+                counts = votes.setdefault(zip_code, {})
+                counts[zone_of_address[address]] = counts.get(zone_of_address[address], 0) + 1
+            zone_of_zip = {zip_code: max(counts, key = lambda number: (counts[number], -number)) for zip_code, counts in votes.items()}
+            zone_of_address = {address: zone_of_zip[zip_code] for address, zip_code in zip_of.items()}
+
+    keys = {}
+    zones = []
+    zone_addresses = [] # Set of address indexes per zone, turned into each Zone's list at the end
+    for group in build_groups(packages, day_constraints(packages, address_corrections)):
+        key = zone_of_address[address_of[group.package_ids[0]]]
+        if key not in keys:
+            keys[key] = len(zones)
+            zones.append(Zone(len(zones) + 1, [], [hub_index]))
+            zone_addresses.append(set())
+        zones[keys[key]].package_ids.extend(group.package_ids)
+        addresses = zone_addresses[keys[key]]
+        for package_id in group.package_ids:
+            addresses.add(address_of[package_id])
+            if package_id in address_corrections:
+                addresses.add(distance_table.index_of(address_corrections[package_id][1]))
+    for zone, addresses in zip(zones, zone_addresses):
+        zone.package_ids.sort()
+        zone.address_indexes.extend(sorted(addresses - {hub_index}))
+    return zones
+
+class ZoneTask:
+    def __init__(self, zone_id, addresses, matrix, package_records, truck_count, driver_count = DRIVER_COUNT, capacity = TRUCK_CAPACITY,
+                 speed_mph = TRUCK_SPEED_MPH, max_moves = TRIP_MOVES, address_corrections = None):
+        '''
+        Everything a worker (a process here, or another machine) needs to simulate one zone, as plain data:
+        addresses: the zone's street addresses, the hub first
+        matrix: the zone's distance submatrix as a flat array of doubles
+        package_records: one tuple of Package() arguments per package
+        truck_count, driver_count, capacity, speed_mph, max_moves: the zone's fleet, see simulator.EventSimulator
+        address_corrections: the corrections for the zone's packages
+        '''
+        self.zone_id = zone_id
+        self.addresses = addresses
+        self.matrix = matrix
+        self.package_records = package_records
+        self.truck_count = truck_count
+        self.driver_count = driver_count
+        self.capacity = capacity
+        self.speed_mph = speed_mph
+        self.max_moves = max_moves
+        self.address_corrections = address_corrections or {}
+
+def zone_tasks(zones, packages, distance_table, trucks_per_zone = 2, drivers_per_zone = DRIVER_COUNT, capacity = TRUCK_CAPACITY,
+               speed_mph = TRUCK_SPEED_MPH, max_moves = TRIP_MOVES, address_corrections = ADDRESS_CORRECTIONS):
+    # One ZoneTask per Zone, with the zone's rows of the distance matrix and its packages
+    # Truck restrictions name a truck within the zone ("truck 2" is each zone's second truck), so every zone needs that many trucks
+    packages_by_id = {package.package_id: package for package in packages}
+    for package_id, package_constraints in day_constraints(packages, address_corrections).items():
+        if package_constraints.truck_id is not None and package_constraints.truck_id > trucks_per_zone:
+            raise ValueError(f"Package {package_id} can only be on truck {package_constraints.truck_id} but zones have {trucks_per_zone} trucks")
+    tasks = []
+    for zone in zones:
+        table = distance_table.subtable(zone.address_indexes)
+        records = [(package.package_id, package.address, package.city, package.state, package.zip_code,
+                    package.delivery_deadline, package.weight_kilo, package.special_notes)
+                   for package in (packages_by_id[package_id] for package_id in zone.package_ids)]
+        zone_packages = set(zone.package_ids)
+        corrections = {package_id: correction for package_id, correction in address_corrections.items() if package_id in zone_packages}
+        tasks.append(ZoneTask(zone.zone_id, table.addresses, table.matrix, records, trucks_per_zone, drivers_per_zone, capacity, speed_mph, max_moves, corrections))
+    return tasks
+
+class ZoneResult:
+    def __init__(self, zone_id, truck_miles, events, departures, late_packages, events_processed):
+        '''
+        Outcome of one zone, with the zone's own truck IDs (1 to truck_count):
+        truck_miles: truck_id -> miles driven
+        events: the zone's timeline events
+        departures: package_id -> (truck_id, departure time)
+        late_packages: package IDs delivered after their deadline (or never delivered)
+        events_processed: events popped by the zone's simulator
+        '''
+        self.zone_id = zone_id
+        self.truck_miles = truck_miles
+        self.events = events
+        self.departures = departures
+        self.late_packages = late_packages
+        self.events_processed = events_processed
+
+def run_zone(task):
+    # Simulate one zone, runs in a worker process (or anywhere a ZoneTask can be sent)
+    distance_table = DistanceTable(task.addresses, matrix = task.matrix)
+    packages = [Package(*record) for record in task.package_records]
+    distance_table.address_index.resolve_packages(packages)
+    simulator = EventSimulator(packages, day_constraints(packages, task.address_corrections), distance_table, task.addresses[0],
+                               truck_count = task.truck_count, driver_count = task.driver_count, capacity = task.capacity,
+                               speed_mph = task.speed_mph, max_moves = task.max_moves, address_corrections = task.address_corrections)
+    timeline = Timeline()
+    result = simulator.run(timeline)
+    late = [package.package_id for package in packages
+            if result.state.delivered_at(package.package_id) is None or result.state.delivered_at(package.package_id) > package.deadline_minutes]
+    return ZoneResult(task.zone_id, result.truck_miles, timeline.events, timeline.departures, sorted(late), result.events_processed)
+
+class RegionResult:
+    def __init__(self, timeline, truck_miles, truck_zones, zone_results):
+        '''
+        The merged day:
+        timeline: one Timeline with every zone's events, truck IDs renumbered across zones
+        truck_miles: truck_id -> miles driven, with the renumbered IDs
+        truck_zones: truck_id -> zone_id
+        zone_results: the ZoneResults the day was merged from
+        '''
+        self.timeline = timeline
+        self.truck_miles = truck_miles
+        self.truck_zones = truck_zones
+        self.zone_results = zone_results
+
+    def total_miles(self):
+        return sum(self.truck_miles.values())
+
+def merge_results(zone_results):
+    # Coordinator side: renumber each zone's trucks after the previous zones' and merge everything into one Timeline
+    timeline = Timeline()
+    truck_miles = {}
+    truck_zones = {}
+    offset = 0
+    for result in sorted(zone_results, key = lambda result: result.zone_id):
+        for truck_id, miles in result.truck_miles.items():
+            truck_miles[offset + truck_id] = miles
+            truck_zones[offset + truck_id] = result.zone_id
+        for event in result.events:
+            truck_id = offset + event.truck_id if event.truck_id is not None else None
+            timeline.record(Event(event.time, event.kind, truck_id, event.package_id, event.miles, event.address, event.previous_address))
+        for package_id, (truck_id, departure_time) in result.departures.items():
+            timeline.assign(package_id, offset + truck_id, departure_time)
+        offset += max(result.truck_miles, default = 0)
+    timeline.finalize()
+    return RegionResult(timeline, truck_miles, truck_zones, zone_results)
+
+def run_zones(tasks, max_workers = None):
+    '''
+    Simulate every zone and merge them into a RegionResult.
+    max_workers: worker processes (None = one per CPU). With one zone or max_workers=1 everything runs in this process.
+    '''
+    tasks = list(tasks)
+    if len(tasks) <= 1 or max_workers == 1:
+        return merge_results([run_zone(task) for task in tasks])
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        return merge_results(list(executor.map(run_zone, tasks)))
+
+def write_summary(zones, region, output_format, out_file):
+    # Per-zone table (or JSON lines) plus the merged totals
+    rows = []
+    for zone, result in zip(zones, sorted(region.zone_results, key = lambda result: result.zone_id)):
+        trucks = [truck_id for truck_id, zone_id in region.truck_zones.items() if zone_id == zone.zone_id]
+        finish = max((region.timeline.truck_times[truck_id][-1] for truck_id in trucks if truck_id in region.timeline.truck_times), default = None)
+        rows.append({
+            "zone": zone.zone_id,
+            "addresses": len(zone.address_indexes) - 1,
+            "packages": len(zone.package_ids),
+            "trucks": " ".join(str(truck_id) for truck_id in trucks),
+            "miles": round(sum(region.truck_miles[truck_id] for truck_id in trucks), 1),
+            "late": len(result.late_packages),
+            "finish": finish.strftime("%H:%M") if finish else "",
+        })
+    total = {"zone": "total", "addresses": sum(row["addresses"] for row in rows), "packages": sum(row["packages"] for row in rows),
+             "trucks": str(len(region.truck_miles)), "miles": round(region.total_miles(), 1), "late": sum(row["late"] for row in rows),
+             "finish": max((row["finish"] for row in rows), default = "")}
+    if output_format == "json":
+        for row in rows + [total]:
+            out_file.write(json.dumps(row) + "\n")
+        return
+    columns = ["zone", "addresses", "packages", "trucks", "miles", "late", "finish"]
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows + [total])) for column in columns}
+    for row in [dict(zip(columns, columns))] + rows + [total]:
+        out_file.write("  ".join(str(row[column]).ljust(widths[column]) for column in columns).rstrip() + "\n")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Split the delivery day into zones, simulate each zone in its own process and merge the results")
+    parser.add_argument("--by", choices = ZONE_METHODS, default = "medoids", help = "how zones are formed")
+    parser.add_argument("--zones", type = int, default = 3, help = "number of clusters for --by medoids/both")
+    parser.add_argument("--trucks-per-zone", type = int, default = 2)
+    parser.add_argument("--drivers-per-zone", type = int, default = DRIVER_COUNT)
+    parser.add_argument("--capacity", type = int, default = TRUCK_CAPACITY)
+    parser.add_argument("--route-moves", type = int, default = TRIP_MOVES, help = "improving local search moves per trip route")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default one per CPU)")
+    parser.add_argument("--format", choices = ["table", "json"], default = "table")
+    parser.add_argument("--closure", action = "store_true", help = "use shortest-path distances (computed once and cached, slow for large tables)")
+    parser.add_argument("--package-file", default = "wgups_package_file.csv")
+    parser.add_argument("--address-file", default = "wgups_address_file.csv")
+    parser.add_argument("--distance-file", default = "wgups_distance_table.csv")
+    args = parser.parse_args(argv)
+    for name in ("trucks_per_zone", "drivers_per_zone", "capacity"):
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} must be at least 1")
+
+    packages, distance_table = snapshot.load_day(args.package_file, args.address_file, args.distance_file, closure = args.closure)
+    try:
+        zones = partition(packages, distance_table, args.zones, args.by)
+        tasks = zone_tasks(zones, packages, distance_table, args.trucks_per_zone, args.drivers_per_zone, args.capacity, max_moves = args.route_moves)
+        region = run_zones(tasks, args.workers)
+    except ValueError as error:
+        # The options can't carry this day (a truck restriction past --trucks-per-zone, a group bigger than --capacity, ...)
+        parser.error(str(error))
+    write_summary(zones, region, args.format, sys.stdout)
+
+if __name__ == "__main__":
+    main()